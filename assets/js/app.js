@@ -113,6 +113,7 @@ let currentViewBounds = null;
   let activeLinkedTripId = null;
   let selectedTripId = null;
   const linkedTripLayers = new Map();   // linked_trip_id → LayerGroup
+  let currentSample = null;             // { detailUrl, detail: Promise | null }
 
   function buildTripSummary(lt) {
     const totalDistance = (lt.legs || [])
@@ -158,7 +159,7 @@ let currentViewBounds = null;
     // 返回排序后的数组 ["03","07","12"]
     return Array.from(daySet).sort((a, b) => Number(a) - Number(b));
   }
-  function populateDaySelector(days) {
+  function populateDaySelector(days, counts = null) {
     const daySelect = document.getElementById("daySelector");
     if (!daySelect) return;
   
@@ -177,7 +178,7 @@ let currentViewBounds = null;
     days.forEach(d => {
       const opt = document.createElement("option");
       opt.value = String(Number(d)); // "03" → "3"
-      opt.textContent = String(Number(d));
+      opt.textContent = counts ? `${Number(d)} (${counts[d]})` : String(Number(d));
       daySelect.appendChild(opt);
     });
   
@@ -271,6 +272,10 @@ let currentViewBounds = null;
           opacity: 0.85
         }).addTo(group).bringToFront();
 
+        // overview line, swapped for the detail route on highlight
+        group._legLines = group._legLines || [];
+        group._legLines.push({ line, legIndex: leg.leg_index });
+
         line.on("click", (e) => {
           L.DomEvent.stopPropagation(e);
           highlightLinkedTrip(lt.linked_trip_id);
@@ -383,6 +388,30 @@ let currentViewBounds = null;
       group._originMarker.openPopup();
     }
 
+    showTripDetail(targetId);
+  }
+
+  async function showTripDetail(linkedTripId) {
+    const group = linkedTripLayers.get(linkedTripId);
+    const sample = currentSample;
+    if (!group || group._detailShown || !sample || !sample.detailUrl) return;
+
+    try {
+      if (!sample.detail) sample.detail = loadSampleDetail(sample.detailUrl);
+      const detail = await sample.detail;
+      const routes = detail && detail.routes(linkedTripId);
+
+      // OD / day changed while loading → layers are gone
+      if (!routes || linkedTripLayers.get(linkedTripId) !== group) return;
+
+      (group._legLines || []).forEach(({ line, legIndex }) => {
+        const route = routes[legIndex];
+        if (route && route.length >= 2) line.setLatLngs(route);
+      });
+      group._detailShown = true;
+    } catch (e) {
+      console.warn(e);
+    }
   }
   map.on("click", () => {
     activeLinkedTripId = null;
@@ -404,6 +433,9 @@ let currentViewBounds = null;
   });
 
 
+  // one canvas for every OD flow (SVG paths do not scale to tiled views)
+  const odRenderer = L.canvas({ padding: 0.2 });
+
   function drawODFlows(odData, options = {}) {
     const {
       month = null,
@@ -412,9 +444,10 @@ let currentViewBounds = null;
 
     layers.odFlow.clearLayers();
 
-    const maxCount = Math.max(
-      1,
-      ...odData.map(d => useLinked ? d.linked_count : d.unlinked_count)
+    // reduce, not spread: tiled views hold tens of thousands of flows
+    const maxCount = odData.reduce(
+      (m, d) => Math.max(m, (useLinked ? d.linked_count : d.unlinked_count) || 0),
+      1
     );
 
     odData.forEach(d => {
@@ -445,6 +478,7 @@ let currentViewBounds = null;
         const radius = 6 + 10 * (count / maxCount);
 
         L.circleMarker([oLat, oLon], {
+          renderer: odRenderer,
           radius,
           color: "#9333ea",          // 紫色：区别跨-tract OD
           weight: 2,
@@ -481,6 +515,7 @@ let currentViewBounds = null;
           [dLat, dLon]
         ],
         {
+          renderer: odRenderer,
           color: "rgba(59,130,246,0.7)",
           weight: weight,
           opacity: 0.8,
@@ -540,6 +575,142 @@ let currentViewBounds = null;
   /* =========================
      Load facilities
   ========================= */
+  // precompiled network (data/UTA/uta_network.py): shared arcs, overview
+  // + detail level, bbox per route / stop cell; layers built when shown
+  const NETWORK_URL = "data/UTA/uta_network.json";
+  const facilityRenderer = L.canvas({ padding: 0.2 });
+  let networkPromise = null;
+  let network = null;
+
+  function loadNetwork() {
+    if (!networkPromise) {
+      networkPromise = fetchCompactJson(NETWORK_URL)
+        .then(async doc => {
+          if (doc) return (network = decodeNetwork(doc));
+          // not compiled → raw GeoJSON
+          await Promise.all([loadStops(), loadRoutes()]);
+          return null;
+        })
+        .catch(e => {
+          console.error("loadNetwork failed", e);
+          return null;
+        });
+    }
+    return networkPromise;
+  }
+
+  function bboxBounds(b) {
+    return b ? L.latLngBounds([b[0], b[1]], [b[2], b[3]]) : null;
+  }
+
+  function decodeNetwork(doc) {
+    const enc = doc.encoding;
+    const dict = doc.dict;
+    const routes = doc.routes;
+    const stops = doc.stops;
+
+    let arcs = doc.arcs;
+    let decoded = new Array(arcs.length);
+    const arc = a => decoded[a] || (decoded[a] = decodePolyline(arcs[a], enc.precision));
+    const routeLatLngs = r => routes.arc
+      .slice(routes.arc_offsets[r], routes.arc_offsets[r + 1])
+      .map(arc);
+
+    const items = { bus_stop: [], rail_stop: [], bus_route: [], rail_route: [] };
+
+    routes.name.forEach((name, r) => {
+      const type = dict.routetype[routes.routetype[r]];
+      const mode = normalizeRouteMode(type);
+      if (!mode) return;
+
+      const item = {
+        bounds: bboxBounds(routes.bbox[r]),
+        build(group) {
+          item.layer = L.polyline(routeLatLngs(r), {
+            renderer: facilityRenderer,
+            color: mode === "bus" ? "#2563eb" : "#7c3aed",
+            weight: 2,
+            opacity: 0.6
+          }).bindPopup(`${name}<br><small>${type}</small>`);
+          item.layer.addTo(group);
+        },
+        refresh() {
+          if (item.layer) item.layer.setLatLngs(routeLatLngs(r));
+        }
+      };
+      items[`${mode}_route`].push(item);
+    });
+
+    // one item per stop cell and mode; the cell polyline decoded once
+    stops.cell_points.forEach((points, c) => {
+      let latlngs = null;
+      const bounds = bboxBounds(stops.cell_bbox[c]);
+
+      ["bus", "rail"].forEach(kind => {
+        items[`${kind}_stop`].push({
+          bounds,
+          build(group) {
+            latlngs = latlngs || decodePolyline(points, enc.precision);
+            const first = stops.cell_offsets[c];
+            for (let i = first; i < stops.cell_offsets[c + 1]; i++) {
+              const mode = dict.stop_mode[stops.mode[i]];
+              if (normalizeStopMode(mode) !== kind) continue;
+
+              L.circleMarker(latlngs[i - first], {
+                renderer: facilityRenderer,
+                radius: 4,
+                color: kind === "bus" ? "#2563eb" : "#7c3aed",
+                weight: 1,
+                fillOpacity: 0.9
+              })
+                .bindPopup(`${dict.stop_name[stops.name[i]]}<br><small>${mode}</small>`)
+                .addTo(group);
+            }
+          }
+        });
+      });
+    });
+
+    let detail = null;
+    return {
+      items,
+      // detail-level arcs once zoomed in far enough (fetched once)
+      async useDetail() {
+        if (detail || map.getZoom() < enc.detail.min_zoom) return;
+        detail = fetchCompactJson(NETWORK_URL.replace(/[^/]*$/, enc.detail.url));
+        const doc = await detail;
+        if (!doc) return;
+        arcs = doc.arcs;
+        decoded = new Array(arcs.length);
+        items.bus_route.concat(items.rail_route).forEach(item => item.refresh());
+      }
+    };
+  }
+
+  // build the not-yet-built items of every visible facility layer near the view
+  function syncFacilities() {
+    if (!network) return;
+    const view = map.getBounds().pad(0.25);
+    let routesShown = false;
+
+    Object.entries(network.items).forEach(([key, items]) => {
+      const group = facilityLayers[key];
+      if (!map.hasLayer(group)) return;
+      if (key.endsWith("_route")) routesShown = true;
+
+      items.forEach(item => {
+        if (item.built || (item.bounds && !view.intersects(item.bounds))) return;
+        item.built = true;
+        item.build(group);
+      });
+    });
+
+    if (routesShown) network.useDetail();
+  }
+
+  map.on("moveend", syncFacilities);
+
+  // raw GeoJSON (fallback when uta_network.json is not built)
   async function loadStops() {
     const res = await fetch("data/UTA/UTA_Stops.geojson");
     const data = await res.json();
@@ -560,7 +731,7 @@ let currentViewBounds = null;
         });
 
         layer.bindPopup(
-          `${f.properties.stop_name}<br><small>${f.properties.mode}</small>`
+          `${f.properties.stopname}<br><small>${f.properties.mode}</small>`
         );
 
         if (mode === "bus") layer.addTo(facilityLayers.bus_stop);
@@ -580,7 +751,7 @@ let currentViewBounds = null;
 
     L.geoJSON(data, {
       style: f => ({
-        color: f.properties.mode === "bus" ? "#2563eb" : "#7c3aed",
+        color: normalizeRouteMode(f.properties.routetype) === "bus" ? "#2563eb" : "#7c3aed",
         weight: 2,
         opacity: 0.6
       }),
@@ -589,7 +760,7 @@ let currentViewBounds = null;
         if (!mode) return;
 
         layer.bindPopup(
-          `${f.properties.route_name}<br><small>${f.properties.routetype}</small>`
+          `${f.properties.linename}<br><small>${f.properties.routetype}</small>`
         );
 
         if (mode === "bus") layer.addTo(facilityLayers.bus_route);
@@ -602,14 +773,295 @@ let currentViewBounds = null;
      Load sample JSON
   ========================= */
   async function loadSamplesByOD(originTract, destinationTract) {
-    const filename = `${originTract}_to_${destinationTract}.json`;
-    const url = `data/samples/${filename}`;
+    // packed archive first: one Range request per block
+    const pack = await loadSamplePack();
+    const entry = pack?.ods[`${originTract}_to_${destinationTract}`];
+    if (entry) {
+      const doc = await fetchCompactJson(packBlockUrl(pack, entry, "sample"));
+      if (doc) {
+        if (doc.schema !== SAMPLE_V3_SCHEMA) return doc;    // v2 block
+        return { ...decodeSampleV3(doc), detail_url: packBlockUrl(pack, entry, "detail") };
+      }
+    }
+
+    const base = `data/samples/${originTract}_to_${destinationTract}`;
+
+    // compact v3 first (overview routes + detail file), legacy v2 otherwise
+    const v3 = await fetchCompactJson(`${base}.v3.json`);
+    if (v3) return { ...decodeSampleV3(v3), detail_url: `${base}.v3.detail.json` };
 
+    const url = `${base}.json`;
     const res = await fetch(url);
     if (!res.ok) throw new Error(`Sample file not found: ${url}`);
 
     return await res.json();
   }
+
+  /* =========================
+     Day index (trips per service day + one block per day)
+  ========================= */
+  // { days: [{ day: "2020-01-12", count, hours, sample, detail }] }, null if not built
+  async function loadDaysForOD(originTract, destinationTract) {
+    const key = `${originTract}_to_${destinationTract}`;
+    const pack = await loadSamplePack();
+    const entry = pack?.ods[key];
+
+    let doc;
+    let dayUrl;
+    if (entry) {
+      doc = await fetchCompactJson(packBlockUrl(pack, entry, "days"));
+      dayUrl = ref => (ref ? packRangeUrl(pack, ref[0], ref[1]) : null);
+    } else {
+      doc = await fetchCompactJson(`data/samples/${key}.days.json`);
+      dayUrl = name => (name ? `data/samples/${name}` : null);
+    }
+    if (!doc) return null;
+
+    doc.days.forEach(day => {
+      day.sample = dayUrl(day.sample);
+      day.detail = dayUrl(day.detail);
+    });
+    return doc;
+  }
+
+  // tract polygons are stored once per OD in the day index; day blocks
+  // (and the OD's v3 sample next to a day index) carry none
+  function withODGeometry(sample, dayIndex) {
+    if (!dayIndex?.od || sample?.od?.origin?.geometry) return sample;
+    return { ...sample, od: dayIndex.od };
+  }
+
+  // one day's trips only; null → caller loads the whole OD and filters
+  async function loadSamplesForDay(dayIndex, dayValue) {
+    const dayStr = dayValue.padStart(2, "0");
+    const matches = dayIndex.days.filter(x => getTripDayFromStartTime(x.day) === dayStr);
+    // several months share this day of month → no single block
+    if (matches.length !== 1 || !matches[0].sample) return null;
+
+    const doc = await fetchCompactJson(matches[0].sample);
+    if (!doc) return null;
+    return withODGeometry({ ...decodeSampleV3(doc), detail_url: matches[0].detail }, dayIndex);
+  }
+
+  /* =========================
+     Packed sample archive (samples.pack + byte-range index)
+  ========================= */
+  const SAMPLE_PACK_INDEX = "data/samples/samples.pack.index.json";
+  let samplePack;                  // undefined = not fetched, null = no archive
+
+  async function loadSamplePack() {
+    if (samplePack !== undefined) return samplePack;
+    try {
+      const res = await fetch(SAMPLE_PACK_INDEX);
+      samplePack = res.ok && typeof DecompressionStream !== "undefined" ? await res.json() : null;
+    } catch (e) {
+      samplePack = null;
+    }
+    if (samplePack) {
+      const base = SAMPLE_PACK_INDEX.slice(0, SAMPLE_PACK_INDEX.lastIndexOf("/") + 1);
+      samplePack.url = base + samplePack.archive;
+      samplePack.col = Object.fromEntries(samplePack.fields.map((f, i) => [f, i]));
+    }
+    return samplePack;
+  }
+
+  // "<archive>#bytes=<first>-<last>" (null when the OD has no such block)
+  function packBlockUrl(pack, entry, kind) {
+    return packRangeUrl(pack, entry[pack.col[`${kind}_offset`]], entry[pack.col[`${kind}_length`]]);
+  }
+
+  function packRangeUrl(pack, offset, length) {
+    return length > 0 ? `${pack.url}#bytes=${offset}-${offset + length - 1}` : null;
+  }
+
+  async function fetchPackBlock(url) {
+    const [file, range] = url.split("#bytes=");
+    const [first, last] = range.split("-").map(Number);
+
+    const res = await fetch(file, { headers: { Range: `bytes=${first}-${last}` } });
+    if (!res.ok) return null;
+
+    let buf = await res.arrayBuffer();
+    // server without Range support → whole archive came back (200)
+    if (res.status !== 206) buf = buf.slice(first, last + 1);
+
+    const stream = new Blob([buf]).stream().pipeThrough(new DecompressionStream("gzip"));
+    return await new Response(stream).json();
+  }
+
+  async function fetchCompactJson(url) {
+    if (!url) return null;
+    if (url.includes("#bytes=")) return await fetchPackBlock(url);
+
+    // static hosting: fetch the pre-compressed sibling and inflate it here
+    if (typeof DecompressionStream !== "undefined") {
+      try {
+        const res = await fetch(`${url}.gz`);
+        if (res.ok) {
+          const stream = res.body.pipeThrough(new DecompressionStream("gzip"));
+          return await new Response(stream).json();
+        }
+      } catch (e) {
+        // already inflated by the server / not gzip → plain file below
+      }
+    }
+
+    // servers with gzip_static / brotli_static pick .gz / .br themselves
+    const res = await fetch(url);
+    return res.ok ? await res.json() : null;
+  }
+
+  // detail-level routes, decoded one linked trip at a time
+  async function loadSampleDetail(url) {
+    const doc = await fetchCompactJson(url);
+    if (!doc) return null;
+
+    const index = new Map(doc.linked_trip_id.map((lid, t) => [lid, t]));
+    return {
+      routes(linkedTripId) {
+        const t = index.get(linkedTripId);
+        if (t === undefined) return null;
+        const out = [];
+        for (let i = doc.leg_offsets[t]; i < doc.leg_offsets[t + 1]; i++) {
+          out.push(decodePolyline(doc.route[i], doc.encoding.precision));
+        }
+        return out;
+      }
+    };
+  }
+
+  /* =========================
+     Sample v3 decoder (→ v2 shape)
+  ========================= */
+  const GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz";
+  const SAMPLE_V3_SCHEMA = "nova.complete_trip.sample.v3";
+
+  function decodePolyline(str, precision = 5) {
+    const scale = Math.pow(10, precision);
+    const out = [];
+    let lat = 0;
+    let lon = 0;
+    let i = 0;
+
+    while (i < str.length) {
+      const vals = [0, 0];
+      for (let j = 0; j < 2; j++) {
+        let shift = 0;
+        let result = 0;
+        let b;
+        do {
+          b = str.charCodeAt(i++) - 63;
+          result |= (b & 0x1f) << shift;
+          shift += 5;
+        } while (b >= 0x20);
+        vals[j] = (result & 1) ? ~(result >> 1) : (result >> 1);
+      }
+      lat += vals[0];
+      lon += vals[1];
+      out.push([lat / scale, lon / scale]);
+    }
+    return out;
+  }
+
+  // geohash cell centre (same values the builder writes into v2)
+  function decodeGeohash(gh) {
+    if (typeof gh !== "string" || !gh) return { lat: null, lon: null };
+
+    let latMin = -90, latMax = 90, lonMin = -180, lonMax = 180;
+    let even = true;
+    for (const c of gh.toLowerCase()) {
+      const v = GEOHASH_BASE32.indexOf(c);
+      if (v < 0) return { lat: null, lon: null };
+      for (let bit = 4; bit >= 0; bit--) {
+        const on = (v >> bit) & 1;
+        if (even) {
+          const mid = (lonMin + lonMax) / 2;
+          if (on) lonMin = mid; else lonMax = mid;
+        } else {
+          const mid = (latMin + latMax) / 2;
+          if (on) latMin = mid; else latMax = mid;
+        }
+        even = !even;
+      }
+    }
+    return { lat: (latMin + latMax) / 2, lon: (lonMin + lonMax) / 2 };
+  }
+
+  function decodeSampleV3(doc) {
+    const enc = doc.encoding;
+    const dict = doc.dict;
+    const trips = doc.linked_trips;
+    const cols = doc.legs;
+    const baseMs = Date.parse(`${enc.time_base}Z`);
+
+    const pick = (table, i) => (i === null || i === undefined ? null : table[i]);
+    const iso = (s) => {
+      if (s === null || s === undefined) return null;
+      const t = new Date(baseMs + s * 1000).toISOString();   // "…T07:20:43.000Z"
+      return t.endsWith(".000Z") ? t.slice(0, 19) : t.slice(0, 23);
+    };
+    const point = (gh) => ({ ...decodeGeohash(gh), geohash: gh });
+
+    const linkedTrips = trips.linked_trip_id.map((lid, t) => {
+      const a = trips.leg_offsets[t];
+      const b = trips.leg_offsets[t + 1];
+      const legs = [];
+
+      for (let i = a; i < b; i++) {
+        legs.push({
+          id: cols.id[i],
+          mode: pick(dict.mode, cols.mode[i]),
+          route: decodePolyline(cols.route[i], enc.precision),
+          start_time: iso(cols.start[i]),
+          end_time: iso(cols.end[i]),
+          duration_min: cols.duration_min[i],
+          network_distance_km: cols.network_distance_km[i],
+          route_distance_km: cols.route_distance_km[i],
+          origin: point(cols.o_geohash[i]),
+          destination: point(cols.d_geohash[i]),
+          access: {
+            stop_id: cols.access_stop_id[i],
+            stop_name: pick(dict.stop_name, cols.access_stop[i])
+          },
+          egress: {
+            stop_id: cols.egress_stop_id[i],
+            stop_name: pick(dict.stop_name, cols.egress_stop[i])
+          },
+          meta: {
+            linked_trip_id: lid,
+            tour_id: pick(dict.tour_id, cols.tour_id[i]),
+            purpose: pick(dict.purpose, cols.purpose[i]),
+            weight: cols.weight[i]
+          },
+          leg_index: i - a
+        });
+      }
+
+      const first = legs[0];
+      const last = legs[legs.length - 1];
+      return {
+        linked_trip_id: lid,
+        origin: { ...first.origin, start_time: first.start_time },
+        destination: { ...last.destination, end_time: last.end_time },
+        transfers: legs.slice(0, -1)
+          .filter(l => l.destination.lat !== null && l.destination.lon !== null)
+          .map(l => ({
+            lat: l.destination.lat,
+            lon: l.destination.lon,
+            geohash: l.destination.geohash
+          })),
+        legs,
+        weight: trips.weight[t]
+      };
+    });
+
+    return {
+      schema: doc.schema,
+      od: doc.od,
+      count: doc.count,
+      linked_trips: linkedTrips
+    };
+  }
   async function applyODSelection() {
     const o = document.getElementById("originTract").value;
     const d = document.getElementById("destinationTract").value;
@@ -639,23 +1091,44 @@ let currentViewBounds = null;
       return;
     }
     try {
-      const sampleJson = await loadSamplesByOD(o, d);
+      // ===== Day selector from the day index (no trips needed) =====
+      const dayIndex = await loadDaysForOD(o, d);
+      if (dayIndex) {
+        const counts = {};
+        dayIndex.days.forEach(x => {
+          const day = getTripDayFromStartTime(x.day);
+          counts[day] = (counts[day] || 0) + x.count;
+        });
+        populateDaySelector(Object.keys(counts).sort((a, b) => Number(a) - Number(b)), counts);
+      }
+      let dayValue = document.getElementById("daySelector")?.value || "all";
+
+      // selected day → only that day's block; All → whole OD
+      const dayJson = dayIndex && dayValue !== "all" ? await loadSamplesForDay(dayIndex, dayValue) : null;
+      const sampleJson = dayJson || withODGeometry(await loadSamplesByOD(o, d), dayIndex);
       const stats = await loadStatsForOD(o, d);
-      // ===== Populate Day selector based on data =====
-      const availableDays = extractAvailableDays(sampleJson.linked_trips);
-      populateDaySelector(availableDays);
-      // ✅ 关键：populate 后再读 daySelector，保证筛选值和 UI 同步
-      const dayValue = document.getElementById("daySelector")?.value || "all";
+
+      if (!dayIndex) {
+        // ===== Populate Day selector based on data =====
+        const availableDays = extractAvailableDays(sampleJson.linked_trips);
+        populateDaySelector(availableDays);
+        // ✅ 关键：populate 后再读 daySelector，保证筛选值和 UI 同步
+        dayValue = document.getElementById("daySelector")?.value || "all";
+      }
 
       layers.odPolygon.clearLayers();
       layers.tripRoute.clearLayers();
 
       drawODPolygon(sampleJson.od);
+
+      if (!currentSample || currentSample.detailUrl !== sampleJson.detail_url) {
+        currentSample = { detailUrl: sampleJson.detail_url || null, detail: null };
+      }
       
       let filteredTrips = sampleJson.linked_trips;
 
-      // ===== Day filter (Jan only) =====
-      if (dayValue !== "all") {
+      // ===== Day filter (Jan only) — day blocks are already one day =====
+      if (dayValue !== "all" && !dayJson) {
         const dayStr = dayValue.padStart(2, "0"); // "1" → "01"
       
         filteredTrips = filteredTrips.filter(lt => {
@@ -695,6 +1168,13 @@ let currentViewBounds = null;
   }
     
   async function loadStatsForOD(origin, destination) {
+    const pack = await loadSamplePack();
+    const entry = pack?.ods[`${origin}_to_${destination}`];
+    if (entry) {
+      const stats = await fetchCompactJson(packBlockUrl(pack, entry, "stats"));
+      if (stats) return stats;
+    }
+
     const filename = `${origin}_to_${destination}.stats.json`;
     const url = `data/samples/${filename}`;
 
@@ -938,10 +1418,129 @@ let currentViewBounds = null;
       "#222";
   }
 
-  async function loadODFlows() {
-    const res = await fetch("data/OD/od_dashboard_topk.json");
-    if (!res.ok) throw new Error("Failed to load OD JSON");
-    return await res.json();
+  /* =========================
+     OD flows: Top-K tiers (month × mode × linked/unlinked × K)
+  ========================= */
+  const OD_DIR = "data/OD";
+  const odView = { month: null, kind: "linked", mode: "all", k: 20 };
+  const odTierCache = new Map();   // tier file → rows
+  let odTierIndex;                 // undefined = not fetched, null = no tiers
+
+  async function loadODTierIndex() {
+    if (odTierIndex !== undefined) return odTierIndex;
+    try {
+      const res = await fetch(`${OD_DIR}/od_tiers_index.json`);
+      odTierIndex = res.ok ? await res.json() : null;
+    } catch (e) {
+      odTierIndex = null;
+    }
+    return odTierIndex;
+  }
+
+  function pickODTier(index, view) {
+    const month = view.month || index.months[0];
+    const entries = index.tiers?.[month]?.[view.kind]?.[view.mode];
+    if (!entries) return null;
+
+    // smallest tier holding K rows, else the largest one (= every row)
+    const ks = Object.keys(entries).map(Number).sort((a, b) => a - b);
+    const k = ks.find(x => x >= view.k) ?? ks[ks.length - 1];
+    return entries[String(k)];
+  }
+
+  async function loadODFlows(view = odView) {
+    const index = await loadODTierIndex();
+
+    if (!index) {
+      // 旧版：单个 TOP-20 列表
+      if (!odTierCache.has("topk")) {
+        const res = await fetch(`${OD_DIR}/od_dashboard_topk.json`);
+        if (!res.ok) throw new Error("Failed to load OD JSON");
+        odTierCache.set("topk", await res.json());
+      }
+      return odTierCache.get("topk");
+    }
+
+    const tier = pickODTier(index, view);
+    if (!tier) return [];
+
+    if (!odTierCache.has(tier.file)) {
+      const res = await fetch(`${OD_DIR}/${tier.file}`);
+      if (!res.ok) throw new Error(`Failed to load OD tier ${tier.file}`);
+      odTierCache.set(tier.file, await res.json());
+    }
+    return odTierCache.get(tier.file).slice(0, view.k);
+  }
+
+  /* =========================
+     OD flows: tile pyramid (every flow, current viewport only)
+  ========================= */
+  const odTileCache = new Map();   // tile url → flow rows
+  let odTileIndex;                 // undefined = not fetched, null = no tiles
+
+  async function loadODTileIndex() {
+    if (odTileIndex !== undefined) return odTileIndex;
+    try {
+      const res = await fetch(`${OD_DIR}/od_tiles/index.json`);
+      odTileIndex = res.ok ? await res.json() : null;
+    } catch (e) {
+      odTileIndex = null;
+    }
+    return odTileIndex;
+  }
+
+  function lonLatToTile(lon, lat, z) {
+    const n = 2 ** z;
+    const r = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+    return [
+      Math.floor((lon + 180) / 360 * n),
+      Math.floor((1 - Math.asinh(Math.tan(r)) / Math.PI) / 2 * n)
+    ];
+  }
+
+  async function loadODTiles(view = odView) {
+    const index = await loadODTileIndex();
+    if (!index) return null;
+
+    const month = view.month || index.months[0];
+    const z = Math.max(index.min_zoom, Math.min(index.raw_zoom, Math.round(map.getZoom())));
+    const listed = new Set(index.tiles?.[month]?.[z]?.tiles || []);
+
+    const b = map.getBounds();
+    const [x0, y0] = lonLatToTile(b.getWest(), b.getNorth(), z);
+    const [x1, y1] = lonLatToTile(b.getEast(), b.getSouth(), z);
+
+    const urls = [];
+    for (let x = x0; x <= x1; x++) {
+      for (let y = y0; y <= y1; y++) {
+        if (listed.has(`${x}/${y}`)) urls.push(`${OD_DIR}/od_tiles/${month}/${z}/${x}/${y}.json`);
+      }
+    }
+
+    const tiles = await Promise.all(urls.map(async url => {
+      if (!odTileCache.has(url)) {
+        const res = await fetch(url);
+        odTileCache.set(url, res.ok ? (await res.json()).flows : []);
+      }
+      return odTileCache.get(url);
+    }));
+
+    // a flow sits in its origin and its destination tile → dedupe by id
+    // row: [id, o_lat, o_lon, d_lat, d_lon, linked_count, unlinked_count, linked_wf, unlinked_wf]
+    const seen = new Set();
+    const rows = [];
+    tiles.forEach(flows => flows.forEach(f => {
+      if (seen.has(f[0])) return;
+      seen.add(f[0]);
+      rows.push({
+        month,
+        travel_mode: "all",
+        o_lat: f[1], o_lon: f[2], d_lat: f[3], d_lon: f[4],
+        linked_count: f[5], unlinked_count: f[6],
+        linked_weighted_flow: f[7], unlinked_weighted_flow: f[8]
+      });
+    }));
+    return rows;
   }
   /* =========================
      Checkbox → layer toggle
@@ -952,8 +1551,12 @@ let currentViewBounds = null;
       cb.addEventListener("change", e => {
         const layer = facilityLayers[e.target.dataset.layer];
         if (!layer) return;
-        if (e.target.checked) map.addLayer(layer);
-        else map.removeLayer(layer);
+        if (e.target.checked) {
+          map.addLayer(layer);
+          loadNetwork().then(syncFacilities);
+        } else {
+          map.removeLayer(layer);
+        }
       });
     });
     
@@ -965,17 +1568,8 @@ let currentViewBounds = null;
      Init
   ========================= */
   async function init() {
-    try {
-      await loadStops();
-    } catch (e) {
-      console.error("loadStops failed", e);
-    }
-
-    try {
-      await loadRoutes();
-    } catch (e) {
-      console.error("loadRoutes failed", e);
-    }
+    // network layers are off by default: fetch in the background, build when shown
+    loadNetwork();
 
     document.querySelectorAll(".bm-btn").forEach(btn => {
       btn.addEventListener("click", () => {
@@ -1028,7 +1622,22 @@ let currentViewBounds = null;
     // });
 
     let odVisible = false;
-    let cachedOD = null;
+    let odRefreshSeq = 0;
+
+    async function refreshOD() {
+      if (!odVisible) return;
+      const seq = ++odRefreshSeq;
+
+      // K = all → every flow of the viewport from the tile pyramid
+      const tiled = !Number.isFinite(odView.k);
+      const rows = (tiled && await loadODTiles(odView)) || await loadODFlows(odView);
+      if (seq !== odRefreshSeq || !odVisible) return;   // a newer view won
+
+      drawODFlows(rows, {
+        month: odView.month,   // 👈 null = 不过滤
+        useLinked: odView.kind === "linked"
+      });
+    }
 
     async function toggleOD() {
       odVisible = !odVisible;
@@ -1037,19 +1646,38 @@ let currentViewBounds = null;
         layers.odFlow.clearLayers();
         return;
       }
+      await refreshOD();
+    }
 
-      if (!cachedOD) {
-        cachedOD = await loadODFlows();   // 你之前已经写好的
-      }
-
-      drawODFlows(cachedOD, {
-        month: null,   // 👈 不过滤
-        useLinked: true
+    // optional OD view controls (month / mode / linked-unlinked / K)
+    [
+      ["odMonth", v => { odView.month = v || null; }],
+      ["odMode", v => { odView.mode = v || "all"; }],
+      ["odKind", v => { odView.kind = v || "linked"; }],
+      ["odTopK", v => { odView.k = v === "all" ? Infinity : Number(v) || 20; }]
+    ].forEach(([id, set]) => {
+      document.getElementById(id)?.addEventListener("change", e => {
+        set(e.target.value);
+        refreshOD();
       });
-    }
-    document
-      // .querySelector('[data-view="od"]')
-      // .addEventListener("click", toggleOD);
+    });
+
+    map.on("moveend", () => {
+      if (!Number.isFinite(odView.k)) refreshOD();
+    });
+    document.getElementById("odToggle")?.addEventListener("change", toggleOD);
+
+    // months / modes that have tiers (static options without a tier index)
+    loadODTierIndex().then(index => {
+      if (!index) return;
+      const fill = (id, values, label) => {
+        const sel = document.getElementById(id);
+        if (!sel || !values?.length) return;
+        sel.innerHTML = values.map(v => `<option value="${v}">${label(v)}</option>`).join("");
+      };
+      fill("odMonth", index.months, v => v);
+      fill("odMode", index.modes, v => (v === "all" ? "All modes" : v));
+    });
 
   }
 
@@ -0,0 +1,533 @@
+# ============================================================
+# Monthly tract-level OD aggregation (linked + unlinked)
+# - Only the needed Parquet columns are read, one month at a time
+# - Tracts / travel_mode / month as integer codes
+# - Linked and unlinked counts + weighted flows in ONE sort-and-reduce
+#   per month (no groupby chains, no outer merge)
+# - Writes Parquet + the dashboard TOP-K JSON + TOP-K tiers per
+#   month × travel_mode × linked/unlinked (partial sort, no full sort)
+# - Every flow also tiled into a zoom pyramid (od_tiles.py)
+#
+# usage:
+#   python data/OD/od_aggregate.py --delivery-root <.../Salt_Lake/delivery>
+#       --tracts <CensusTracts2020_6_counties.geojson> [--months Jan-2020 ...]
+#   python data/OD/od_aggregate.py --from-dashboard data/OD/od_dashboard_topk.json
+#       (tiers / tiles of the committed TOP-K rows only, no deliveries needed)
+# ============================================================
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "samples"))
+
+import geohash7
+from run_report import PROFILERS, RunReport
+from tract_index import NO_TRACT, TractIndex
+from trip_schema import format_memory, lean_trips, memory_report, release_arrow_memory
+
+from od_tiles import MIN_ZOOM, RAW_ZOOM, TILE_DIR, write_pyramid
+
+# =========================
+# DEFAULTS (same as OD_calculator.ipynb)
+# =========================
+DELIVERY_ROOT = r"C:\Users\rli04\Villanova University\Complete-trip-coordinate - Documents\General\Salt_Lake\delivery"
+CENSUS_FILE = r"C:\Github\Complete-Trip-Data-Explorer\data\census_track\CensusTracts2020_6_counties.geojson"
+TRACT_COL = "GEOID20"
+CACHE_DIR = os.path.join(HERE, "..", "cache")
+
+OUT_OD_PARQUET = "od_monthly_linked_unlinked.parquet"
+OUT_OD_JSON = "od_monthly_linked_unlinked.json"
+OUT_TRACT_CENTROID_JSON = "tract_centroids.json"
+OUT_DASHBOARD_JSON = "od_dashboard_topk.json"
+
+TOP_K = 20   # 推荐 20；10 会太稀疏
+
+USE_COLS = [
+    "linked_trip_id", "trip_id", "travel_mode",
+    "local_datetime_start", "geohash7_orig", "geohash7_dest", "trip_weight"
+]
+
+KEYS = ["month", "origin_tract", "destination_tract", "travel_mode"]
+MEASURES = ["unlinked_count", "unlinked_weighted_flow", "linked_count", "linked_weighted_flow"]
+
+DASHBOARD_COLS = [
+    "month",
+    "origin_tract",
+    "destination_tract",
+    "o_lat", "o_lon",
+    "d_lat", "d_lon",
+    "travel_mode",
+    "linked_count",
+    "unlinked_count",
+    "linked_weighted_flow",
+    "unlinked_weighted_flow",
+    "total_flow"
+]
+
+# =========================
+# INPUT
+# =========================
+def month_folders(delivery_root, months=None):
+    """Salt_Lake-{month} delivery folders (all of them when `months` is None)"""
+    folders = sorted(
+        f for f in os.listdir(delivery_root)
+        if f.startswith("Salt_Lake-") and os.path.isdir(os.path.join(delivery_root, f))
+    )
+    if months:
+        wanted = {f"Salt_Lake-{m}" for m in months}
+        folders = [f for f in folders if f in wanted]
+    return [os.path.join(delivery_root, f) for f in folders]
+
+
+def read_month(month_dir, columns=USE_COLS, memory=None):
+    """Projected read of one month folder, lean dtypes (None without Parquet files)"""
+    files = sorted(glob.glob(os.path.join(month_dir, "*.parquet")))
+    if not files:
+        return None
+    df = lean_trips(ds.dataset(files, format="parquet").to_table(columns=columns), memory)
+    release_arrow_memory()
+    return df
+
+# =========================
+# CODES
+# =========================
+def month_codes(start):
+    """local_datetime_start → year * 12 + month - 1 (-1 for NaT)"""
+    t = pd.to_datetime(start, errors="coerce", format="ISO8601")
+    t = pd.DatetimeIndex(t)
+    codes = (t.year * 12 + t.month - 1).to_numpy(dtype=np.float64)
+    return np.where(np.isnan(codes), -1, codes).astype(np.int64), t.asi8
+
+
+def month_name(code):
+    return f"{code // 12}-{code % 12 + 1:02d}"
+
+# =========================
+# SORT-AND-REDUCE
+# =========================
+def aggregate_month(df, tract_index, drops=None):
+    """
+    One month of legs → OD table with linked and unlinked measures.
+
+    Unlinked rows are legs; linked rows are linked trips keyed by their
+    first leg (month, mode, origin, weight) and last leg (destination).
+    Both are packed into one int64 key and reduced together, which is
+    the outer merge of the two aggregates without a merge.
+    `drops` gets the dropped legs / linked trips per reason.
+    """
+    drops = {} if drops is None else drops
+    o = geohash7.as_codes(df["geohash7_orig"].values)
+    d = geohash7.as_codes(df["geohash7_dest"].values)
+    has_gh = (o != geohash7.INVALID) & (d != geohash7.INVALID)
+    drops["missing_geohash"] = int((~has_gh).sum())     # missing or invalid geohash7
+    df, o, d = df[has_gh], o[has_gh], d[has_gh]
+
+    o = tract_index.lookup_codes(o)
+    d = tract_index.lookup_codes(d)
+    month, start_ns = month_codes(df["local_datetime_start"])
+    mode, modes = pd.factorize(df["travel_mode"], sort=True)     # -1 for null modes
+    modes = np.asarray(modes, dtype=object)
+    weight = df["trip_weight"].fillna(1.0).to_numpy(dtype=np.float64)
+    has_trip_id = df["trip_id"].notna().to_numpy()
+
+    # legs outside every tract (or without a start time) are dropped first
+    keep = (o != NO_TRACT) & (d != NO_TRACT) & (month >= 0)
+    drops["no_tract"] = int(((o == NO_TRACT) | (d == NO_TRACT)).sum())
+    drops["no_start_time"] = int(((o != NO_TRACT) & (d != NO_TRACT) & (month < 0)).sum())
+    o, d, month, start_ns, mode = o[keep], d[keep], month[keep], start_ns[keep], mode[keep]
+    weight, has_trip_id = weight[keep], has_trip_id[keep]
+    trip, _ = pd.factorize(df["linked_trip_id"].iloc[keep])
+
+    n_tract = len(tract_index.geoids)
+    n_mode = len(modes)
+    month0 = month.min() if len(month) else 0
+
+    def pack(m, oo, dd, md):
+        return ((m - month0) * n_tract + oo) * n_tract * n_mode + dd * n_mode + md
+
+    # -------- UNLINKED (legs with a mode) --------
+    u = mode >= 0
+    u_key = pack(month[u], o[u], d[u], mode[u])
+
+    # -------- LINKED (first / last leg by start time) --------
+    t = trip >= 0
+    order = np.flatnonzero(t)[np.lexsort((start_ns[t], trip[t]))]
+    tr = trip[order]
+    first = order[np.r_[True, tr[1:] != tr[:-1]]]
+    last = order[np.r_[tr[1:] != tr[:-1], True]]
+
+    # mode = first leg with a mode (groupby "first" skips nulls)
+    with_mode = order[mode[order] >= 0]
+    _, first_mode = np.unique(trip[with_mode], return_index=True)
+    trip_mode = np.full(len(first), -1)
+    trip_mode[trip[with_mode[first_mode]]] = mode[with_mode[first_mode]]
+    trip_mode = trip_mode[trip[first]]
+
+    lk = trip_mode >= 0
+    drops["linked_trip_no_mode"] = int((~lk).sum())
+    first, last, trip_mode = first[lk], last[lk], trip_mode[lk]
+    l_key = pack(month[first], o[first], d[last], trip_mode)
+
+    # -------- ONE REDUCE --------
+    keys, inv = np.unique(np.concatenate([u_key, l_key]), return_inverse=True)
+    nu = len(u_key)
+    n = len(keys)
+    out = pd.DataFrame({
+        "unlinked_count": np.bincount(inv[:nu], weights=has_trip_id[u], minlength=n),
+        "unlinked_weighted_flow": np.bincount(inv[:nu], weights=weight[u], minlength=n),
+        "linked_count": np.bincount(inv[nu:], minlength=n).astype(np.float64),
+        "linked_weighted_flow": np.bincount(inv[nu:], weights=weight[first], minlength=n),
+    })
+
+    md = keys % n_mode
+    rest = keys // n_mode
+    dd = rest % n_tract
+    rest //= n_tract
+    oo = rest % n_tract
+    mm = rest // n_tract + month0
+
+    geoids = np.asarray(tract_index.geoids, dtype=object)
+    out.insert(0, "month", [month_name(m) for m in mm])
+    out.insert(1, "origin_tract", geoids[oo])
+    out.insert(2, "destination_tract", geoids[dd])
+    out.insert(3, "travel_mode", modes[md])
+    for c in ("unlinked_count", "linked_count"):
+        out[c] = out[c].astype(np.int64)
+    return out
+
+
+def aggregate(delivery_root, tract_index, months=None, log=print, report=None):
+    """All month folders → one OD table (categorical tract / mode / month)"""
+    report = report or RunReport("od_aggregate")
+    parts = []
+    memory = {}
+    for month_dir in month_folders(delivery_root, months):
+        t0 = time.perf_counter()
+        with report.stage("load") as st:
+            df = read_month(month_dir, memory=memory)
+            st.rows(rows_out=0 if df is None else len(df))
+        if df is None:
+            continue
+        with report.stage("aggregate", rows_in=len(df)) as st:
+            drops = {}
+            od = aggregate_month(df, tract_index, drops)
+            for reason, n in drops.items():
+                st.drop(reason, n)
+            st.note("rows_out_unit", "od_row")
+            st.rows(rows_out=len(od))
+        parts.append(od)
+        log(
+            f"{os.path.basename(month_dir)}: {len(df):,} legs → {len(od):,} OD rows "
+            f"({time.perf_counter() - t0:.1f}s)"
+        )
+        del df
+
+    if memory:
+        report.meta["load_memory"] = memory_report(memory["before"], memory["after"], memory["rows"])
+        log(format_memory(report.meta["load_memory"]))
+
+    if not parts:
+        return pd.DataFrame(columns=KEYS + MEASURES)
+
+    # months may overlap across folders (trips crossing month ends)
+    with report.stage("merge", rows_in=sum(len(p) for p in parts)) as st:
+        final_df = pd.concat(parts, ignore_index=True)
+        if len(parts) > 1:
+            final_df = final_df.groupby(KEYS, as_index=False, sort=True)[MEASURES].sum()
+
+        for c in KEYS:
+            final_df[c] = final_df[c].astype("category")
+        st.rows(rows_out=len(final_df))
+    return final_df
+
+# =========================
+# TRACT CENTROIDS
+# =========================
+def tract_centroids(tracts, geoid_col=TRACT_COL):
+    """GEOID → {"lat", "lon"} of the tract centroid"""
+    c = tracts.geometry.centroid
+    return {
+        str(g): {"lat": y, "lon": x}
+        for g, x, y in zip(tracts[geoid_col], c.x, c.y)
+    }
+
+# =========================
+# DASHBOARD CANDIDATES
+# =========================
+def dashboard_rows(final_df, centroids):
+    """
+    OD rows the dashboard can draw: string keys, total_flow, centroid
+    coordinates; self-loops and ODs without a valid centroid removed.
+    """
+    df = final_df.copy()
+    for c in KEYS:
+        df[c] = df[c].astype(str)
+
+    df["total_flow"] = df["linked_weighted_flow"] + df["unlinked_weighted_flow"]
+    df = df[df["origin_tract"] != df["destination_tract"]]
+
+    lat = {g: c["lat"] for g, c in centroids.items()}
+    lon = {g: c["lon"] for g, c in centroids.items()}
+    df["o_lat"] = pd.to_numeric(df["origin_tract"].map(lat), errors="coerce")
+    df["o_lon"] = pd.to_numeric(df["origin_tract"].map(lon), errors="coerce")
+    df["d_lat"] = pd.to_numeric(df["destination_tract"].map(lat), errors="coerce")
+    df["d_lon"] = pd.to_numeric(df["destination_tract"].map(lon), errors="coerce")
+
+    # 严格清洗非法坐标（坐标严禁填）
+    coords = df[["o_lat", "o_lon", "d_lat", "d_lon"]].to_numpy(dtype=np.float64)
+    df = df[np.isfinite(coords).all(axis=1)]
+
+    return df[DASHBOARD_COLS].reset_index(drop=True)
+
+# =========================
+# TOP-K SELECTION (partial sort per group)
+# =========================
+def top_k_rows(score, group, k):
+    """
+    Row indices of the `k` largest `score` values of every `group`
+    (groups ascending, score descending, ties in row order).
+
+    Rows are bucketed by their small integer group code, then each
+    bucket only pays for an argpartition plus a sort of its K winners.
+    """
+    score = np.asarray(score, dtype=np.float64)
+    group = np.asarray(group, dtype=np.int64)
+    if not len(score):
+        return np.empty(0, dtype=np.int64)
+
+    order = np.argsort(group, kind="stable")
+    g = group[order]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    ends = np.r_[starts[1:], len(g)]
+
+    out = []
+    for a, b in zip(starts, ends):
+        idx = order[a:b]
+        if b - a > k:
+            idx = np.sort(idx[np.argpartition(-score[idx], k - 1)[:k]])
+        out.append(idx[np.argsort(-score[idx], kind="stable")])
+    return np.concatenate(out)
+
+
+def dashboard_topk(final_df, centroids, top_k=TOP_K):
+    """TOP-K drawable ODs per month by linked + unlinked weighted flow"""
+    df = dashboard_rows(final_df, centroids)
+    month, _ = pd.factorize(df["month"], sort=True)
+    return df.iloc[top_k_rows(df["total_flow"], month, top_k)].reset_index(drop=True)
+
+# =========================
+# TOP-K TIERS (month × travel_mode × linked / unlinked)
+# =========================
+TIER_KS = [20, 100, 500]
+TIER_KINDS = {
+    "linked": "linked_weighted_flow",
+    "unlinked": "unlinked_weighted_flow",
+}
+ALL_MODES = "all"
+TIER_DIR = "od_tiers"
+OUT_TIER_INDEX = "od_tiers_index.json"
+
+
+def mode_slug(mode):
+    return "".join(ch if ch.isalnum() else "-" for ch in str(mode).lower())
+
+
+def od_tiers(rows, ks=TIER_KS):
+    """
+    Top max(ks) ODs of every month × mode × kind, in rank order.
+
+    `rows` are dashboard_rows(); mode "all" ranks every mode's rows
+    together (like the TOP-K dashboard list). Smaller K tiers are
+    prefixes of these. Returns {(month, kind, mode): DataFrame}.
+    """
+    k = max(ks)
+    month, months = pd.factorize(rows["month"], sort=True)
+    mode, modes = pd.factorize(rows["travel_mode"], sort=True)
+    n_mode = len(modes) + 1                          # last slot = "all"
+    names = list(modes) + [ALL_MODES]
+
+    tiers = {}
+    for kind, col in TIER_KINDS.items():
+        score = rows[col].to_numpy(dtype=np.float64)
+        has = np.flatnonzero(score > 0)
+
+        # one selection over per-mode groups and one over the month totals
+        for group in (month[has] * n_mode + mode[has], month[has] * n_mode + n_mode - 1):
+            local = top_k_rows(score[has], group, k)
+            pick, g = has[local], group[local]
+            bounds = np.flatnonzero(np.r_[True, g[1:] != g[:-1], True])
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                key = (months[g[a] // n_mode], kind, names[g[a] % n_mode])
+                tiers[key] = rows.iloc[pick[a:b]]
+    return tiers
+
+
+def write_tiers(out_dir, tiers, ks=TIER_KS, generated_at=None, source=None):
+    """One compact JSON per month × kind × mode × K plus the tier index"""
+    folder = os.path.join(out_dir, TIER_DIR)
+    os.makedirs(folder, exist_ok=True)
+
+    index = {
+        "schema": "nova.od_tiers.v1",
+        "generated_at": generated_at,
+        "source": source,
+        "ks": list(ks),
+        "rank_by": TIER_KINDS,
+        "months": sorted({m for m, _, _ in tiers}),
+        "modes": [ALL_MODES] + sorted({md for _, _, md in tiers if md != ALL_MODES}),
+        "kinds": list(TIER_KINDS),
+        "tiers": {}
+    }
+    for (month, kind, mode), df in sorted(tiers.items()):
+        recs = records(df)
+        entry = {}
+        for k in ks:
+            name = f"{month}_{kind}_{mode_slug(mode)}_top{k}.json"
+            write_json(os.path.join(folder, name), recs[:k], indent=None)
+            entry[str(k)] = {"file": f"{TIER_DIR}/{name}", "rows": min(k, len(recs))}
+            if k >= len(recs):
+                break     # larger K would repeat the same list
+        index["tiers"].setdefault(month, {}).setdefault(kind, {})[mode] = entry
+
+    write_json(os.path.join(out_dir, OUT_TIER_INDEX), index)
+    return index
+
+# =========================
+# OUTPUT
+# =========================
+def write_json(path, records, indent=2):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        if indent is None:
+            json.dump(records, f, separators=(",", ":"))
+        else:
+            json.dump(records, f, indent=indent)
+    os.replace(tmp, path)
+
+
+def records(df):
+    out = df.copy()
+    for c in out.columns:
+        if isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype(str)
+    return out.to_dict(orient="records")
+
+# =========================
+# CLI
+# =========================
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Monthly tract-level OD aggregation")
+    p.add_argument("--delivery-root", default=DELIVERY_ROOT, help="folder with Salt_Lake-<month> folders")
+    p.add_argument("--tracts", default=CENSUS_FILE, help="census tract GeoJSON / shapefile")
+    p.add_argument("--geoid-col", default=TRACT_COL)
+    p.add_argument("--months", nargs="*", help="e.g. Jan-2020 Feb-2020 (default: all)")
+    p.add_argument("--from-dashboard", metavar="JSON",
+                   help="no deliveries: rebuild tiers / tiles from the flows of a dashboard TOP-K JSON "
+                        "(rankings then only cover those rows)")
+    p.add_argument("--out-dir", default=HERE,
+                   help="the explorer reads data/OD (tiers, od_tiles/) — keep the default to publish")
+    p.add_argument("--cache-dir", default=CACHE_DIR)
+    p.add_argument("--top-k", type=int, default=TOP_K)
+    p.add_argument("--tier-ks", type=int, nargs="+", default=TIER_KS,
+                   help="K values of the month × mode × linked/unlinked tiers")
+    p.add_argument("--tile-min-zoom", type=int, default=MIN_ZOOM)
+    p.add_argument("--tile-raw-zoom", type=int, default=RAW_ZOOM,
+                   help="first zoom with tract-to-tract flows (coarser zooms are aggregated)")
+    p.add_argument("--centroids", action="store_true",
+                   help="rewrite tract_centroids.json (always written when missing)")
+    p.add_argument("--full-json", action="store_true",
+                   help="also write the full OD table as JSON (large)")
+    p.add_argument("--report", help="run report JSON (default: <cache-dir>/reports/od_aggregate.json)")
+    p.add_argument("--profile", choices=PROFILERS, help="one profile per stage next to the report")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    reports = os.path.join(os.path.abspath(args.cache_dir), "reports")
+    report = RunReport("od_aggregate", profile=args.profile, profile_dir=os.path.join(reports, "profile"))
+
+    if args.from_dashboard:
+        # flows of an existing TOP-K list (same columns as dashboard_rows)
+        with report.stage("load") as st:
+            with open(args.from_dashboard, "r", encoding="utf-8") as f:
+                rows = pd.DataFrame(json.load(f))
+            with open(os.path.join(args.out_dir, OUT_TRACT_CENTROID_JSON), "r", encoding="utf-8") as f:
+                centroids = json.load(f)
+            final_df = rows
+            source = {"kind": "dashboard", "file": os.path.basename(args.from_dashboard), "rows": len(rows)}
+            st.rows(rows_out=len(rows))
+    else:
+        # geohash7 → tract index (tract polygons only loaded for unseen codes)
+        with report.stage("tract_index"):
+            tract_index = TractIndex.open(args.tracts, os.path.abspath(args.cache_dir), geoid_col=args.geoid_col)
+
+            centroid_path = os.path.join(args.out_dir, OUT_TRACT_CENTROID_JSON)
+            if args.centroids or not os.path.exists(centroid_path):
+                import geopandas as gpd
+                tracts = gpd.read_file(args.tracts).to_crs(epsg=4326)
+                write_json(centroid_path, tract_centroids(tracts, args.geoid_col))
+                print(f"Saved tract centroids → {centroid_path}")
+            with open(centroid_path, "r", encoding="utf-8") as f:
+                centroids = json.load(f)
+
+        final_df = aggregate(args.delivery_root, tract_index, args.months, report=report)
+
+        with report.stage("export", rows_in=len(final_df)) as st:
+            od_path = os.path.join(args.out_dir, OUT_OD_PARQUET)
+            final_df.to_parquet(od_path, index=False)
+            print(f"Saved {len(final_df):,} tract-level OD rows → {od_path}")
+
+            if args.full_json:
+                path = os.path.join(args.out_dir, OUT_OD_JSON)
+                write_json(path, records(final_df))
+                print(f"Saved tract-level OD → {path}")
+
+            rows = dashboard_rows(final_df, centroids)
+            month, _ = pd.factorize(rows["month"], sort=True)
+            topk_df = rows.iloc[top_k_rows(rows["total_flow"], month, args.top_k)]
+            path = os.path.join(args.out_dir, OUT_DASHBOARD_JSON)
+            write_json(path, records(topk_df))
+            print(f"Saved dashboard TOP-{args.top_k} OD ({len(topk_df)} rows) → {path}")
+            st.drop("self_loop_or_no_centroid", len(final_df) - len(rows))
+            st.rows(rows_out=len(rows))
+        source = {"kind": "deliveries", "months": sorted(rows["month"].astype(str).unique().tolist())}
+
+    with report.stage("tiers", rows_in=len(rows)) as st:
+        generated_at = datetime.utcnow().isoformat() + "Z"
+        tiers = od_tiers(rows, args.tier_ks)
+        write_tiers(args.out_dir, tiers, args.tier_ks, generated_at=generated_at, source=source)
+        print(f"Saved {len(tiers)} TOP-K tiers (K = {args.tier_ks}) → {os.path.join(args.out_dir, TIER_DIR)}")
+        st.rows(rows_out=len(tiers))
+
+    # every tract-to-tract flow, tiled for viewport loading
+    with report.stage("tiles", rows_in=len(final_df)) as st:
+        n_tiles = write_pyramid(
+            args.out_dir, final_df, centroids, args.tile_min_zoom, args.tile_raw_zoom,
+            generated_at=generated_at, source=source
+        )
+        print(f"Saved {n_tiles} OD flow tiles (z{args.tile_min_zoom}–{args.tile_raw_zoom}) → {os.path.join(args.out_dir, TILE_DIR)}")
+        st.rows(rows_out=n_tiles)
+    print(f"Done in {time.perf_counter() - t0:.1f}s")
+
+    print(report.summary())
+    report_path = args.report or os.path.join(reports, "od_aggregate.json")
+    report.write(report_path)
+    print(f"✓ Run report written → {report_path}")
+    return final_df
+
+
+if __name__ == "__main__":
+    main()
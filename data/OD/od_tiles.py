@@ -0,0 +1,188 @@
+# ============================================================
+# OD flow tile pyramid (Web Mercator z/x/y, per month)
+# - Flows keyed by origin / destination tract centroids
+# - Below RAW_ZOOM, flows aggregated between grid cells of
+#   zoom z + CELL_ZOOM (8 × 8 cells per tile)
+# - A flow is stored in the tile of its origin and of its destination,
+#   so every flow touching the viewport is found; ids deduplicate
+# - Read by loadODTiles() in assets/js/app.js from data/OD/od_tiles
+#   when Top K = "all" (the default od_aggregate --out-dir)
+# ============================================================
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+MIN_ZOOM = 8
+RAW_ZOOM = 12         # tract-to-tract flows from here on
+CELL_ZOOM = 3         # aggregation grid = zoom + 3 below RAW_ZOOM
+TILE_DIR = "od_tiles"
+
+FIELDS = [
+    "id", "o_lat", "o_lon", "d_lat", "d_lon",
+    "linked_count", "unlinked_count", "linked_weighted_flow", "unlinked_weighted_flow"
+]
+MEASURES = FIELDS[5:]
+
+# =========================
+# WEB MERCATOR
+# =========================
+def lonlat_to_tile(lon, lat, z):
+    """Fractional XYZ tile coordinates (Leaflet / OSM scheme)"""
+    n = 2.0 ** z
+    lat = np.clip(np.radians(lat), -1.4844222297453322, 1.4844222297453322)   # ±85.0511°
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n
+    return x, y
+
+# =========================
+# FLOWS
+# =========================
+def tract_flows(final_df, centroids):
+    """
+    month × origin × destination flows (all modes) with centroid
+    coordinates; self-loops and tracts without a centroid dropped.
+    """
+    df = final_df.groupby(
+        ["month", "origin_tract", "destination_tract"], as_index=False, observed=True
+    )[MEASURES].sum()
+    for c in ("month", "origin_tract", "destination_tract"):
+        df[c] = df[c].astype(str)
+    df = df[df["origin_tract"] != df["destination_tract"]]
+
+    lat = {g: c["lat"] for g, c in centroids.items()}
+    lon = {g: c["lon"] for g, c in centroids.items()}
+    df["o_lat"] = pd.to_numeric(df["origin_tract"].map(lat), errors="coerce")
+    df["o_lon"] = pd.to_numeric(df["origin_tract"].map(lon), errors="coerce")
+    df["d_lat"] = pd.to_numeric(df["destination_tract"].map(lat), errors="coerce")
+    df["d_lon"] = pd.to_numeric(df["destination_tract"].map(lon), errors="coerce")
+
+    coords = df[["o_lat", "o_lon", "d_lat", "d_lon"]].to_numpy(dtype=np.float64)
+    return df[np.isfinite(coords).all(axis=1)].reset_index(drop=True)
+
+
+def aggregate_flows(flows, z):
+    """
+    Flows between grid cells of zoom z + CELL_ZOOM (one row per cell
+    pair); endpoints are count-weighted means of the tract centroids,
+    intra-cell flows dropped.
+    """
+    cz = z + CELL_ZOOM
+    ox, oy = lonlat_to_tile(flows["o_lon"].to_numpy(), flows["o_lat"].to_numpy(), cz)
+    dx, dy = lonlat_to_tile(flows["d_lon"].to_numpy(), flows["d_lat"].to_numpy(), cz)
+    n = np.int64(2 ** cz)
+    o_cell = ox.astype(np.int64) * n + oy.astype(np.int64)
+    d_cell = dx.astype(np.int64) * n + dy.astype(np.int64)
+
+    inter = o_cell != d_cell
+    f = flows[inter]
+    keys, inv = np.unique(
+        np.column_stack([o_cell[inter], d_cell[inter]]), axis=0, return_inverse=True
+    )
+    inv = inv.ravel()
+
+    w = (f["linked_count"] + f["unlinked_count"]).to_numpy(dtype=np.float64)
+    w = np.where(w > 0, w, 1.0)
+    w_sum = np.bincount(inv, weights=w, minlength=len(keys))
+
+    out = {
+        c: np.bincount(inv, weights=f[c].to_numpy(dtype=np.float64) * w, minlength=len(keys)) / w_sum
+        for c in ("o_lat", "o_lon", "d_lat", "d_lon")
+    }
+    for c in MEASURES:
+        out[c] = np.bincount(inv, weights=f[c].to_numpy(dtype=np.float64), minlength=len(keys))
+    return pd.DataFrame(out)
+
+# =========================
+# PYRAMID
+# =========================
+def flow_tiles(flows, z):
+    """
+    {(x, y): row indices} of zoom z: every flow in its origin tile and
+    (if different) its destination tile, strongest flows first.
+    """
+    if not len(flows):
+        return {}
+    ox, oy = lonlat_to_tile(flows["o_lon"].to_numpy(), flows["o_lat"].to_numpy(), z)
+    dx, dy = lonlat_to_tile(flows["d_lon"].to_numpy(), flows["d_lat"].to_numpy(), z)
+    n = np.int64(2 ** z)
+    o_tile = ox.astype(np.int64) * n + oy.astype(np.int64)
+    d_tile = dx.astype(np.int64) * n + dy.astype(np.int64)
+
+    rows = np.arange(len(flows))
+    other = o_tile != d_tile
+    tile = np.concatenate([o_tile, d_tile[other]])
+    row = np.concatenate([rows, rows[other]])
+
+    strength = (flows["linked_weighted_flow"] + flows["unlinked_weighted_flow"]).to_numpy()
+    order = np.lexsort((-strength[row], tile))
+    tile, row = tile[order], row[order]
+
+    bounds = np.flatnonzero(np.r_[True, tile[1:] != tile[:-1], True])
+    return {
+        (int(tile[a] // n), int(tile[a] % n)): row[a:b]
+        for a, b in zip(bounds[:-1], bounds[1:])
+    }
+
+
+def _tile_rows(flows, rows):
+    f = flows.iloc[rows]
+    coords = f[["o_lat", "o_lon", "d_lat", "d_lon"]].to_numpy(dtype=np.float64).round(6)
+    counts = f[["linked_count", "unlinked_count"]].to_numpy(dtype=np.int64)
+    weights = f[["linked_weighted_flow", "unlinked_weighted_flow"]].to_numpy(dtype=np.float64).round(3)
+    return [
+        [int(i), *c, *n, *w]
+        for i, c, n, w in zip(rows, coords.tolist(), counts.tolist(), weights.tolist())
+    ]
+
+
+def write_pyramid(out_dir, final_df, centroids, min_zoom=MIN_ZOOM, raw_zoom=RAW_ZOOM,
+                  generated_at=None, source=None):
+    """
+    od_tiles/{month}/{z}/{x}/{y}.json for every month and zoom in
+    [min_zoom, raw_zoom], plus od_tiles/index.json listing the tiles.
+    """
+    root = os.path.join(out_dir, TILE_DIR)
+    tmp = root + ".tmp"          # whole pyramid swapped in at the end
+    shutil.rmtree(tmp, ignore_errors=True)
+    flows = tract_flows(final_df, centroids)
+
+    index = {
+        "schema": "nova.od_tiles.v1",
+        "generated_at": generated_at,
+        "source": source,
+        "min_zoom": min_zoom,
+        "raw_zoom": raw_zoom,
+        "cell_zoom": CELL_ZOOM,
+        "fields": FIELDS,
+        "months": sorted(flows["month"].unique().tolist()),
+        "tiles": {}
+    }
+
+    n_tiles = 0
+    for month, mf in flows.groupby("month", sort=True):
+        mf = mf.reset_index(drop=True)
+        per_zoom = {}
+        for z in range(min_zoom, raw_zoom + 1):
+            zf = mf if z >= raw_zoom else aggregate_flows(mf, z)
+            tiles = flow_tiles(zf, z)
+            for (x, y), rows in tiles.items():
+                path = os.path.join(tmp, month, str(z), str(x), f"{y}.json")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # dumps (C encoder) — dump() streams through the Python encoder
+                tile = {"z": z, "x": x, "y": y, "flows": _tile_rows(zf, rows)}
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps(tile, separators=(",", ":")))
+            per_zoom[str(z)] = {"flows": int(len(zf)), "tiles": sorted(f"{x}/{y}" for x, y in tiles)}
+            n_tiles += len(tiles)
+        index["tiles"][month] = per_zoom
+
+    os.makedirs(tmp, exist_ok=True)
+    with open(os.path.join(tmp, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp, root)
+    return n_tiles
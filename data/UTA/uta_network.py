@@ -0,0 +1,315 @@
+# ============================================================
+# Precompiled UTA network layers for the explorer
+# - Routes: TopoJSON-style shared arcs. Route lines are quantized to
+#   1e-5 deg, split at junctions (where the set of routes on a street
+#   changes) and every arc is stored once; a route is a list of arcs
+# - Arcs simplified with Douglas-Peucker (junctions always kept):
+#   overview level in uta_network.json, detail level (z ≥ DETAIL_ZOOM)
+#   in the sibling uta_network.detail.json, fetched on demand
+# - Stops bucketed by z12 tile, one polyline per cell
+# - Per-route / per-cell bbox index (layers built only where in view)
+# - Names / modes dictionary-coded; only the popup fields are kept
+# Decoded with loadNetwork() in assets/js/app.js
+#
+# Usage: python data/UTA/uta_network.py   (re-run when the GeoJSON changes)
+# ============================================================
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "samples"))
+sys.path.insert(0, os.path.join(HERE, "..", "OD"))
+
+from export_pool import write_json_compact
+from od_tiles import lonlat_to_tile
+from route_simplify import dp_importance
+from sample_v3 import PRECISION, encode_polylines
+
+SCHEMA = "nova.uta_network.v1"
+DETAIL_SCHEMA = "nova.uta_network_detail.v1"
+
+ROUTES_FILE = os.path.join(HERE, "UTA_Routes.geojson")
+STOPS_FILE = os.path.join(HERE, "UTA_Stops.geojson")
+OUT_NAME = "uta_network.json"
+DETAIL_NAME = "uta_network.detail.json"
+
+OVERVIEW_M = 8.0       # ≈ half a pixel up to z13 at this latitude
+DETAIL_M = 1.0
+DETAIL_ZOOM = 14
+STOP_CELL_ZOOM = 12    # stop buckets (≈ 7 km tiles)
+BBOX_DIGITS = 5
+
+# =========================
+# GEOJSON
+# =========================
+def read_features(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [ft for ft in json.load(f)["features"] if ft.get("geometry")]
+
+
+def _lines(geom):
+    if geom["type"] == "LineString":
+        return [geom["coordinates"]]
+    if geom["type"] == "MultiLineString":
+        return geom["coordinates"]
+    return []
+
+
+def _dict_encode(values):
+    """Values → (distinct values, code per value); missing → -1 / null"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return [str(u) for u in uniques], [int(c) if c >= 0 else None for c in codes]
+
+# =========================
+# TOPOLOGY (shared arcs)
+# =========================
+def route_edges(features):
+    """
+    Route lines → (node lon/lat (m, 2), edges (k, 2) node ids with u < v,
+    route of each edge); nodes are the distinct 1e-5 deg points
+    """
+    scale = 10 ** PRECISION
+    q, part, owner = [], [], []
+    n_parts = 0
+    for r, ft in enumerate(features):
+        for line in _lines(ft["geometry"]):
+            pts = np.asarray(line, dtype=np.float64).reshape(-1, 2)[:, :2]
+            q.append(np.round(pts * scale).astype(np.int64))
+            part.append(np.full(len(pts), n_parts))
+            owner.append(np.full(len(pts), r))
+            n_parts += 1
+    q, part, owner = np.concatenate(q), np.concatenate(part), np.concatenate(owner)
+
+    keys = (q[:, 0] + (1 << 31)) << 32 | (q[:, 1] + (1 << 31))
+    uniq, node = np.unique(keys, return_inverse=True)
+    lonlat = np.column_stack([(uniq >> 32) - (1 << 31), (uniq & 0xFFFFFFFF) - (1 << 31)]) / scale
+
+    step = (part[1:] == part[:-1]) & (node[1:] != node[:-1])
+    a, b = node[:-1][step], node[1:][step]
+    edges = np.column_stack([np.minimum(a, b), np.maximum(a, b)])
+    e = np.unique(np.column_stack([edges, owner[:-1][step]]), axis=0)
+    return lonlat, e[:, :2], e[:, 2]
+
+
+def build_arcs(n_nodes, edges, routes):
+    """
+    Maximal chains of edges carrying the same set of routes.
+    Returns (arcs: node id lists, route set of each arc).
+    """
+    pair, first = np.unique(edges, axis=0, return_index=True)
+    # edges are sorted by (u, v, route): route sets are consecutive runs
+    bounds = np.r_[first, len(edges)]
+    sig_of = {}
+    sig = np.empty(len(pair), dtype=np.int64)
+    for i in range(len(pair)):
+        sig[i] = sig_of.setdefault(tuple(routes[bounds[i]:bounds[i + 1]].tolist()), len(sig_of))
+    signatures = list(sig_of)
+
+    # node → incident edges (CSR)
+    ends = pair.ravel()
+    order = np.argsort(ends, kind="stable")
+    inc_edge = order // 2
+    inc_off = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ends, minlength=n_nodes), out=inc_off[1:])
+    degree = np.diff(inc_off)
+
+    junction = degree != 2
+    two = np.flatnonzero(degree == 2)
+    e1, e2 = inc_edge[inc_off[two]], inc_edge[inc_off[two] + 1]
+    junction[two[sig[e1] != sig[e2]]] = True
+
+    inc_off, inc_edge, pair_l = inc_off.tolist(), inc_edge.tolist(), pair.tolist()
+    visited = np.zeros(len(pair), dtype=bool)
+    arcs, arc_sig = [], []
+
+    def walk(start, e):
+        path = [start]
+        cur = start
+        while True:
+            visited[e] = True
+            u, v = pair_l[e]
+            cur = v if u == cur else u
+            path.append(cur)
+            if junction[cur] or cur == start:
+                return path
+            a, b = inc_edge[inc_off[cur]], inc_edge[inc_off[cur] + 1]
+            e = b if a == e else a
+
+    for start in np.flatnonzero(junction).tolist():
+        for e in inc_edge[inc_off[start]:inc_off[start + 1]]:
+            if not visited[e]:
+                arcs.append(walk(start, e))
+                arc_sig.append(sig[e])
+    # closed rings without any junction
+    for e in np.flatnonzero(~visited).tolist():
+        if not visited[e]:
+            arcs.append(walk(pair_l[e][0], e))
+            arc_sig.append(sig[e])
+    return arcs, [signatures[s] for s in arc_sig]
+
+
+def route_arcs(n_routes, arc_routes):
+    """Arc route sets → per-route arc ids (CSR offsets + flat ids)"""
+    per_route = [[] for _ in range(n_routes)]
+    for a, rs in enumerate(arc_routes):
+        for r in rs:
+            per_route[r].append(a)
+    offsets = np.zeros(n_routes + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in per_route], out=offsets[1:])
+    return offsets.tolist(), [a for p in per_route for a in p]
+
+
+def arc_levels(lonlat, arcs, tolerances):
+    """Arc node lists → {tolerance: polyline per arc} (junction ends kept)"""
+    offsets = np.zeros(len(arcs) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arcs], out=offsets[1:])
+    coords = lonlat[np.concatenate(arcs)]
+    imp = dp_importance(coords, offsets, min(tolerances))
+
+    owner = np.repeat(np.arange(len(arcs)), np.diff(offsets))
+    out = {}
+    for tol in tolerances:
+        keep = imp > tol
+        kept = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(np.bincount(owner[keep], minlength=len(arcs)), out=kept[1:])
+        out[tol] = (encode_polylines(coords[keep][:, ::-1], kept), int(keep.sum()))
+    return out
+
+
+def _bbox(lonlat):
+    (w, s), (e, n) = lonlat.min(axis=0), lonlat.max(axis=0)
+    return [round(float(v), BBOX_DIGITS) for v in (s, w, n, e)]   # Leaflet order
+
+# =========================
+# LAYERS
+# =========================
+def encode_routes(features, overview_m=OVERVIEW_M, detail_m=DETAIL_M):
+    lonlat, edges, owner = route_edges(features)
+    arcs, arc_routes = build_arcs(len(lonlat), edges, owner)
+    arc_offsets, arc_ids = route_arcs(len(features), arc_routes)
+    levels = arc_levels(lonlat, arcs, (overview_m, detail_m))
+
+    props = [ft["properties"] for ft in features]
+    routetypes, routetype_codes = _dict_encode([p.get("routetype") for p in props])
+    bbox = []
+    for r in range(len(features)):
+        nodes = np.concatenate([arcs[a] for a in arc_ids[arc_offsets[r]:arc_offsets[r + 1]]] or [[]])
+        bbox.append(_bbox(lonlat[nodes.astype(np.int64)]) if len(nodes) else None)
+
+    routes = {
+        "name": [p.get("linename") for p in props],
+        "abbr": [p.get("lineabbr") for p in props],
+        "routetype": routetype_codes,
+        "bbox": bbox,
+        "arc_offsets": arc_offsets,
+        "arc": arc_ids,
+    }
+    stats = {
+        "routes": len(features),
+        "nodes": len(lonlat),
+        "edges": len(np.unique(edges, axis=0)),
+        "arcs": len(arcs),
+        "points": {"overview": levels[overview_m][1], "detail": levels[detail_m][1]},
+    }
+    return routes, routetypes, levels[overview_m][0], levels[detail_m][0], stats
+
+
+def encode_stops(features, cell_zoom=STOP_CELL_ZOOM):
+    lonlat = np.array([ft["geometry"]["coordinates"][:2] for ft in features], dtype=np.float64)
+    x, y = lonlat_to_tile(lonlat[:, 0], lonlat[:, 1], cell_zoom)
+    cell = x.astype(np.int64) << 32 | y.astype(np.int64)
+
+    order = np.lexsort((lonlat[:, 0], lonlat[:, 1], cell))
+    lonlat, cell = lonlat[order], cell[order]
+    props = [features[i]["properties"] for i in order]
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    offsets = np.r_[starts, len(cell)].astype(np.int64)
+
+    names, name_codes = _dict_encode([p.get("stopname") for p in props])
+    modes, mode_codes = _dict_encode([p.get("mode") for p in props])
+    stops = {
+        "cell_offsets": offsets.tolist(),
+        "cell_bbox": [_bbox(lonlat[a:b]) for a, b in zip(offsets[:-1], offsets[1:])],
+        "cell_points": encode_polylines(lonlat[:, ::-1], offsets),
+        "name": name_codes,
+        "mode": mode_codes,
+    }
+    return stops, names, modes
+
+
+def encode_network(route_features, stop_features, overview_m=OVERVIEW_M, detail_m=DETAIL_M,
+                   generated_at=None):
+    """(network doc, detail doc, build stats)"""
+    generated_at = generated_at or datetime.utcnow().isoformat() + "Z"
+    routes, routetypes, overview, detail, stats = encode_routes(route_features, overview_m, detail_m)
+    stops, stop_names, stop_modes = encode_stops(stop_features)
+    stats["stops"] = len(stop_features)
+    stats["stop_cells"] = len(stops["cell_bbox"])
+
+    doc = {
+        "schema": SCHEMA,
+        "generated_at": generated_at,
+        "encoding": {
+            "route": "polyline",
+            "precision": PRECISION,
+            "lod": "overview",
+            "tolerance_m": overview_m,
+            "detail": {"url": DETAIL_NAME, "min_zoom": DETAIL_ZOOM, "tolerance_m": detail_m}
+        },
+        "dict": {
+            "routetype": routetypes,
+            "stop_name": stop_names,
+            "stop_mode": stop_modes
+        },
+        "arcs": overview,
+        "routes": routes,
+        "stops": stops
+    }
+    detail_doc = {
+        "schema": DETAIL_SCHEMA,
+        "generated_at": generated_at,
+        "encoding": {"route": "polyline", "precision": PRECISION, "lod": "detail", "tolerance_m": detail_m},
+        "arcs": detail
+    }
+    return doc, detail_doc, stats
+
+# =========================
+# MAIN
+# =========================
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Compile the UTA GeoJSON into explorer network layers")
+    p.add_argument("--routes", default=ROUTES_FILE)
+    p.add_argument("--stops", default=STOPS_FILE)
+    p.add_argument("--out-dir", default=HERE)
+    p.add_argument("--overview-m", type=float, default=OVERVIEW_M)
+    p.add_argument("--detail-m", type=float, default=DETAIL_M)
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    doc, detail_doc, stats = encode_network(
+        read_features(args.routes), read_features(args.stops), args.overview_m, args.detail_m
+    )
+    os.makedirs(args.out_dir, exist_ok=True)
+    sizes = write_json_compact(os.path.join(args.out_dir, OUT_NAME), doc)
+    detail_sizes = write_json_compact(os.path.join(args.out_dir, DETAIL_NAME), detail_doc)
+
+    source = os.path.getsize(args.routes) + os.path.getsize(args.stops)
+    print(f"Routes: {stats['routes']} routes, {stats['edges']:,} edges → {stats['arcs']:,} shared arcs "
+          f"({stats['points']['overview']:,} overview / {stats['points']['detail']:,} detail points)")
+    print(f"Stops:  {stats['stops']:,} stops in {stats['stop_cells']} cells")
+    print(f"GeoJSON {source / 1e6:.2f} MB → {OUT_NAME} {sizes['bytes'] / 1e3:.0f} KB "
+          f"(gzip {sizes['gzip_bytes'] / 1e3:.0f} KB), {DETAIL_NAME} {detail_sizes['bytes'] / 1e3:.0f} KB "
+          f"(gzip {detail_sizes['gzip_bytes'] / 1e3:.0f} KB)")
+    print(f"✓ UTA network layers written in {time.perf_counter() - t0:.1f}s → {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
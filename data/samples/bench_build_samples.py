@@ -0,0 +1,201 @@
+# ============================================================
+# Benchmark: v1 sample builder
+# iterrows() row builder (previous build_samples.py) vs the
+# column-at-a-time build_samples on a synthetic CSV
+#
+#   python data/samples/bench_build_samples.py [N]
+# ============================================================
+
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from shapely import wkt
+
+import build_samples
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+GENERATED_AT = "2020-01-01T00:00:00Z"
+
+# =========================
+# DATA (Salt Lake bbox + some junk)
+# =========================
+def synthetic_csv(path, n):
+    rng = np.random.default_rng(42)
+    n_pts = rng.integers(2, 8, n)
+    n_pts[::5000] = 450                                  # thinned routes
+    lon = rng.uniform(-112.2, -111.7, int(n_pts.sum())).round(6)
+    lat = rng.uniform(40.4, 41.0, len(lon)).round(6)
+    ends = np.cumsum(n_pts)
+    pairs = [f"{x} {y}" for x, y in zip(lon.tolist(), lat.tolist())]
+    geom = [f"LINESTRING ({', '.join(pairs[e - k:e])})" for e, k in zip(ends.tolist(), n_pts.tolist())]
+    geom[1::997] = [None] * len(geom[1::997])
+    geom[2::997] = ["POINT (-111.9 40.7)"] * len(geom[2::997])
+    geom[3::997] = ["LINESTRING (-111.9 40.7, oops)"] * len(geom[3::997])
+    geom[4::997] = ["LINESTRING Z (-111.9 40.7 1, -111.8 40.6 2)"] * len(geom[4::997])
+    geom[5::997] = ["LINESTRING EMPTY"] * len(geom[5::997])
+
+    start = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 31 * 86400, n), unit="s")
+    end = start + pd.to_timedelta(rng.integers(1, 7200, n), unit="s")
+    start = start.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    end = end.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    start[6::997] = None
+    end[7::997] = "not a time"
+
+    modes = np.array(["bus", "rail", "Walk/Bike", "car", "BUS", None], dtype=object)
+    stops = np.array(["Central Station", "Airport", "Université", None], dtype=object)
+
+    def holes(x, step=13):
+        x = np.asarray(x, dtype=object if np.asarray(x).dtype == object else np.float64).copy()
+        x[::step] = None if x.dtype == object else np.nan
+        return x
+
+    pd.DataFrame({
+        "trip_id": np.arange(n) + 1_000_000,
+        "linked_trip_id": [f"L{i // 3}" for i in range(n)],
+        "tour_id": holes(rng.integers(1, 9999, n).astype(np.float64), 17),
+        "travel_mode": modes[rng.integers(0, len(modes), n)],
+        "local_datetime_start": start,
+        "local_datetime_end": end,
+        "full_geometry_wkt": geom,
+        "network_distance": holes(rng.gamma(2.0, 2.0, n).round(3)),
+        "route_distance": holes(rng.gamma(2.0, 2.0, n), 11),
+        "orig_lon": lon[ends - n_pts], "orig_lat": lat[ends - n_pts],
+        "dest_lon": lon[ends - 1], "dest_lat": lat[ends - 1],
+        "geohash7_orig": holes(np.full(n, "9x0qzpb", dtype=object), 19),
+        "geohash7_dest": np.full(n, "9x0qz7c", dtype=object),
+        "access_stop_id": holes(rng.integers(1, 30000, n).astype(np.float64)),
+        "access_stop": stops[rng.integers(0, len(stops), n)],
+        "egress_stop_id": holes(rng.integers(1, 30000, n).astype(np.float64), 7),
+        "egress_stop": stops[rng.integers(0, len(stops), n)],
+        "trip_purpose": holes(np.full(n, "work", dtype=object), 23),
+        "trip_weight": holes(rng.uniform(0.5, 3.0, n), 29),
+        "trip_count": rng.integers(1, 5, n),
+    }).to_csv(path, index=False)
+
+# =========================
+# RUN
+# =========================
+def run_iterrows(csv_path, out_path):
+    """the previous build_samples.py, verbatim apart from paths"""
+    df = pd.read_csv(csv_path)
+    df = df.where(pd.notnull(df), None)
+    df["trip_id"] = df["trip_id"].astype(str)
+
+    def parse_geometry(wkt_str, trip_id):
+        if not isinstance(wkt_str, str) or not wkt_str.startswith("LINESTRING"):
+            print(f"[WARN] Invalid geometry for trip {trip_id}")
+            return None
+        try:
+            geom = wkt.loads(wkt_str)
+            coords = [[lat, lng] for lng, lat in geom.coords]
+            if len(coords) > 400:
+                coords = coords[::3]
+            return coords
+        except Exception as e:
+            print(f"[ERROR] Geometry parse failed for {trip_id}: {e}")
+            return None
+
+    def compute_duration_min(row):
+        try:
+            t0 = pd.to_datetime(row["local_datetime_start"])
+            t1 = pd.to_datetime(row["local_datetime_end"])
+            return round((t1 - t0).total_seconds() / 60, 1)
+        except Exception:
+            return None
+
+    def normalize_mode(m):
+        if not isinstance(m, str):
+            return "unknown"
+        m = m.lower()
+        if m == "rail":
+            return "rail"
+        if m == "bus":
+            return "bus"
+        if "walk" in m or "bike" in m:
+            return "walk_bike"
+        return "other"
+
+    clean = build_samples.clean
+
+    samples = []
+    for _, r in df.iterrows():
+        route = parse_geometry(r["full_geometry_wkt"], r["trip_id"])
+        if route is None:
+            continue
+        samples.append({
+            "id": r["trip_id"],
+            "mode": normalize_mode(r["travel_mode"]),
+            "route": route,
+            "duration_min": clean(compute_duration_min(r)),
+            "network_distance_km": clean(r.get("network_distance")),
+            "route_distance_km": clean(r.get("route_distance")),
+            "origin": {
+                "lon": clean(r.get("orig_lon")),
+                "lat": clean(r.get("orig_lat")),
+                "geohash": clean(r.get("geohash7_orig"))
+            },
+            "destination": {
+                "lon": clean(r.get("dest_lon")),
+                "lat": clean(r.get("dest_lat")),
+                "geohash": clean(r.get("geohash7_dest"))
+            },
+            "access": {
+                "stop_id": clean(r.get("access_stop_id")),
+                "stop_name": clean(r.get("access_stop"))
+            },
+            "egress": {
+                "stop_id": clean(r.get("egress_stop_id")),
+                "stop_name": clean(r.get("egress_stop"))
+            },
+            "meta": {
+                "linked_trip_id": clean(r.get("linked_trip_id")),
+                "tour_id": clean(r.get("tour_id")),
+                "purpose": clean(r.get("trip_purpose")),
+                "weight": clean(r.get("trip_weight")),
+                "trip_count": clean(r.get("trip_count"))
+            }
+        })
+
+    out = {"schema": build_samples.SCHEMA, "generated_at": GENERATED_AT, "count": len(samples), "samples": samples}
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+
+
+def run_vectorized(csv_path, out_path):
+    df = build_samples.load_csv(csv_path)
+    fields, points, offsets = build_samples.build_samples(df)
+    build_samples.write_samples(out_path, fields, points, offsets, GENERATED_AT)
+
+
+def timed(fn, *args):
+    """wall time of fn(*args), per-trip warnings discarded"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        t0 = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - t0
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    csv_path = os.path.join(tmp, "selected_linked_trips.csv")
+    synthetic_csv(csv_path, N)
+    ref_path, vec_path = os.path.join(tmp, "ref.json"), os.path.join(tmp, "vec.json")
+
+    t_ref = timed(run_iterrows, csv_path, ref_path)
+    t_vec = timed(run_vectorized, csv_path, vec_path)
+
+    with open(ref_path, "rb") as a, open(vec_path, "rb") as b:
+        identical = a.read() == b.read()
+    csv_mb = os.path.getsize(csv_path) / 1e6
+    json_mb = os.path.getsize(vec_path) / 1e6
+
+print(f"N = {N:,}  (CSV {csv_mb:,.1f} MB → JSON {json_mb:,.1f} MB)")
+print(f"iterrows builder   : {t_ref:8.3f} s  ({N / t_ref:,.0f} rows/s)")
+print(f"vectorized builder : {t_vec:8.3f} s  ({N / t_vec:,.0f} rows/s)")
+print(f"speedup            : {t_ref / t_vec:8.1f}x")
+print(f"byte-identical     : {identical}")
@@ -0,0 +1,64 @@
+# ============================================================
+# Micro-benchmark: geohash7 decode
+# pygeohash (per value) vs geohash7.decode (vectorized)
+#
+#   python data/samples/bench_geohash.py [N]
+# ============================================================
+
+import sys
+import time
+
+import numpy as np
+import pygeohash as pgh
+
+import geohash7
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+# =========================
+# DATA (Salt Lake bbox + some junk)
+# =========================
+rng = np.random.default_rng(42)
+lat = rng.uniform(40.0, 41.5, N)
+lon = rng.uniform(-112.5, -111.5, N)
+ix = np.floor((lon + 180.0) / geohash7.GH_DLON).astype(np.int64)
+iy = np.floor((lat + 90.0) / geohash7.GH_DLAT).astype(np.int64)
+
+codes = geohash7.cells_to_geohash(ix, iy).astype(object)
+codes[::1000] = None
+codes[1::1000] = "9x0qzpa"   # 'a' is not base32
+
+# =========================
+# RUN
+# =========================
+def run_pygeohash(values):
+    out_lat = np.full(len(values), np.nan)
+    out_lon = np.full(len(values), np.nan)
+    for i, gh in enumerate(values):
+        try:
+            out_lat[i], out_lon[i] = pgh.decode(gh)
+        except Exception:
+            pass
+    return out_lat, out_lon
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return time.perf_counter() - t0, res
+
+
+t_ref, (ref_lat, ref_lon) = timed(run_pygeohash, codes)
+t_vec, (vec_lat, vec_lon) = timed(geohash7.decode, codes)
+
+valid = np.isfinite(vec_lat)
+agree = (
+    np.allclose(ref_lat[valid], vec_lat[valid], rtol=0, atol=1e-9)
+    and np.allclose(ref_lon[valid], vec_lon[valid], rtol=0, atol=1e-9)
+)
+
+print(f"N = {N:,}  (invalid: {int((~valid).sum()):,})")
+print(f"pygeohash.decode : {t_ref:8.3f} s  ({N / t_ref:,.0f} /s)")
+print(f"geohash7.decode  : {t_vec:8.3f} s  ({N / t_vec:,.0f} /s)")
+print(f"speedup          : {t_ref / t_vec:8.1f}x")
+print(f"results agree    : {agree}")
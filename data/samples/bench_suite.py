@@ -0,0 +1,375 @@
+# ============================================================
+# Benchmark suite: sample + OD pipelines on synthetic deliveries
+# - synth_delivery.py data at 10k / 1m / 10m legs (generated once,
+#   reused while its manifest matches)
+# - timed scenarios: load, tract join, geometry build, linked-trip
+#   assembly, stats, export (builder stages), v1 build_samples,
+#   OD aggregation
+# - best-of-N wall times (N = 3 by default, rounds interleaved) compared
+#   with bench_baselines/{scale}.json; slower than THRESHOLD × baseline and
+#   by more than the metric's own run-to-run spread → regression
+#   (exit code 1)
+#
+#   python data/samples/bench_suite.py --scale 10k [--repeat 5]
+#   python data/samples/bench_suite.py --scale 1m --save-baseline
+# ============================================================
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "OD"))
+
+import build_samples
+import geohash7
+import od_aggregate
+import synth_delivery
+from link_store import LinkStore
+from parquet_scan import month_files, scan_candidates
+from route_assembly import assemble_routes
+from tract_index import TractIndex
+
+BUILDER = os.path.join(HERE, "select_Jan_remove_far_connection_test.py")
+BENCH_DIR = "./data/cache/bench"                   # synthetic data + reports
+BASELINE_DIR = os.path.join(HERE, "bench_baselines")
+SCHEMA = "nova.complete_trip.bench.v1"
+
+THRESHOLD = 1.25          # current / baseline above this → regression
+REPEAT = 3                # runs per scenario; the best one is compared
+NOISE_FLOOR_S = 0.01      # ... unless it is less than max(this, NOISE_SPREAD ×
+NOISE_SPREAD = 2.0        # the metric's spread (max - min over the repeats)
+                          # in the current run or the baseline) slower
+
+# same as the builder's USE_COLS / MODE_NETWORK / ROUTE_DETAIL_M
+USE_COLS = [
+    "linked_trip_id", "trip_id", "tour_id",
+    "travel_mode", "local_datetime_start", "local_datetime_end",
+    "network_distance", "route_distance",
+    "geohash7_orig", "geohash7_dest",
+    "access_stop", "access_stop_id",
+    "egress_stop", "egress_stop_id",
+    "trip_purpose", "trip_weight",
+    "route_taken"
+]
+MODE_NETWORK = {"car": "auto", "walk/bike": "walk", "bus": "transit", "rail": "transit"}
+NETWORKS = {
+    "auto": ("auto-biggest-connected-graph/link.csv", "from_osm_node_id", "to_osm_node_id"),
+    "walk": ("walk-biggest-connected-graph/link.csv", "from_osm_node_id", "to_osm_node_id"),
+    "transit": ("UTA/link with flow.csv", "from_node_id", "to_node_id"),
+}
+ROUTE_DETAIL_M = 3.0
+HUB_ODS = [(o, d) for o in synth_delivery.HUBS for d in synth_delivery.HUBS]
+
+# =========================
+# TIMING
+# =========================
+@contextlib.contextmanager
+def quiet():
+    """per-trip / per-file prints (and library warnings) of the pipelines discarded"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+def timed(fn, *args, **kwargs):
+    with quiet():
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        return time.perf_counter() - t0, out
+
+# =========================
+# SCENARIOS (each → {metric: seconds})
+# =========================
+def bench_load(data):
+    t, df = timed(scan_candidates, data["files"], USE_COLS)
+    t_push, candidates = timed(scan_candidates, data["files"], USE_COLS, od_pairs=HUB_ODS, tracts=data["tracts"])
+    data["legs"], data["candidates"] = df, candidates
+    return {"load.scan": t, "load.scan_pushdown": t_push}
+
+
+def bench_tract_join(data):
+    df = data["legs"]
+    cols = [df["geohash7_orig"].to_numpy(dtype=object), df["geohash7_dest"].to_numpy(dtype=object)]
+    with tempfile.TemporaryDirectory() as cache:
+        t_decode, _ = timed(lambda: [geohash7.decode(c) for c in cols])
+        # cold: geohash cells joined against the polygons, index written
+        t_cold, _ = timed(lambda: [
+            TractIndex.open(data["tract_shp"], cache, geoid_col="GEOID").lookup(c) for c in cols
+        ])
+        t_warm, _ = timed(lambda: [
+            TractIndex.open(data["tract_shp"], cache, geoid_col="GEOID").lookup(c) for c in cols
+        ])
+    return {"tract_join.decode": t_decode, "tract_join.cold": t_cold, "tract_join.warm": t_warm}
+
+
+def bench_geometry(data):
+    # the hub-OD candidate legs, as routed by the builder
+    data.pop("legs", None)
+    df = data["candidates"]
+    with tempfile.TemporaryDirectory() as cache:
+        def open_stores():
+            return {
+                name: LinkStore.open(os.path.join(data["network_dir"], path), cache, name, fc, tc)
+                for name, (path, fc, tc) in NETWORKS.items()
+            }
+        t_compile, stores = timed(open_stores)
+        t_assemble, routes = timed(
+            assemble_routes, df["route_taken"].values, df["travel_mode"].values, stores, MODE_NETWORK
+        )
+        t_simplify, _ = timed(routes.simplified, ROUTE_DETAIL_M)
+        del stores, routes
+    return {
+        "geometry.compile_links": t_compile,
+        "geometry.assemble": t_assemble,
+        "geometry.simplify": t_simplify,
+    }
+
+
+def bench_builder(data):
+    """
+    The sample builder end to end (fresh cwd → cold caches); its
+    run report covers each stage (assembly, stats, export, ...)
+    """
+    with tempfile.TemporaryDirectory() as work:
+        report_path = os.path.join(work, "run_report.json")
+        config_path = os.path.join(work, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"base_dir": data["root"], "run_report": report_path}, f)
+        t0 = time.perf_counter()
+        run = subprocess.run(
+            [sys.executable, BUILDER, "--config", config_path], cwd=work, capture_output=True, text=True
+        )
+        total = time.perf_counter() - t0
+        if run.returncode != 0:
+            raise RuntimeError(f"builder failed:\n{run.stderr[-2000:]}")
+        with open(report_path, "r", encoding="utf-8") as f:
+            stages = json.load(f)["stages"]
+    out = {f"builder.{k}": v["seconds"] for k, v in stages.items()}
+    out["builder.total"] = total
+    return out
+
+
+def bench_build_samples(data):
+    with tempfile.TemporaryDirectory() as tmp:
+        t_load, df = timed(build_samples.load_csv, data["v1_csv"])
+        t_build, (fields, points, offsets) = timed(build_samples.build_samples, df)
+        t_write, _ = timed(
+            build_samples.write_samples, os.path.join(tmp, "samples.json"),
+            fields, points, offsets, "2020-01-01T00:00:00Z"
+        )
+    return {"v1.load_csv": t_load, "v1.build": t_build, "v1.write": t_write}
+
+
+def bench_od_aggregate(data):
+    with tempfile.TemporaryDirectory() as tmp:
+        t, _ = timed(od_aggregate.main, [
+            "--delivery-root", data["delivery_root"], "--tracts", data["tract_shp"],
+            "--geoid-col", "GEOID", "--out-dir", os.path.join(tmp, "out"),
+            "--cache-dir", os.path.join(tmp, "cache"),
+        ])
+    return {"od_aggregate.total": t}
+
+
+# in run order (tract_join / geometry reuse the legs read by load;
+# all legs are joined, the hub-OD candidates routed)
+SCENARIOS = {
+    "load": bench_load,
+    "tract_join": bench_tract_join,
+    "geometry": bench_geometry,
+    "builder": bench_builder,
+    "build_samples": bench_build_samples,
+    "od_aggregate": bench_od_aggregate,
+}
+
+# =========================
+# BASELINES / REPORT
+# =========================
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def compare(metrics, baseline, threshold=THRESHOLD, noise_floor_s=NOISE_FLOOR_S, spread=None):
+    """
+    One row per metric: baseline vs current and a status. A change
+    counts only past `threshold` and past the metric's noise: the
+    larger of `noise_floor_s` and NOISE_SPREAD × its spread over the
+    repeats, here (`spread`) or in the baseline.
+    """
+    base = (baseline or {}).get("metrics", {})
+    base_spread = (baseline or {}).get("spread", {})
+    spread = spread or {}
+    rows = []
+    for name, cur in metrics.items():
+        ref = base.get(name)
+        noise = max(noise_floor_s, NOISE_SPREAD * max(spread.get(name, 0.0), base_spread.get(name, 0.0)))
+        if ref is None:
+            status, ratio = "new", None
+        else:
+            ratio = cur / ref if ref > 0 else float("inf")
+            if ratio > threshold and cur - ref > noise:
+                status = "regression"
+            elif ratio < 1 / threshold and ref - cur > noise:
+                status = "improved"
+            else:
+                status = "ok"
+        rows.append({
+            "metric": name,
+            "baseline_s": ref,
+            "current_s": round(cur, 4),
+            "ratio": round(ratio, 3) if ratio is not None else None,
+            "noise_s": round(noise, 4),
+            "status": status,
+        })
+    for name in sorted(set(base) - set(metrics)):
+        rows.append({"metric": name, "baseline_s": base[name], "current_s": None, "ratio": None, "status": "missing"})
+    return rows
+
+
+def print_report(rows):
+    print(f"{'metric':32s} {'baseline':>10s} {'current':>10s} {'ratio':>7s} {'noise':>8s}  status")
+    for r in rows:
+        b = f"{r['baseline_s']:.3f}" if r["baseline_s"] is not None else "-"
+        c = f"{r['current_s']:.3f}" if r["current_s"] is not None else "-"
+        x = f"{r['ratio']:.2f}x" if r["ratio"] is not None else "-"
+        n = f"{r['noise_s']:.3f}" if r.get("noise_s") is not None else "-"
+        print(f"{r['metric']:32s} {b:>10s} {c:>10s} {x:>7s} {n:>8s}  {r['status']}")
+
+
+def load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_json(path, obj):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
+
+# =========================
+# MAIN
+# =========================
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Synthetic-data benchmark suite")
+    p.add_argument("--scale", default="10k", help="10k / 1m / 10m or a number of legs")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--data-dir", help=f"synthetic delivery (default: {BENCH_DIR}/<scale>)")
+    p.add_argument("--only", nargs="+", choices=list(SCENARIOS), help="scenarios to run (default: all)")
+    p.add_argument("--repeat", type=int, default=REPEAT, help="best of N runs per scenario")
+    p.add_argument("--threshold", type=float, default=THRESHOLD)
+    p.add_argument("--noise-floor", type=float, default=NOISE_FLOOR_S, help="minimum noise, seconds")
+    p.add_argument("--baseline", help="baseline JSON (default: bench_baselines/<scale>.json)")
+    p.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    p.add_argument("--report", help=f"report JSON (default: {BENCH_DIR}/report-<scale>.json)")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = synth_delivery.parse_rows(args.scale)
+    root = os.path.abspath(args.data_dir or os.path.join(BENCH_DIR, args.scale))
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.scale}.json")
+
+    t, manifest = timed(synth_delivery.ensure, root, rows, args.seed)
+    print(f"Data: {manifest['rows']:,} legs / {manifest['linked_trips']:,} linked trips → {root} ({t:.1f}s)")
+
+    delivery_root = os.path.join(root, synth_delivery.DELIVERY_DIR)
+    tract_shp = os.path.join(root, synth_delivery.TRACT_SHP)
+    data = {
+        "root": root,
+        "delivery_root": delivery_root,
+        "files": month_files(delivery_root, manifest["months"]),
+        "tract_shp": tract_shp,
+        "tracts": gpd.read_file(tract_shp),
+        "network_dir": os.path.join(root, synth_delivery.NETWORK_DIR),
+        "v1_csv": os.path.join(root, synth_delivery.V1_CSV),
+    }
+
+    names = args.only or list(SCENARIOS)
+    if any(n in ("tract_join", "geometry") for n in names) and "load" not in names:
+        names = ["load"] + names
+    # repeats interleaved (every scenario once per round): a slow spell
+    # of the machine hits one sample of each metric, not all of them
+    runs = {}
+    for r in range(args.repeat):
+        print(f"Round {r + 1}/{args.repeat}")
+        for name in names:
+            out = SCENARIOS[name](data)
+            for k, v in out.items():
+                runs.setdefault(k, []).append(v)
+            print(f"  {name}: " + ", ".join(f"{k.split('.', 1)[1]} {v:.3f}s" for k, v in out.items()))
+    metrics = {k: min(v) for k, v in runs.items()}
+    spread = {k: max(v) - min(v) for k, v in runs.items()}
+
+    run = {
+        "schema": SCHEMA,
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "scale": args.scale,
+        "data": manifest,
+        "repeat": args.repeat,
+        "env": environment(),
+        "metrics": {k: round(v, 4) for k, v in metrics.items()},
+        "spread": {k: round(v, 4) for k, v in spread.items()},
+    }
+    if args.save_baseline:
+        write_json(baseline_path, run)
+        print(f"✓ Baseline saved → {baseline_path}")
+        return 0
+
+    baseline = load_json(baseline_path)
+    rows = compare(metrics, baseline, args.threshold, args.noise_floor, spread)
+    if args.only:
+        rows = [r for r in rows if r["status"] != "missing"]
+    regressions = [r["metric"] for r in rows if r["status"] == "regression"]
+    report = {
+        **run,
+        "baseline": baseline_path if baseline else None,
+        "baseline_env": baseline["env"] if baseline else None,
+        "threshold": args.threshold,
+        "noise_floor_s": args.noise_floor,
+        "results": rows,
+        "regressions": regressions,
+    }
+    report_path = args.report or os.path.join(BENCH_DIR, f"report-{args.scale}.json")
+    write_json(report_path, report)
+
+    print()
+    print_report(rows)
+    if baseline is None:
+        print(f"⚠️ No baseline at {baseline_path} (run with --save-baseline)")
+    elif args.repeat < 2 and not baseline.get("spread"):
+        print("⚠️ Single run, no spread in the baseline: only the noise floor separates noise from regressions")
+    elif baseline["env"] != report["env"]:
+        print("⚠️ Baseline recorded on a different machine / library versions")
+    print(f"✓ Report written → {report_path}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) over {args.threshold}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# ============================================================
+# Incremental build cache
+# - Inputs (Parquet files, tracts, networks, config) fingerprinted
+#   into a build manifest under CACHE_DIR
+# - Leg table (de)serialization for the stage checkpoints
+# - Per-OD outputs skipped when their fingerprint and files are intact
+# ============================================================
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 2     # 2: legs carry route endpoint columns
+MANIFEST_NAME = "build_manifest.json"
+
+# =========================
+# FINGERPRINTS
+# =========================
+def fingerprint(obj):
+    """Short sha256 of a JSON-serializable value (key order independent)"""
+    blob = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return {"path": path.replace("\\", "/"), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def od_key(od):
+    return f"{od[0]}_to_{od[1]}"
+
+# =========================
+# LEG TABLES (route_xy stored as CSR offsets + flat coords)
+# =========================
+def save_legs(folder, df):
+    os.makedirs(folder, exist_ok=True)
+    routes = [r if r is not None else np.empty((0, 2)) for r in df["route_xy"]]
+    lens = np.array([len(r) for r in routes], dtype=np.int64)
+    offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+    np.cumsum(lens, out=offsets[1:])
+    coords = np.concatenate(routes) if routes else np.empty((0, 2), dtype=np.float64)
+
+    df.drop(columns=["route_xy"]).reset_index(drop=True).to_parquet(
+        os.path.join(folder, "legs.parquet"), index=False
+    )
+    np.save(os.path.join(folder, "route_offsets.npy"), offsets)
+    np.save(os.path.join(folder, "route_coords.npy"), coords)
+
+
+def load_legs(folder):
+    df = pd.read_parquet(os.path.join(folder, "legs.parquet"))
+    offsets = np.load(os.path.join(folder, "route_offsets.npy"))
+    coords = np.load(os.path.join(folder, "route_coords.npy"))
+
+    routes = np.empty(len(df), dtype=object)
+    for i in range(len(df)):
+        routes[i] = coords[offsets[i]:offsets[i + 1]]
+    df["route_xy"] = routes
+    return df
+
+# =========================
+# CACHE
+# =========================
+class BuildCache:
+    """
+    Build manifest under `cache_dir`.
+
+    `data` fingerprints everything the legs depend on (Parquet files,
+    tracts, networks); `config` adds what the per-OD outputs depend on
+    on top of that (distance threshold, ...). OD outputs are reused
+    when the combined fingerprint matches and their files still exist.
+    """
+
+    def __init__(self, root, data, config, reset=False):
+        self.root = root
+        self.reset = reset
+        self.data_fp = fingerprint({"version": CACHE_VERSION, "data": data})
+        self.build_fp = fingerprint({"data": self.data_fp, "config": config})
+        self.inputs = {"data": data, "config": config}
+
+        self.ods = {}            # od key → {"fingerprint", "count", "files", "bbox"}
+        self.all_ods = None      # {"fingerprint", "counts"} of the last all-OD run
+        if not reset:
+            self._load()
+
+    @classmethod
+    def open(cls, cache_dir, data, config, reset=False):
+        """Open the build cache; `reset` ignores everything cached so far"""
+        root = os.path.join(cache_dir, f"build_v{CACHE_VERSION}")
+        os.makedirs(root, exist_ok=True)
+        return cls(root, data, config, reset=reset)
+
+    # -------------------------
+    # manifest
+    # -------------------------
+    def _manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path()):
+            return
+        with open(self._manifest_path(), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            return
+        self.ods = meta.get("ods", {})
+        self.all_ods = meta.get("all_ods")
+
+    def save(self):
+        meta = {
+            "schema": "nova.complete_trip.build_cache.v1",
+            "version": CACHE_VERSION,
+            "data_fingerprint": self.data_fp,
+            "build_fingerprint": self.build_fp,
+            "inputs": self.inputs,
+            "all_ods": self.all_ods,
+            "ods": self.ods
+        }
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self._manifest_path())
+
+    # -------------------------
+    # per-OD outputs
+    # -------------------------
+    def known_ods(self, min_count=1):
+        """All ODs of the last all-OD run with these inputs (None if unknown)"""
+        if not self.all_ods or self.all_ods.get("fingerprint") != self.build_fp:
+            return None
+        return sorted(
+            tuple(k.split("_to_")) for k, n in self.all_ods["counts"].items() if n >= min_count
+        )
+
+    def record_all(self, counts):
+        """Linked trip count of every OD found by an all-OD run"""
+        self.all_ods = {
+            "fingerprint": self.build_fp,
+            "counts": {od_key(od): int(n) for od, n in counts.items()}
+        }
+
+    def cached(self, od):
+        """Manifest entries of `od`'s output files if they can be reused"""
+        entry = self.ods.get(od_key(od))
+        if not entry or entry.get("fingerprint") != self.build_fp:
+            return None
+        for e in entry["files"]:
+            if not os.path.exists(e["path"]) or os.path.getsize(e["path"]) != e["bytes"]:
+                return None
+        return entry
+
+    def stale(self, ods):
+        return [od for od in ods if self.cached(od) is None]
+
+    def record(self, od, count, files, bbox=None):
+        self.ods[od_key(od)] = {
+            "fingerprint": self.build_fp, "count": int(count), "files": files, "bbox": bbox
+        }
@@ -1,7 +1,23 @@
-import pandas as pd
+# ============================================================
+# v1 sample builder (selected_linked_trips.csv → samples.json)
+# - column-at-a-time: bulk WKT parse, whole-column datetimes,
+#   vectorized mode normalization and NaN → null per column
+# - scalars JSON-encoded a column chunk at a time and streamed into
+#   a fixed sample template; output byte-identical to the old
+#   iterrows() + json.dump(indent=2) builder (nova.complete_trip.sample.v1)
+# ============================================================
+
 import json
-from shapely import wkt
+import os
 from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from json_stream import write_doc
+from run_report import RunReport
 
 # =========================
 # Paths
@@ -9,69 +25,105 @@ from datetime import datetime
 CSV_PATH = "./data/samples/selected_linked_trips.csv"
 OUT_JSON = "./data/samples/samples.json"
 
+SCHEMA = "nova.complete_trip.sample.v1"
+
+# True → minified samples.json through json_stream; JSON_BACKEND "orjson" opts in
+# to orjson (faster, but writes NaN / inf as null instead of failing)
+COMPACT = False
+JSON_BACKEND = None
+MAX_ROUTE_POINTS = 400        # longer routes keep every 3rd point (demo)
+
+# run report (time / peak RSS / rows per stage); PROFILE: "cprofile" / "pyinstrument"
+RUN_REPORT = "./data/cache/reports/build_samples.json"
+PROFILE = os.environ.get("NOVA_PROFILE")
+
 # =========================
 # Load data
 # =========================
-df = pd.read_csv(CSV_PATH)
+def load_csv(path):
+    df = pd.read_csv(path)
 
-# 统一把所有 NaN → None，保证 JSON 不会出现 NaN
-df = df.where(pd.notnull(df), None)
+    # 统一把所有 NaN → None，保证 JSON 不会出现 NaN
+    df = df.where(pd.notnull(df), None)
 
-# 强制字符串 ID（安全）
-df["trip_id"] = df["trip_id"].astype(str)
+    # 强制字符串 ID（安全）
+    df["trip_id"] = df["trip_id"].astype(str)
+    return df
 
 # =========================
 # Geometry parser
 # =========================
-def parse_geometry(wkt_str, trip_id):
-    """Parse LINESTRING WKT → [[lat, lng], ...] for Leaflet"""
-    if not isinstance(wkt_str, str) or not wkt_str.startswith("LINESTRING"):
-        print(f"[WARN] Invalid geometry for trip {trip_id}")
-        return None
+def parse_geometries(wkt_values, trip_ids, drops=None):
+    """
+    LINESTRING WKT column → (ok mask, [lat, lng] points, per-row offsets
+    into the points of the ok rows). Rows that are not ok are skipped
+    (counted per reason in `drops`).
+    """
+    wkt_arr = np.asarray(wkt_values, dtype=object)
+    is_line = np.fromiter(
+        (isinstance(w, str) and w.startswith("LINESTRING") for w in wkt_arr),
+        dtype=bool, count=len(wkt_arr)
+    )
+    geoms = np.full(len(wkt_arr), None, dtype=object)
+    geoms[is_line] = shapely.from_wkt(wkt_arr[is_line], on_invalid="ignore")
+    # 3D coordinates never unpacked into (lng, lat) in the row builder
+    ok = is_line & ~shapely.is_missing(geoms) & ~shapely.has_z(geoms)
 
-    try:
-        geom = wkt.loads(wkt_str)
-        coords = [[lat, lng] for lng, lat in geom.coords]
-
-        # 简单抽稀（demo）
-        if len(coords) > 400:
-            coords = coords[::3]
-
-        return coords
-
-    except Exception as e:
-        print(f"[ERROR] Geometry parse failed for {trip_id}: {e}")
-        return None
+    for i in np.flatnonzero(~is_line):
+        print(f"[WARN] Invalid geometry for trip {trip_ids[i]}")
+    for i in np.flatnonzero(is_line & ~ok):
+        print(f"[ERROR] Geometry parse failed for {trip_ids[i]}")
+    if drops is not None:
+        drops["not_linestring"] = int((~is_line).sum())
+        drops["geometry_parse_failed"] = int((is_line & ~ok).sum())
 
+    coords, row = shapely.get_coordinates(geoms[ok], return_index=True)
+    offsets = np.zeros(int(ok.sum()) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row, minlength=len(offsets) - 1), out=offsets[1:])
+    return ok, coords[:, ::-1], offsets
 
 # =========================
 # Duration (minutes)
 # =========================
-def compute_duration_min(row):
+def compute_duration_min(t0, t1):
     try:
-        t0 = pd.to_datetime(row["local_datetime_start"])
-        t1 = pd.to_datetime(row["local_datetime_end"])
+        t0 = pd.to_datetime(t0)
+        t1 = pd.to_datetime(t1)
         return round((t1 - t0).total_seconds() / 60, 1)
     except Exception:
         return None
 
 
+def duration_min(start, end):
+    """Whole-column durations; values the column parse rejects go through the scalar path"""
+    start = pd.Series(start, dtype=object)
+    end = pd.Series(end, dtype=object)
+    try:
+        t0 = pd.to_datetime(start, errors="coerce")
+        t1 = pd.to_datetime(end, errors="coerce")
+        minutes = ((t1 - t0).dt.total_seconds() / 60).to_numpy(dtype=np.float64)
+        retry = (t0.isna() & start.notna()) | (t1.isna() & end.notna())
+    except (TypeError, ValueError):           # e.g. mixed UTC offsets
+        minutes = np.full(len(start), np.nan)
+        retry = pd.Series(True, index=start.index)
+
+    out = [None if m != m else round(m, 1) for m in minutes.tolist()]
+    for i in np.flatnonzero(retry.to_numpy() & (start.notna() & end.notna()).to_numpy()):
+        out[i] = clean(compute_duration_min(start.iat[i], end.iat[i]))
+    return out
+
 # =========================
 # Mode normalization
 # =========================
-def normalize_mode(m):
-    if not isinstance(m, str):
-        return "unknown"
-
-    m = m.lower()
-    if m == "rail":
-        return "rail"
-    if m == "bus":
-        return "bus"
-    if "walk" in m or "bike" in m:
-        return "walk_bike"
-    return "other"
-
+def normalize_mode(modes):
+    modes = pd.Series(modes, dtype=object)
+    is_str = np.fromiter((isinstance(m, str) for m in modes), dtype=bool, count=len(modes))
+    lower = modes.where(is_str, "").astype(str).str.lower()
+    return np.select(
+        [~is_str, lower == "rail", lower == "bus", lower.str.contains("walk|bike")],
+        ["unknown", "rail", "bus", "walk_bike"],
+        "other"
+    )
 
 # =========================
 # Helper: ensure no NaN sneaks in
@@ -85,73 +137,198 @@ def clean(x):
     return x
 
 
+def column(df, name, rows):
+    """Column values of `rows` as Python objects, NaN → None (missing column → all None)"""
+    if name not in df:
+        return [None] * len(rows)
+    s = df[name]
+    values = s.to_numpy(dtype=object)
+    values[s.isna().to_numpy()] = None
+    return values[rows].tolist()
+
 # =========================
 # Build samples
 # =========================
-samples = []
-
-for _, r in df.iterrows():
-    route = parse_geometry(r["full_geometry_wkt"], r["trip_id"])
-    if route is None:
-        continue
-
-    duration = compute_duration_min(r)
-
-    sample = {
-        "id": r["trip_id"],
-        "mode": normalize_mode(r["travel_mode"]),
-        "route": route,
-
-        # ===== Numeric attributes =====
-        "duration_min": clean(duration),
-        "network_distance_km": clean(r.get("network_distance")),
-        "route_distance_km": clean(r.get("route_distance")),
-
-        # ===== OD =====
-        "origin": {
-            "lon": clean(r.get("orig_lon")),
-            "lat": clean(r.get("orig_lat")),
-            "geohash": clean(r.get("geohash7_orig"))
-        },
-        "destination": {
-            "lon": clean(r.get("dest_lon")),
-            "lat": clean(r.get("dest_lat")),
-            "geohash": clean(r.get("geohash7_dest"))
-        },
-
-        # ===== Transit context =====
-        "access": {
-            "stop_id": clean(r.get("access_stop_id")),
-            "stop_name": clean(r.get("access_stop"))
-        },
-        "egress": {
-            "stop_id": clean(r.get("egress_stop_id")),
-            "stop_name": clean(r.get("egress_stop"))
-        },
-
-        # ===== Metadata =====
-        "meta": {
-            "linked_trip_id": clean(r.get("linked_trip_id")),
-            "tour_id": clean(r.get("tour_id")),
-            "purpose": clean(r.get("trip_purpose")),
-            "weight": clean(r.get("trip_weight")),
-            "trip_count": clean(r.get("trip_count"))
-        }
-    }
+# sample field → CSV column (None when the column is missing)
+CSV_FIELDS = {
+    "network_distance_km": "network_distance",
+    "route_distance_km": "route_distance",
+    "origin_lon": "orig_lon", "origin_lat": "orig_lat", "origin_geohash": "geohash7_orig",
+    "dest_lon": "dest_lon", "dest_lat": "dest_lat", "dest_geohash": "geohash7_dest",
+    "access_stop_id": "access_stop_id", "access_stop_name": "access_stop",
+    "egress_stop_id": "egress_stop_id", "egress_stop_name": "egress_stop",
+    "linked_trip_id": "linked_trip_id", "tour_id": "tour_id", "purpose": "trip_purpose",
+    "weight": "trip_weight", "trip_count": "trip_count",
+}
 
-    samples.append(sample)
+
+def thin_routes(points, offsets):
+    """简单抽稀（demo）: routes over MAX_ROUTE_POINTS keep every 3rd point"""
+    counts = np.diff(offsets)
+    pos = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    keep = np.repeat(counts <= MAX_ROUTE_POINTS, counts) | (pos % 3 == 0)
+    kept = np.bincount(np.repeat(np.arange(len(counts)), counts)[keep], minlength=len(counts))
+    out = np.zeros_like(offsets)
+    np.cumsum(kept, out=out[1:])
+    return points[keep], out
+
+
+def build_samples(df, drops=None):
+    """
+    Sample columns for every row with a valid route (CSV order):
+    (fields, [lat, lng] route points, per-sample offsets into them).
+    """
+    trip_ids = df["trip_id"].to_numpy(dtype=object)
+    ok, points, offsets = parse_geometries(df["full_geometry_wkt"].to_numpy(dtype=object), trip_ids, drops)
+    rows = np.flatnonzero(ok)
+    points, offsets = thin_routes(points, offsets)
+
+    fields = {
+        "id": trip_ids[rows].tolist(),
+        "mode": normalize_mode(df["travel_mode"].to_numpy(dtype=object)[rows]).tolist(),
+        "duration_min": duration_min(
+            column(df, "local_datetime_start", rows), column(df, "local_datetime_end", rows)
+        ),
+    }
+    for key, name in CSV_FIELDS.items():
+        fields[key] = column(df, name, rows)
+    return fields, points, offsets
 
 # =========================
-# Output JSON
+# Output JSON (json.dump(indent=2) bytes, written per chunk)
 # =========================
-out = {
-    "schema": "nova.complete_trip.sample.v1",
-    "generated_at": datetime.utcnow().isoformat() + "Z",
-    "count": len(samples),
-    "samples": samples
-}
+SAMPLE = """    {
+      "id": %(id)s,
+      "mode": %(mode)s,
+      "route": %(route)s,
+      "duration_min": %(duration_min)s,
+      "network_distance_km": %(network_distance_km)s,
+      "route_distance_km": %(route_distance_km)s,
+      "origin": {
+        "lon": %(origin_lon)s,
+        "lat": %(origin_lat)s,
+        "geohash": %(origin_geohash)s
+      },
+      "destination": {
+        "lon": %(dest_lon)s,
+        "lat": %(dest_lat)s,
+        "geohash": %(dest_geohash)s
+      },
+      "access": {
+        "stop_id": %(access_stop_id)s,
+        "stop_name": %(access_stop_name)s
+      },
+      "egress": {
+        "stop_id": %(egress_stop_id)s,
+        "stop_name": %(egress_stop_name)s
+      },
+      "meta": {
+        "linked_trip_id": %(linked_trip_id)s,
+        "tour_id": %(tour_id)s,
+        "purpose": %(purpose)s,
+        "weight": %(weight)s,
+        "trip_count": %(trip_count)s
+      }
+    }"""
+POINT = "        [\n          %s,\n          %s\n        ]"
+CHUNK = 50_000
+
+
+def _encoded(values):
+    """JSON text of each scalar, one C-encoder call (newlines never occur inside a value)"""
+    return json.dumps(values, separators=("\n", ": "))[1:-1].split("\n") if values else []
+
+
+@lru_cache(maxsize=None)
+def _route_template(n):
+    return "[\n" + ",\n".join([POINT] * n) + "\n      ]" if n else "[]"
+
+
+def render_samples(fields, points, offsets):
+    """JSON text of each sample, as nested by json.dump(..., indent=2)"""
+    n = len(fields["id"])
+    for a in range(0, n, CHUNK):
+        b = min(a + CHUNK, n)
+        enc = {k: _encoded(v[a:b]) for k, v in fields.items()}
+        coords = _encoded(points[offsets[a]:offsets[b]].ravel().tolist())
+        ends = (2 * (offsets[a:b + 1] - offsets[a])).tolist()
+        for k in range(b - a):
+            row = {key: values[k] for key, values in enc.items()}
+            row["route"] = _route_template((ends[k + 1] - ends[k]) // 2) % tuple(coords[ends[k]:ends[k + 1]])
+            yield SAMPLE % row
+
+
+def iter_samples(fields, points, offsets):
+    """v1 sample dicts, one at a time"""
+    for k in range(len(fields["id"])):
+        v = {key: values[k] for key, values in fields.items()}
+        yield {
+            "id": v["id"],
+            "mode": v["mode"],
+            "route": points[offsets[k]:offsets[k + 1]].tolist(),
+            "duration_min": v["duration_min"],
+            "network_distance_km": v["network_distance_km"],
+            "route_distance_km": v["route_distance_km"],
+            "origin": {"lon": v["origin_lon"], "lat": v["origin_lat"], "geohash": v["origin_geohash"]},
+            "destination": {"lon": v["dest_lon"], "lat": v["dest_lat"], "geohash": v["dest_geohash"]},
+            "access": {"stop_id": v["access_stop_id"], "stop_name": v["access_stop_name"]},
+            "egress": {"stop_id": v["egress_stop_id"], "stop_name": v["egress_stop_name"]},
+            "meta": {
+                "linked_trip_id": v["linked_trip_id"],
+                "tour_id": v["tour_id"],
+                "purpose": v["purpose"],
+                "weight": v["weight"],
+                "trip_count": v["trip_count"]
+            }
+        }
+
+
+def write_samples(path, fields, points, offsets, generated_at, compact=False, backend=None):
+    count = len(fields["id"])
+    head = {"schema": SCHEMA, "generated_at": generated_at, "count": count}
+    with open(path, "w", encoding="utf-8") as f:
+        if compact:
+            doc = {**head, "samples": iter_samples(fields, points, offsets)}
+            return write_doc(f, doc, "samples", compact=True, backend=backend)
+
+        f.write(json.dumps(head, indent=2)[:-2] + ",\n")
+        if not count:
+            f.write('  "samples": []\n}')
+            return count
+        f.write('  "samples": [\n')
+        for n, text in enumerate(render_samples(fields, points, offsets)):
+            f.write(",\n" + text if n else text)
+        f.write("\n  ]\n}")
+    return count
+
+
+def main():
+    report = RunReport("build_samples", profile=PROFILE, profile_dir="./data/cache/reports/profile")
+    with report.stage("load") as st:
+        df = load_csv(CSV_PATH)
+        st.rows(rows_out=len(df))
+
+    with report.stage("geometry", rows_in=len(df)) as st:
+        drops = {}
+        fields, points, offsets = build_samples(df, drops)
+        for reason, n in drops.items():
+            st.drop(reason, n)
+        st.note("route_points", len(points))
+        st.rows(rows_out=len(fields["id"]))
+
+    with report.stage("export", rows_in=len(fields["id"])) as st:
+        count = write_samples(
+            OUT_JSON, fields, points, offsets, datetime.utcnow().isoformat() + "Z",
+            compact=COMPACT, backend=JSON_BACKEND
+        )
+        st.note("bytes", os.path.getsize(OUT_JSON))
+        st.rows(rows_out=count)
+    print(f"✅ Saved {count} samples → {OUT_JSON}")
+
+    print(report.summary())
+    report.write(RUN_REPORT)
+    print(f"✓ Run report written → {RUN_REPORT}")
 
-with open(OUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(out, f, indent=2)
 
-print(f"✅ Saved {len(samples)} samples → {OUT_JSON}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# ============================================================
+# Check: route_simplify vs GEOS (shapely.simplify, no topology)
+# - One batched dp_importance pass, every level = a threshold on it;
+#   each level compared point for point with GEOS on the same local
+#   meter coordinates
+# - Random walks plus grid-snapped lines (equally far points → ties),
+#   repeated points and closed lines
+#
+#   python data/samples/check_route_simplify.py [N_ROUTES]
+# ============================================================
+
+import sys
+import time
+
+import numpy as np
+import shapely
+
+from route_simplify import dp_importance, local_meters
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+TOLERANCES = [1.0, 3.0, 5.0, 10.0, 25.0]
+
+# =========================
+# DATA (Salt Lake, ~10 m steps)
+# =========================
+rng = np.random.default_rng(42)
+routes = []
+for i in range(N):
+    n = int(rng.integers(2, 120))
+    kind = i % 4
+    if kind == 0:      # random walk
+        step = rng.normal(0, 1e-4, (n, 2))
+    elif kind == 1:    # grid-snapped walk: many exact ties
+        step = rng.integers(-2, 3, (n, 2)) * 1e-4
+    elif kind == 2:    # repeated points
+        step = np.repeat(rng.normal(0, 1e-4, (n, 2)), rng.integers(1, 3, n), axis=0)
+        step[1:][rng.random(len(step) - 1) < 0.5] = 0.0
+    else:              # closed
+        step = rng.normal(0, 1e-4, (n, 2))
+        step = np.vstack([step, [[0.0, 0.0]]])
+    pts = np.array([-111.89, 40.76]) + np.cumsum(step, axis=0)
+    if kind == 3:
+        pts[-1] = pts[0]
+    routes.append(pts)
+
+offsets = np.zeros(N + 1, dtype=np.int64)
+np.cumsum([len(r) for r in routes], out=offsets[1:])
+lonlat = np.concatenate(routes)
+
+# =========================
+# RUN
+# =========================
+t0 = time.perf_counter()
+imp = dp_importance(lonlat, offsets, min(TOLERANCES))
+t_dp = time.perf_counter() - t0
+
+xy = local_meters(lonlat, offsets)
+lines = shapely.linestrings(xy, indices=np.repeat(np.arange(N), np.diff(offsets)))
+
+mismatch = {}
+t_geos = 0.0
+for tol in TOLERANCES:
+    t0 = time.perf_counter()
+    ref = shapely.simplify(lines, tol, preserve_topology=False)
+    t_geos += time.perf_counter() - t0
+    bad = 0
+    for i in range(N):
+        a, b = offsets[i], offsets[i + 1]
+        ours = xy[a:b][imp[a:b] > tol]
+        if not np.array_equal(ours, shapely.get_coordinates(ref[i])):
+            bad += 1
+    mismatch[tol] = bad
+
+print(f"{N:,} routes / {len(lonlat):,} points, tolerances {TOLERANCES} m")
+print(f"dp_importance (all levels) : {t_dp:8.3f} s")
+print(f"GEOS simplify (per level)  : {t_geos:8.3f} s")
+print(f"routes differing per level : {mismatch}")
+print(f"identical to GEOS          : {not any(mismatch.values())}")
+sys.exit(1 if any(mismatch.values()) else 0)
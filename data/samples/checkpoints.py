@@ -0,0 +1,201 @@
+# ============================================================
+# Stage checkpoints for the staged sample builder
+# - one folder per stage under CACHE_DIR/checkpoints, written to a
+#   temp folder and renamed; meta.json (fingerprint, rows) written last
+# - a checkpoint is valid while its fingerprint (stage inputs +
+#   upstream fingerprints) matches
+# - leg tables as Parquet (routes: CSR offsets + flat coords, see
+#   build_cache.save_legs); linked trips as nested Arrow structs,
+#   one Parquet row group per OD, plus their od_stats summary arrays
+# ============================================================
+
+import json
+import os
+import shutil
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from od_stats import SUMMARY_FIELDS, concat_summaries
+
+CHECKPOINT_VERSION = 2
+META_NAME = "meta.json"
+
+# =========================
+# STORE
+# =========================
+class CheckpointStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def folder(self, stage):
+        return os.path.join(self.root, stage)
+
+    def meta(self, stage):
+        try:
+            with open(os.path.join(self.folder(stage), META_NAME), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CHECKPOINT_VERSION else None
+
+    def valid(self, stage, fp):
+        meta = self.meta(stage)
+        return meta is not None and meta.get("fingerprint") == fp
+
+    @contextmanager
+    def write(self, stage, fp):
+        """
+        `with store.write(stage, fp) as (folder, meta):` fill `folder`,
+        optionally add to `meta`; committed only when the block succeeds
+        """
+        final = self.folder(stage)
+        tmp = final + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        meta = {}
+        yield tmp, meta
+
+        meta = {
+            "schema": "nova.complete_trip.checkpoint.v1",
+            "version": CHECKPOINT_VERSION,
+            "stage": stage,
+            "fingerprint": fp,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            **meta,
+        }
+        with open(os.path.join(tmp, META_NAME), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+# =========================
+# TABLES
+# =========================
+def save_table(folder, df):
+    df.reset_index(drop=True).to_parquet(os.path.join(folder, "table.parquet"), index=False)
+    return len(df)
+
+
+def load_table(folder):
+    return pd.read_parquet(os.path.join(folder, "table.parquet"))
+
+# =========================
+# LINKED TRIPS (build_linked_trips dicts, field order kept)
+# =========================
+def linked_trip_schema(id_type=pa.string(), tour_id_type=pa.int64()):
+    """
+    Arrow schema of one linked trip dict; `id_type` / `tour_id_type`
+    follow the delivery (passed through unchanged by the builder)
+    """
+    f64, s = pa.float64(), pa.string()
+    point = [("lon", f64), ("lat", f64), ("geohash", s)]
+    stop = pa.struct([("stop_id", f64), ("stop_name", s)])
+    leg = pa.struct([
+        ("id", s),
+        ("mode", s),
+        ("route", pa.list_(pa.list_(f64))),
+        ("start_time", s),
+        ("end_time", s),
+        ("duration_min", f64),
+        ("network_distance_km", f64),
+        ("route_distance_km", f64),
+        ("origin", pa.struct(point)),
+        ("destination", pa.struct(point)),
+        ("access", stop),
+        ("egress", stop),
+        ("meta", pa.struct([
+            ("linked_trip_id", id_type),
+            ("tour_id", tour_id_type),
+            ("purpose", s),
+            ("weight", f64),
+        ])),
+        ("leg_index", pa.int64()),
+    ])
+    return pa.schema([
+        ("linked_trip_id", id_type),
+        ("origin", pa.struct(point + [("start_time", s)])),
+        ("destination", pa.struct(point + [("end_time", s)])),
+        ("transfers", pa.list_(pa.struct([("lat", f64), ("lon", f64), ("geohash", s)]))),
+        ("legs", pa.list_(leg)),
+        ("weight", f64),
+    ])
+
+
+def save_linked_trips(folder, partitions, schema):
+    """
+    Per-OD linked trips (od → trips mapping with count / summary, read
+    one OD at a time) → linked_trips.parquet + summary.parquet + ods.json
+    (empty ODs kept)
+    """
+    path = os.path.join(folder, "linked_trips.parquet")
+    ods = []
+    summaries = []
+    total = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for od in partitions:
+            trips = partitions[od]
+            if trips:
+                writer.write_table(pa.Table.from_pylist(trips, schema=schema), row_group_size=len(trips))
+            ods.append({"origin": od[0], "destination": od[1], "count": len(trips)})
+            summaries.append(partitions.summary(od))
+            total += len(trips)
+            del trips
+    pq.write_table(pa.table(concat_summaries(summaries)), os.path.join(folder, "summary.parquet"))
+    with open(os.path.join(folder, "ods.json"), "w", encoding="utf-8") as f:
+        json.dump(ods, f)
+    return total
+
+
+class SavedPartitions(Mapping):
+    """
+    A loaded assembly checkpoint: od → linked trip dicts in saved order,
+    one OD (Parquet row group) read at a time; counts and stats
+    summaries are in memory.
+    """
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, "ods.json"), "r", encoding="utf-8") as f:
+            ods = json.load(f)
+        self._pf = pq.ParquetFile(os.path.join(folder, "linked_trips.parquet"))
+        summary = pq.read_table(os.path.join(folder, "summary.parquet"))
+        columns = {k: summary.column(k).to_numpy() for k in SUMMARY_FIELDS}
+
+        self._ods = {}         # od → (row group or None, count, summary)
+        group = start = 0
+        for e in ods:
+            n = e["count"]
+            part = {k: v[start:start + n] for k, v in columns.items()}
+            self._ods[(e["origin"], e["destination"])] = (group if n else None, n, part)
+            group += n > 0
+            start += n
+
+    def __getitem__(self, od):
+        group = self._ods[od][0]
+        return [] if group is None else self._pf.read_row_group(group).to_pylist()
+
+    def __iter__(self):
+        return iter(self._ods)
+
+    def __len__(self):
+        return len(self._ods)
+
+    def count(self, od):
+        return self._ods[od][1]
+
+    def summary(self, od):
+        return self._ods[od][2]
+
+
+def load_linked_trips(folder):
+    """od → linked trip dicts, read lazily (see SavedPartitions)"""
+    return SavedPartitions(folder)
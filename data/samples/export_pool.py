@@ -0,0 +1,199 @@
+# ============================================================
+# Parallel per-OD export
+# - Output files sharded across a process pool (size-balanced)
+# - Every file written atomically (temp file + rename)
+# - Compact files get pre-compressed .gz / .br siblings
+# - "stream" files written one linked trip at a time (json_stream)
+# - Final manifest: path, bytes and trip count of every file
+# ============================================================
+
+import gzip
+import json
+import os
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from json_stream import write_doc
+
+try:
+    import brotli
+except ImportError:        # .br siblings are skipped without it
+    brotli = None
+
+# jobs visible to forked workers without pickling the payloads
+_JOBS = []
+_BACKEND = None            # json_stream backend of the current export
+
+# =========================
+# ATOMIC WRITE
+# =========================
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# mkstemp creates 0600; published files get what open() would give them
+_FILE_MODE = 0o666 & ~_umask()
+
+
+def _mode_of(path):
+    """Mode of the file being replaced, else the umask default"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except OSError:
+        return _FILE_MODE
+
+
+def _atomic(path, write, binary=False):
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w", encoding=None if binary else "utf-8") as f:
+            write(f)
+        os.chmod(tmp, _mode_of(path))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return os.path.getsize(path)
+
+
+def write_json_atomic(path, obj, indent=2):
+    """json.dump into a temp file next to `path`, then rename; returns bytes"""
+    return _atomic(path, lambda f: json.dump(obj, f, indent=indent, allow_nan=False))
+
+
+def write_json_stream(path, doc, key="linked_trips", compact=False, backend=None):
+    """`doc` with doc[key] written one element at a time; returns bytes"""
+    return _atomic(path, lambda f: write_doc(f, doc, key, compact=compact, backend=backend))
+
+
+def write_bytes_atomic(path, data):
+    return _atomic(path, lambda f: f.write(data), binary=True)
+
+
+def write_stream_atomic(path, write, binary=False):
+    """`write(f)` into a temp file next to `path`, then rename; returns bytes"""
+    return _atomic(path, write, binary=binary)
+
+
+def write_json_compact(path, obj):
+    """
+    Minified JSON plus path.gz (and path.br with brotli installed);
+    returns the byte size of each file.
+    """
+    data = json.dumps(obj, separators=(",", ":"), allow_nan=False).encode("utf-8")
+    sizes = {"bytes": write_bytes_atomic(path, data)}
+    sizes["gzip_bytes"] = write_bytes_atomic(path + ".gz", gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        sizes["br_bytes"] = write_bytes_atomic(path + ".br", brotli.compress(data, quality=11))
+    return sizes
+
+# =========================
+# WORKERS
+# =========================
+def _write_job(job, backend=None):
+    path, obj, trip_count = job[:3]
+    if callable(obj):          # encoded in the worker
+        obj = obj()
+    fmt = job[3] if len(job) > 3 else None
+    if fmt == "compact":
+        sizes = write_json_compact(path, obj)
+    elif fmt in ("stream", "stream-compact"):
+        sizes = {"bytes": write_json_stream(path, obj, compact=fmt == "stream-compact", backend=backend)}
+    else:
+        sizes = {"bytes": write_json_atomic(path, obj)}
+    return {"path": path, **sizes, "trip_count": trip_count}
+
+
+def _write_shard(shard):
+    return [_write_job(_JOBS[i], _BACKEND) for i in shard]
+
+
+def _write_jobs(part):
+    # spawn workers: the shard's jobs arrive pickled
+    jobs, backend = part
+    return [_write_job(job, backend) for job in jobs]
+
+
+def _shards(jobs, n):
+    """Largest-first greedy split of job indices into n shards"""
+    order = sorted(range(len(jobs)), key=lambda i: -jobs[i][2])
+    shards = [[] for _ in range(n)]
+    load = [0] * n
+    for i in order:
+        k = load.index(min(load))
+        shards[k].append(i)
+        load[k] += jobs[i][2] + 1
+    return [s for s in shards if s]
+
+
+def _pool_context():
+    # fork shares the job list; spawn (Windows, macOS default) re-imports
+    # __main__, so the calling script must sit behind a __main__ guard
+    if "fork" in mp.get_all_start_methods():
+        return mp.get_context("fork")
+    return mp.get_context("spawn")
+
+# =========================
+# EXPORT
+# =========================
+def export_files(jobs, workers=None, manifest_path=None, json_backend=None):
+    """
+    Write (path, obj, trip_count[, format]) jobs, in parallel when
+    possible. `obj` may be a zero-argument callable that builds the
+    document. Formats: "compact" → minified JSON + compressed siblings;
+    "stream" / "stream-compact" → obj["linked_trips"] written one trip
+    at a time with `json_backend` (None → stdlib json; "orjson" opts in).
+
+    `workers` defaults to the CPU count; 1 writes in-process. Without
+    fork, shards are pickled to spawn workers (jobs must be picklable:
+    partials of module-level functions). Returns the manifest entries
+    in job order.
+    """
+    global _JOBS, _BACKEND
+    workers = workers or os.cpu_count() or 1
+    ctx = _pool_context()
+
+    if workers <= 1 or len(jobs) <= 1:
+        entries = [_write_job(job, json_backend) for job in jobs]
+    else:
+        shards = _shards(jobs, workers)
+        if ctx.get_start_method() == "fork":
+            fn, parts = _write_shard, shards
+        else:
+            fn, parts = _write_jobs, [([jobs[i] for i in s], json_backend) for s in shards]
+        _JOBS, _BACKEND = jobs, json_backend
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                done = {}
+                for part in pool.map(fn, parts):
+                    for e in part:
+                        done[e["path"]] = e
+        finally:
+            _JOBS, _BACKEND = [], None
+        entries = [done[job[0]] for job in jobs]
+
+    if manifest_path:
+        write_manifest(manifest_path, entries)
+    return entries
+
+
+def write_manifest(manifest_path, entries):
+    """Manifest of output files (paths relative to the manifest)"""
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    return write_json_atomic(manifest_path, {
+        "schema": "nova.complete_trip.manifest.v1",
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "files": [
+            {**e, "path": os.path.relpath(e["path"], root)}
+            for e in entries
+        ],
+        "total_bytes": sum(e["bytes"] for e in entries),
+        "total_files": len(entries)
+    })
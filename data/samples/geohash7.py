@@ -0,0 +1,147 @@
+# ============================================================
+# Vectorized geohash7 codec (NumPy)
+# - Whole arrays at once, no per-value Python
+# - Invalid / missing codes → NaN
+# - Integer form: 35-bit code (lon/lat interleaved, lon first)
+# ============================================================
+
+import numpy as np
+
+# =========================
+# CONSTANTS
+# =========================
+GH_LEN = 7
+GH_LON_BITS = 18
+GH_LAT_BITS = 17
+GH_DLON = 360.0 / (1 << GH_LON_BITS)
+GH_DLAT = 180.0 / (1 << GH_LAT_BITS)
+
+_BASE32 = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype=np.uint8)
+
+_DECODE = np.full(256, 255, dtype=np.uint8)
+_DECODE[_BASE32] = np.arange(32, dtype=np.uint8)
+_DECODE[np.frombuffer(b"0123456789BCDEFGHJKMNPQRSTUVWXYZ", dtype=np.uint8)] = np.arange(32, dtype=np.uint8)
+
+INVALID = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# =========================
+# BIT HELPERS
+# =========================
+def _compact_even_bits(x):
+    """Keep bits 0, 2, 4, ... of x and pack them together"""
+    x = x & np.uint64(0x5555555555555555)
+    x = (x | (x >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    x = (x | (x >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return x
+
+
+def _spread_even_bits(x):
+    """Inverse of _compact_even_bits"""
+    x = x & np.uint64(0x00000000FFFFFFFF)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x3333333333333333)
+    x = (x | (x << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return x
+
+
+def _as_bytes(values):
+    """Strings → fixed-width S8 (8th byte set ⇔ longer than 7 chars)"""
+    arr = np.asarray(values)
+    try:
+        return arr.astype("S8")
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return np.array(
+            [v.encode("ascii", "replace") if isinstance(v, str) else b"" for v in arr.ravel()],
+            dtype="S8"
+        )
+
+# =========================
+# CODES
+# =========================
+def to_codes(values):
+    """
+    geohash7 strings → uint64 35-bit codes.
+
+    Missing, short, long or non-base32 values become INVALID.
+    """
+    buf = _as_bytes(values).ravel()
+    # one contiguous row per character position
+    raw = np.ascontiguousarray(buf.view(np.uint8).reshape(-1, 8).T)
+
+    digits = _DECODE[raw[:GH_LEN]]
+    valid = (np.bitwise_or.reduce(digits, axis=0) < 32) & (raw[GH_LEN] == 0)
+
+    codes = digits[0].astype(np.uint64)
+    for i in range(1, GH_LEN):
+        codes <<= np.uint64(5)
+        codes |= digits[i]
+    codes[~valid] = INVALID
+    return codes
+
+
+def as_codes(values):
+    """geohash7 strings, or codes already encoded at load → uint64 codes"""
+    arr = np.asarray(values)
+    return arr if arr.dtype == np.uint64 else to_codes(arr)
+
+
+def from_codes(codes):
+    """uint64 codes → geohash7 strings (INVALID → None)"""
+    codes = np.asarray(codes, dtype=np.uint64)
+    chars = np.empty((len(codes), GH_LEN), dtype=np.uint8)
+    for i in range(GH_LEN):
+        chars[:, GH_LEN - 1 - i] = _BASE32[(codes >> np.uint64(5 * i)) & np.uint64(31)]
+
+    out = chars.view(f"S{GH_LEN}").ravel().astype(str).astype(object)
+    out[codes == INVALID] = None
+    return out
+
+
+def code_cells(codes):
+    """uint64 codes → integer grid indices (ix along lon, iy along lat)"""
+    codes = np.asarray(codes, dtype=np.uint64)
+    ix = _compact_even_bits(codes).astype(np.int64)
+    iy = _compact_even_bits(codes >> np.uint64(1)).astype(np.int64)
+    return ix, iy
+
+
+def cell_codes(ix, iy):
+    """Integer grid indices → uint64 codes"""
+    ix = np.asarray(ix, dtype=np.int64).astype(np.uint64)
+    iy = np.asarray(iy, dtype=np.int64).astype(np.uint64)
+    return _spread_even_bits(ix) | (_spread_even_bits(iy) << np.uint64(1))
+
+
+def cells_to_geohash(ix, iy):
+    """Integer grid indices → geohash7 strings"""
+    return from_codes(cell_codes(ix, iy)).astype(str)
+
+# =========================
+# DECODE
+# =========================
+def decode_codes(codes):
+    """uint64 codes → (lat, lon) cell centres, NaN for INVALID"""
+    codes = np.asarray(codes, dtype=np.uint64)
+    ix, iy = code_cells(codes)
+
+    lat = -90.0 + (iy + 0.5) * GH_DLAT
+    lon = -180.0 + (ix + 0.5) * GH_DLON
+
+    bad = codes == INVALID
+    lat[bad] = np.nan
+    lon[bad] = np.nan
+    return lat, lon
+
+
+def decode(values):
+    """
+    geohash7 strings (or uint64 codes) → (lat, lon) float64 arrays.
+
+    Same cell centres as pygeohash.decode; NaN where the code is invalid.
+    """
+    return decode_codes(as_codes(values))
@@ -0,0 +1,120 @@
+# ============================================================
+# Streaming JSON writer for sample documents
+# - header fields, then the big array one element at a time,
+#   then trailer fields (e.g. a count known only at the end)
+# - encoder buffers hold one element, never the whole document
+# - indent=2 (json.dump layout) or compact; stdlib json by default,
+#   orjson only when asked for (it writes NaN / inf as null)
+# ============================================================
+
+import json
+
+try:
+    import orjson
+except ImportError:        # stdlib json only
+    orjson = None
+
+BACKENDS = ("json", "orjson")
+
+# =========================
+# ENCODERS
+# =========================
+def _encoder(backend, compact):
+    """value → JSON text (top level, not yet nested)"""
+    if backend == "orjson":
+        if orjson is None:
+            raise ImportError("orjson backend requested but orjson is not installed")
+        # orjson writes NaN / inf as null (stdlib: allow_nan=False raises)
+        opt = 0 if compact else orjson.OPT_INDENT_2
+        return lambda obj: orjson.dumps(obj, option=opt).decode("utf-8")
+    if backend != "json":
+        raise ValueError(f"unknown JSON backend: {backend!r} (expected one of {BACKENDS})")
+    if compact:
+        return lambda obj: json.dumps(obj, separators=(",", ":"), allow_nan=False)
+    return lambda obj: json.dumps(obj, indent=2, allow_nan=False)
+
+
+def default_backend():
+    # not orjson even when installed: NaN / inf must fail the export
+    # (allow_nan=False) whatever packages are present
+    return "json"
+
+# =========================
+# WRITER
+# =========================
+class JSONStreamWriter:
+    """
+    One JSON object written in order: `head` fields, `key`: [items...]
+    added one at a time with `write`, then `close(**tail)` fields.
+
+    With the default backend ("json") the indented output is byte for
+    byte what json.dump(doc, f, indent=2) writes.
+    """
+
+    def __init__(self, f, head, key, compact=False, backend=None):
+        self.f = f
+        self.count = 0
+        self._compact = compact
+        self._encode = _encoder(backend or default_backend(), compact)
+        self._nl = "" if compact else "\n"
+        self._sep = ":" if compact else ": "
+        self._item_pad = "" if compact else "    "
+
+        f.write("{")
+        self._fields = 0
+        for k, v in head.items():
+            self._field(k, v)
+        self._open(key)
+
+    def _next_field(self):
+        self.f.write(("," if self._fields else "") + self._nl + ("" if self._compact else "  "))
+        self._fields += 1
+
+    def _field(self, k, v):
+        self._next_field()
+        self.f.write(json.dumps(k) + self._sep + self._nested(self._encode(v), "  "))
+
+    def _nested(self, text, pad):
+        # raw newlines only come from the indentation (strings escape them)
+        return text if self._compact else text.replace("\n", "\n" + pad)
+
+    def _open(self, key):
+        self._next_field()
+        self.f.write(json.dumps(key) + self._sep + "[")
+
+    def write(self, item):
+        self.f.write(("," if self.count else "") + self._nl + self._item_pad)
+        self.f.write(self._nested(self._encode(item), "    "))
+        self.count += 1
+
+    def close(self, **tail):
+        """End the array (count known now) and write the `tail` fields"""
+        if self.count:
+            self.f.write(self._nl + ("" if self._compact else "  "))
+        self.f.write("]")
+        for k, v in tail.items():
+            self._field(k, v)
+        self.f.write(self._nl + "}")
+        return self.count
+
+
+def write_doc(f, doc, key, compact=False, backend=None):
+    """
+    Write `doc` with doc[key] (any iterable, e.g. a generator) streamed;
+    fields before `key` are written first, the rest after the array.
+    A "count" of None is filled in with the number of items written.
+    """
+    keys = list(doc)
+    at = keys.index(key)
+    head = {k: doc[k] for k in keys[:at]}
+    tail = {k: doc[k] for k in keys[at + 1:]}
+
+    count_late = "count" in head and head["count"] is None
+    if count_late:
+        del head["count"]
+    writer = JSONStreamWriter(f, head, key, compact=compact, backend=backend)
+    for item in doc[key]:
+        writer.write(item)
+    if count_late:
+        tail = {"count": writer.count, **tail}
+    return writer.close(**tail)
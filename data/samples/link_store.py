@@ -0,0 +1,182 @@
+# ============================================================
+# Compiled link-geometry store
+# - One-time compile of a network link.csv (WKT) into .npy arrays
+# - Flat float64 (lon, lat) buffer + CSR offsets per link
+# - Links indexed by a 64-bit hash of (from_node, to_node), mmap-loaded
+#
+#   python data/samples/link_store.py LINK_CSV OUT_DIR \
+#       --from-col from_osm_node_id --to-col to_osm_node_id
+# ============================================================
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+STORE_VERSION = 1
+MISSING = -1
+
+# =========================
+# KEYS
+# =========================
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def link_keys(from_nodes, to_nodes):
+    """(from_node, to_node) arrays → uint64 hash keys"""
+    a = np.asarray(from_nodes, dtype=np.int64).astype(np.uint64)
+    b = np.asarray(to_nodes, dtype=np.int64).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return _splitmix64(_splitmix64(a) ^ b)
+
+
+def csr_positions(offsets, idx):
+    """Flat buffer positions of items `idx` in a CSR layout, plus their lengths"""
+    starts = offsets[idx]
+    lens = offsets[idx + 1] - starts
+    total = int(lens.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), lens
+    shift = np.repeat(starts - (np.cumsum(lens) - lens), lens)
+    return shift + np.arange(total, dtype=np.int64), lens
+
+# =========================
+# COMPILE
+# =========================
+def source_signature(path):
+    st = os.stat(path)
+    return {"file": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def compile_links(csv_path, out_dir, from_col, to_col, geometry_col="geometry"):
+    """Parse every link's WKT once and write the store to `out_dir`"""
+    links = pd.read_csv(csv_path, usecols=[from_col, to_col, geometry_col])
+    links = links.dropna(subset=[from_col, to_col])
+
+    a = links[from_col].to_numpy(dtype=np.int64)
+    b = links[to_col].to_numpy(dtype=np.int64)
+    keys = link_keys(a, b)
+
+    # the old dict kept the last row for a repeated (from, to) pair
+    order = np.argsort(keys, kind="stable")
+    keys, a, b = keys[order], a[order], b[order]
+    last = np.r_[keys[1:] != keys[:-1], True]
+    order, keys, a, b = order[last], keys[last], a[last], b[last]
+
+    # unparsable WKT → empty link (the old loop skipped it)
+    wkts = links[geometry_col].to_numpy(dtype=object)[order]
+    wkts[[not isinstance(w, str) for w in wkts]] = None
+    geoms = shapely.from_wkt(wkts, on_invalid="ignore")
+    coords, owner = shapely.get_coordinates(geoms, return_index=True)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=len(keys)), out=offsets[1:])
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "keys.npy"), keys)
+    np.save(os.path.join(out_dir, "from.npy"), a)
+    np.save(os.path.join(out_dir, "to.npy"), b)
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "coords.npy"), coords.astype(np.float64))
+
+    meta = {
+        "version": STORE_VERSION,
+        "source": source_signature(csv_path),
+        "from_col": from_col,
+        "to_col": to_col,
+        "links": int(len(keys)),
+        "points": int(len(coords))
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Compiled {len(keys)} links / {len(coords)} points → {out_dir}")
+    return meta
+
+# =========================
+# STORE
+# =========================
+class LinkStore:
+    """Memory-mapped link geometry; route assembly is array slicing"""
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(root, name), mmap_mode="r")
+
+        self.keys = load("keys.npy")
+        self.from_nodes = load("from.npy")
+        self.to_nodes = load("to.npy")
+        self.offsets = load("offsets.npy")
+        self.coords = load("coords.npy")
+
+    @classmethod
+    def open(cls, csv_path, cache_dir, name, from_col, to_col):
+        """Open the compiled store for `csv_path`, compiling it if stale"""
+        root = os.path.join(cache_dir, f"links_v{STORE_VERSION}_{name}")
+        meta_path = os.path.join(root, "meta.json")
+
+        fresh = False
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            fresh = (
+                meta.get("version") == STORE_VERSION
+                and meta.get("source") == source_signature(csv_path)
+                and meta.get("from_col") == from_col
+                and meta.get("to_col") == to_col
+            )
+        if not fresh:
+            compile_links(csv_path, root, from_col, to_col)
+        return cls(root)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, from_nodes, to_nodes):
+        """Link index for each (from, to) pair, MISSING where absent"""
+        a = np.asarray(from_nodes, dtype=np.int64)
+        b = np.asarray(to_nodes, dtype=np.int64)
+        keys = link_keys(a, b)
+
+        idx = np.full(len(keys), MISSING, dtype=np.int64)
+        if len(self.keys) == 0:
+            return idx
+
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = (
+            (self.keys[pos] == keys)
+            & (self.from_nodes[pos] == a)
+            & (self.to_nodes[pos] == b)
+        )
+        idx[hit] = pos[hit]
+        return idx
+
+    def gather(self, idx):
+        """Concatenated (lon, lat) coordinates of links `idx`, in order"""
+        idx = np.asarray(idx, dtype=np.int64)
+        pos, _ = csr_positions(self.offsets, idx)
+        return np.asarray(self.coords[pos])
+
+# =========================
+# CLI
+# =========================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compile a network link.csv into a binary link store")
+    ap.add_argument("link_csv")
+    ap.add_argument("out_dir")
+    ap.add_argument("--from-col", default="from_osm_node_id")
+    ap.add_argument("--to-col", default="to_osm_node_id")
+    ap.add_argument("--geometry-col", default="geometry")
+    args = ap.parse_args()
+
+    compile_links(args.link_csv, args.out_dir, args.from_col, args.to_col, args.geometry_col)
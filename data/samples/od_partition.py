@@ -0,0 +1,128 @@
+# ============================================================
+# OD partitioning of linked trips
+# - OD of a linked trip = first leg GEOID_orig → last leg GEOID_dest
+# - One pass over the trips, for a supplied OD list or all ODs; their
+#   stats summaries grouped the same way with array operations
+# - ODPartitions: od → linked trips + stats summary, read one OD at a
+#   time (same interface as the streaming ODAccumulator and a loaded
+#   assembly checkpoint)
+# ============================================================
+
+from collections import defaultdict
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from od_stats import take_summary
+
+# =========================
+# LINKED TRIP OD
+# =========================
+def linked_trip_od(df):
+    """
+    linked_trip_id → (GEOID_orig, GEOID_dest) of its first / last leg.
+
+    `df` must already be sorted by linked_trip_id and leg start time.
+    """
+    first = df.drop_duplicates("linked_trip_id", keep="first")
+    last = df.drop_duplicates("linked_trip_id", keep="last")
+    return pd.DataFrame({
+        "GEOID_orig": first.set_index("linked_trip_id")["GEOID_orig"],
+        "GEOID_dest": last.set_index("linked_trip_id")["GEOID_dest"],
+    })
+
+
+def od_mask(trip_od, od_pairs):
+    """Boolean mask over `trip_od` rows whose OD is in `od_pairs`"""
+    keys = pd.MultiIndex.from_arrays([trip_od["GEOID_orig"], trip_od["GEOID_dest"]])
+    return keys.isin(list(od_pairs))
+
+# =========================
+# PARTITION
+# =========================
+def partition_by_od(linked_trips, trip_od, od_pairs=None, min_count=1):
+    """
+    Group linked trip dicts by OD in a single pass.
+
+    With `od_pairs`, every listed pair is returned (possibly empty) in
+    list order. Without it, every OD with at least `min_count` linked
+    trips is returned. Trip order inside each OD is preserved.
+    """
+    od_of = dict(zip(
+        trip_od.index,
+        zip(trip_od["GEOID_orig"], trip_od["GEOID_dest"])
+    ))
+
+    groups = defaultdict(list)
+    for lt in linked_trips:
+        od = od_of.get(lt["linked_trip_id"])
+        if od is not None and not pd.isna(od[0]) and not pd.isna(od[1]):
+            groups[od].append(lt)
+
+    if od_pairs:
+        return {od: groups.get(od, []) for od in od_pairs}
+
+    return {
+        od: groups[od]
+        for od in sorted(groups)
+        if len(groups[od]) >= min_count
+    }
+
+
+def partition_summaries(trip_ids, summary, trip_od, od_pairs=None, min_count=1):
+    """
+    od_stats.leg_summary arrays grouped like partition_by_od groups the
+    linked trip dicts (same ODs, same trip order: heaviest first, ties
+    in first-appearance order, as build_linked_trips sorts them), as
+    array operations.
+    """
+    od = trip_od.reindex(trip_ids)
+    orig, dest = od["GEOID_orig"].to_numpy(), od["GEOID_dest"].to_numpy()
+    order = np.argsort(-summary["weight"], kind="stable")
+    order = order[pd.notna(orig[order]) & pd.notna(dest[order])]
+
+    # trips grouped by OD (stable: trip order kept inside each OD)
+    codes, pairs = pd.MultiIndex.from_arrays([orig[order], dest[order]]).factorize()
+    grouped = take_summary(summary, order[np.argsort(codes, kind="stable")])
+    counts = np.bincount(codes, minlength=len(pairs))
+    ends = np.cumsum(counts)
+    slot = {od: i for i, od in enumerate(pairs)}
+
+    def part(od):
+        i = slot.get(od)
+        if i is None:
+            return take_summary(grouped, slice(0, 0))
+        return take_summary(grouped, slice(ends[i] - counts[i], ends[i]))
+
+    if od_pairs:
+        return {od: part(od) for od in od_pairs}
+
+    return {od: part(od) for od in sorted(slot) if counts[slot[od]] >= min_count}
+
+
+class ODPartitions(Mapping):
+    """
+    In-memory per-OD result of the assembly stage: od → linked trips,
+    plus `count(od)` and `summary(od)` (od_stats summary arrays, in
+    trip order).
+    """
+
+    def __init__(self, trips, summaries):
+        self._trips = trips
+        self._summaries = summaries
+
+    def __getitem__(self, od):
+        return self._trips[od]
+
+    def __iter__(self):
+        return iter(self._trips)
+
+    def __len__(self):
+        return len(self._trips)
+
+    def count(self, od):
+        return len(self._trips[od])
+
+    def summary(self, od):
+        return self._summaries[od]
@@ -0,0 +1,296 @@
+# ============================================================
+# OD-level statistics (nova.complete_trip.od_stats.v1)
+# - Per linked trip summary arrays, built from the leg table in one
+#   grouped pass (mergeable across chunks)
+# - Stats JSON computed from the summary, STRICTLY OLD DEFINITION,
+#   for all ODs at once, plus trip_weight-weighted variants
+# ============================================================
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BIN_WIDTH = 5
+MAX_TIME = 180
+
+COVERAGE = {"temporal": "year-2020", "spatial": "Salt Lake 6-county"}
+
+# mode involvement flags (one bit per mode)
+MODE_BITS = {"car": 1, "bus": 2, "rail": 4, "walk/bike": 8}
+
+SUMMARY_FIELDS = ("duration", "segments", "mode_bits", "weight")
+
+# =========================
+# SUMMARY
+# =========================
+def empty_summary():
+    return {
+        "duration": np.zeros(0, np.float64), "segments": np.zeros(0, np.int64),
+        "mode_bits": np.zeros(0, np.uint8), "weight": np.zeros(0, np.float64)
+    }
+
+
+def leg_summary(legs):
+    """
+    Per linked trip summary straight from the leg table, before any
+    linked trip dict exists: total duration (sum of finite leg
+    durations, in leg order), segment count, mode bitmask and weight
+    (max finite leg trip_weight, else 0) — the values build_linked_trips
+    puts in its dicts.
+
+    `legs` must be sorted by linked_trip_id and leg start time. Returns
+    (linked_trip_ids, summary) with trips in first-appearance order.
+    """
+    if len(legs) == 0:
+        return np.zeros(0, dtype=object), empty_summary()
+
+    trip, ids = pd.factorize(legs["linked_trip_id"], use_na_sentinel=False)
+    n = len(ids)
+    starts = np.flatnonzero(np.r_[True, trip[1:] != trip[:-1]])
+
+    dur = legs["duration_min"].to_numpy(np.float64)
+    weight = legs["trip_weight"].to_numpy(np.float64)
+
+    # one lookup per distinct mode label, as build_linked_trips normalizes it
+    codes, labels = pd.factorize(legs["travel_mode"], use_na_sentinel=False)
+    bits = np.array([MODE_BITS.get(str(m).lower().strip(), 0) for m in labels], dtype=np.uint8)[codes]
+
+    return np.asarray(ids), {
+        # bincount adds in leg order, as sum() over the legs does
+        "duration": np.bincount(trip, weights=np.where(np.isfinite(dur), dur, 0.0), minlength=n),
+        "segments": np.bincount(trip, minlength=n).astype(np.int64),
+        "mode_bits": np.bitwise_or.reduceat(bits, starts),
+        "weight": np.maximum.reduceat(np.where(np.isfinite(weight), weight, 0.0), starts),
+    }
+
+
+def concat_summaries(parts):
+    """Merge summaries of several chunks"""
+    if not parts:
+        return empty_summary()
+    return {k: np.concatenate([p[k] for p in parts]) for k in SUMMARY_FIELDS}
+
+
+def take_summary(summary, idx):
+    return {k: v[idx] for k, v in summary.items()}
+
+# =========================
+# GROUPED ENGINE (all ODs in one pass)
+# =========================
+# Trips of every OD are laid out back to back (OD order, trip order
+# kept); each statistic is one segmented numpy reduction over all ODs.
+# Unweighted values are bit-identical to the old per-OD np.percentile /
+# np.mean / np.histogram calls.
+
+def _lerp(a, b, t):
+    """numpy's percentile interpolation (same rounding)"""
+    diff = b - a
+    out = a + diff * t
+    hi = t >= 0.5
+    out[hi] = (b - diff * (1 - t))[hi]
+    return out
+
+
+def grouped_mean(values, starts, counts):
+    """
+    np.mean of each group, bit-identical: groups of equal size are
+    reduced together as rows, which sums in the same (pairwise) order.
+    """
+    out = np.full(len(counts), np.nan)
+    for n in np.unique(counts[counts > 0]):
+        sel = np.flatnonzero(counts == n)
+        out[sel] = values[starts[sel][:, None] + np.arange(n)].mean(axis=1)
+    return out
+
+
+def grouped_percentile(sorted_values, starts, counts, q):
+    """Linear-interpolated percentile `q` of each group (values sorted within groups)"""
+    virtual = (counts - 1) * (q / 100)
+    prev = np.floor(virtual).astype(np.int64)
+    nxt = np.minimum(prev + 1, counts - 1)
+    a = sorted_values[starts + prev].astype(np.float64)
+    b = sorted_values[starts + nxt].astype(np.float64)
+    return _lerp(a, b, virtual - prev)
+
+
+def grouped_weighted_percentile(sorted_values, sorted_weights, group, starts, totals, q):
+    """Inverted-CDF weighted percentile `q` of each group (values sorted within groups)"""
+    cw = np.cumsum(sorted_weights)
+    cw = cw - np.r_[0.0, cw][starts][group]
+    below = cw < (q / 100) * totals[group]
+    # first position per group whose cumulative weight reaches the target
+    idx = starts + np.bincount(group, weights=below, minlength=len(starts)).astype(np.int64)
+    idx = np.minimum(idx, np.r_[starts[1:], len(sorted_values)] - 1)
+    return sorted_values[idx].astype(np.float64)
+
+
+def grouped_histogram(values, group, n_groups, weights=None):
+    """(n_groups, n_bins) travel time histogram, same bins as np.histogram(bins=BINS)"""
+    edges = np.arange(0, MAX_TIME + BIN_WIDTH, BIN_WIDTH)
+    n_bins = len(edges) - 1
+    capped = np.clip(values, 0, MAX_TIME)
+    idx = np.clip(np.searchsorted(edges, capped, side="right") - 1, 0, n_bins - 1)
+    counts = np.bincount(group * n_bins + idx, weights=weights, minlength=n_groups * n_bins)
+    return counts.reshape(n_groups, n_bins), edges
+
+
+def od_stats_table(summaries):
+    """
+    Per-OD statistic arrays for a list of per-OD summaries.
+
+    Returns a dict of arrays with one row per OD (NaN where an OD has
+    no trips / no weight).
+    """
+    counts = np.array([len(s["duration"]) for s in summaries], dtype=np.int64)
+    merged = concat_summaries(summaries)
+    n = len(counts)
+    group = np.repeat(np.arange(n), counts)
+    starts = np.cumsum(counts) - counts
+    has = counts > 0
+    nz_starts = starts[has]
+
+    dur = merged["duration"]
+    seg = merged["segments"]
+    bits = merged["mode_bits"]
+    w = np.nan_to_num(merged["weight"], nan=0.0)
+
+    def per_od(values):
+        out = np.full(n, np.nan)
+        out[has] = values
+        return out
+
+    def group_mean(x):
+        return grouped_mean(x, starts, counts)
+
+    # values sorted inside each OD
+    order = np.lexsort((dur, group))
+    dur_sorted, w_sorted = dur[order], w[order]
+    seg_sorted = seg[np.lexsort((seg, group))]
+
+    def pct(sorted_values, q):
+        return per_od(grouped_percentile(sorted_values, nz_starts, counts[has], q))
+
+    t = {
+        "count": counts,
+        "dur_min": per_od(np.minimum.reduceat(dur, nz_starts) if len(nz_starts) else []),
+        "dur_max": per_od(np.maximum.reduceat(dur, nz_starts) if len(nz_starts) else []),
+        "dur_mean": group_mean(dur),
+        "dur_p25": pct(dur_sorted, 25),
+        "dur_p50": pct(dur_sorted, 50),
+        "dur_p75": pct(dur_sorted, 75),
+        "seg_avg": group_mean(seg),
+        "seg_p75": pct(seg_sorted, 75),
+        "seg_max": per_od(np.maximum.reduceat(seg, nz_starts) if len(nz_starts) else []),
+    }
+    for mode, bit in MODE_BITS.items():
+        t[f"share_{mode}"] = group_mean((bits & bit) != 0)
+
+    t["hist"], t["bin_edges"] = grouped_histogram(dur, group, n)
+
+    # weighted by trip_weight (max leg weight of the linked trip)
+    total_w = np.bincount(group, weights=w, minlength=n)
+    wsum = lambda x: np.bincount(group, weights=w * x, minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t["w_total"] = total_w
+        t["w_dur_mean"] = wsum(dur) / total_w
+        t["w_seg_avg"] = wsum(seg) / total_w
+        for mode, bit in MODE_BITS.items():
+            t[f"w_share_{mode}"] = wsum((bits & bit) != 0) / total_w
+
+    g_sorted = group[order]
+    for q, key in ((25, "w_dur_p25"), (50, "w_dur_p50"), (75, "w_dur_p75")):
+        v = np.full(n, np.nan)
+        if len(dur):
+            v = grouped_weighted_percentile(
+                dur_sorted, w_sorted, g_sorted, starts, total_w, q
+            )
+        v[total_w <= 0] = np.nan
+        t[key] = v
+    t["w_hist"], _ = grouped_histogram(dur, group, n, weights=w)
+
+    return t
+
+# =========================
+# STATS
+# =========================
+def _stats_doc(orig, dest, t, i, generated_at):
+    if t["count"][i] == 0:
+        return {
+            "schema": "nova.complete_trip.od_stats.v1",
+            "generated_at": generated_at,
+            "od": {"origin": orig, "destination": dest},
+            "coverage": COVERAGE,
+            "counts": {"linked_trips": 0},
+            "note": "No linked trips after distance + OD filter"
+        }
+
+    f = lambda key: float(t[key][i])
+
+    doc = {
+        "schema": "nova.complete_trip.od_stats.v1",
+        "generated_at": generated_at,
+        "od": {"origin": orig, "destination": dest},
+        "coverage": COVERAGE,
+        "counts": {"linked_trips": int(t["count"][i])},
+        "trip_duration_min": {
+            "min": f("dur_min"),
+            "mean": f("dur_mean"),
+            "p25": f("dur_p25"),
+            "median": f("dur_p50"),
+            "p75": f("dur_p75"),
+            "max": f("dur_max")
+        },
+        "segments": {
+            "avg": f("seg_avg"),
+            "p75": int(t["seg_p75"][i]),
+            "max": int(t["seg_max"][i])
+        },
+        "mode_involvement": {
+            "car": f("share_car"),
+            "bus": f("share_bus"),
+            "rail": f("share_rail"),
+            "walk": f("share_walk/bike")
+        },
+        "travel_time_distribution": {
+            "bin_width_min": BIN_WIDTH,
+            "max_time_min": MAX_TIME,
+            "bin_edges_min": t["bin_edges"].tolist(),
+            "counts": t["hist"][i].tolist()
+        }
+    }
+
+    # trip_weight-weighted variants (null when the OD carries no weight)
+    if t["w_total"][i] > 0:
+        doc["weighted"] = {
+            "total_weight": f("w_total"),
+            "trip_duration_min": {
+                "mean": f("w_dur_mean"),
+                "p25": f("w_dur_p25"),
+                "median": f("w_dur_p50"),
+                "p75": f("w_dur_p75")
+            },
+            "segments": {"avg": f("w_seg_avg")},
+            "mode_involvement": {
+                "car": f("w_share_car"),
+                "bus": f("w_share_bus"),
+                "rail": f("w_share_rail"),
+                "walk": f("w_share_walk/bike")
+            },
+            "travel_time_distribution": {"counts": t["w_hist"][i].tolist()}
+        }
+    else:
+        doc["weighted"] = None
+    return doc
+
+
+def od_stats_all(ods, summaries):
+    """od_stats.v1 documents for every (orig, dest) in `ods`, one grouped pass"""
+    t = od_stats_table(summaries)
+    generated_at = datetime.utcnow().isoformat() + "Z"
+    return [_stats_doc(o, d, t, i, generated_at) for i, (o, d) in enumerate(ods)]
+
+
+def od_stats(orig, dest, summary):
+    """od_stats.v1 document for one OD"""
+    return od_stats_all([(orig, dest)], [summary])[0]
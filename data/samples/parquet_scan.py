@@ -0,0 +1,128 @@
+# ============================================================
+# Parquet scan layer (Arrow datasets)
+# - OD pushdown: only geohash7 cells inside the requested tracts
+# - Column projection pushed into the Parquet reader
+# - Returns candidate rows only (whole linked trips)
+# ============================================================
+
+import glob
+import math
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import shapely
+
+from geohash7 import GH_DLAT, GH_DLON, cells_to_geohash
+
+# =========================
+# GEOHASH7 CELLS
+# =========================
+def tract_geohash_cells(tracts, geoids, geoid_col="GEOID"):
+    """
+    All geohash7 cells whose centre lies within one of `geoids`.
+
+    Same rule as the builder's sjoin(predicate="within") on decoded
+    geohash centres, so no candidate row is lost by the pushdown.
+    """
+    sel = tracts[tracts[geoid_col].astype(str).isin(set(geoids))]
+
+    cells = []
+    for geom in sel.geometry:
+        if geom is None or geom.is_empty:
+            continue
+        minx, miny, maxx, maxy = geom.bounds
+        ix = np.arange(
+            math.floor((minx + 180.0) / GH_DLON),
+            math.floor((maxx + 180.0) / GH_DLON) + 1
+        )
+        iy = np.arange(
+            math.floor((miny + 90.0) / GH_DLAT),
+            math.floor((maxy + 90.0) / GH_DLAT) + 1
+        )
+        gx, gy = np.meshgrid(ix, iy)
+        gx, gy = gx.ravel(), gy.ravel()
+
+        cx = -180.0 + (gx + 0.5) * GH_DLON
+        cy = -90.0 + (gy + 0.5) * GH_DLAT
+        inside = shapely.contains_xy(geom, cx, cy)
+
+        cells.append(cells_to_geohash(gx[inside], gy[inside]))
+
+    if not cells:
+        return []
+    return sorted(set(np.concatenate(cells).tolist()))
+
+# =========================
+# SCAN
+# =========================
+def month_files(parquet_dir, months):
+    """Delivery files for the given months (Salt_Lake-{m}-2020)"""
+    files = []
+    for m in months:
+        files.extend(sorted(glob.glob(f"{parquet_dir}/Salt_Lake-{m}-2020/*.snappy.parquet")))
+    return files
+
+
+def count_rows(files):
+    """Rows in `files`, from the Parquet footers (no column data read)"""
+    return ds.dataset(files, format="parquet").count_rows() if files else 0
+
+
+def candidate_linked_trip_ids(dataset, orig_cells, dest_cells):
+    """
+    Linked trips with at least one leg starting in `orig_cells`
+    and at least one leg ending in `dest_cells`.
+
+    A linked trip whose first leg starts in ORIG and last leg ends in
+    DEST always qualifies, so this is a superset of the final OD filter.
+    """
+    flt = (
+        ds.field("geohash7_orig").isin(pa.array(orig_cells, pa.string()))
+        | ds.field("geohash7_dest").isin(pa.array(dest_cells, pa.string()))
+    )
+    hits = dataset.to_table(
+        columns=["linked_trip_id", "geohash7_orig", "geohash7_dest"],
+        filter=flt
+    ).to_pandas()
+
+    o_ids = hits.loc[hits["geohash7_orig"].isin(orig_cells), "linked_trip_id"].unique()
+    d_ids = hits.loc[hits["geohash7_dest"].isin(dest_cells), "linked_trip_id"].unique()
+    return np.intersect1d(o_ids, d_ids)
+
+
+def candidate_filter(dataset, od_pairs=None, tracts=None, geoid_col="GEOID"):
+    """
+    Arrow filter expression keeping only linked trips that can match
+    `od_pairs` (None when there is nothing to push down).
+    """
+    if not od_pairs or tracts is None:
+        return None
+
+    orig_cells = tract_geohash_cells(tracts, {o for o, _ in od_pairs}, geoid_col)
+    dest_cells = tract_geohash_cells(tracts, {d for _, d in od_pairs}, geoid_col)
+
+    ids = candidate_linked_trip_ids(dataset, orig_cells, dest_cells)
+    print(
+        f"Pushdown: {len(orig_cells)} orig / {len(dest_cells)} dest geohash7 cells "
+        f"→ {len(ids)} candidate linked trips"
+    )
+
+    id_type = dataset.schema.field("linked_trip_id").type
+    return ds.field("linked_trip_id").isin(pa.array(ids, id_type))
+
+
+def scan_candidates(files, columns, od_pairs=None, tracts=None, geoid_col="GEOID", table=False):
+    """
+    Read `columns` from `files`, keeping only rows of linked trips that
+    can match `od_pairs`.
+
+    Both the geohash filter and the projection are evaluated inside the
+    Arrow scanner, so non-candidate rows are never materialized.
+    Without `od_pairs` (or `tracts`) this is a plain projected read.
+    `table` → the Arrow table instead (e.g. for trip_schema.lean_trips).
+    """
+    dataset = ds.dataset(files, format="parquet")
+    flt = candidate_filter(dataset, od_pairs, tracts, geoid_col)
+    t = dataset.to_table(columns=columns, filter=flt)
+    return t if table else t.to_pandas()
@@ -0,0 +1,211 @@
+# ============================================================
+# Range-capable static server + sample pack check
+# - http.server has no Range support; this handler adds single
+#   byte ranges (206 / 416), enough for samples.pack reads
+# - Check mode loads one OD the way app.js does and verifies that
+#   only that OD's bytes of the archive were served
+#
+# usage (from the repo root):
+#   python data/samples/range_server.py                 # check first OD
+#   python data/samples/range_server.py --od O D        # check one OD
+#   python data/samples/range_server.py --day first     # ... one day of it
+#   python data/samples/range_server.py --serve 8000    # dev server
+# ============================================================
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import urllib.request
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from sample_pack import INDEX_NAME
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# =========================
+# HANDLER
+# =========================
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler + single-range GET; logs bytes sent per path"""
+
+    sent = []          # (path, status, body bytes) of every response
+
+    def send_head(self):
+        rng = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not rng or os.path.isdir(path) or not os.path.isfile(path):
+            self._range = None
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        m = RANGE_RE.match(rng.strip())
+        first = last = None
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                first = int(m.group(1))
+                last = int(m.group(2)) if m.group(2) else size - 1
+            else:                              # suffix range: last N bytes
+                first = max(size - int(m.group(2)), 0)
+                last = size - 1
+            last = min(last, size - 1)
+
+        if first is None or first > last:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            self._range = None
+            return None
+
+        f = open(path, "rb")
+        f.seek(first)
+        self._range = (first, last)
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+        self.send_header("Content-Length", str(last - first + 1))
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        if self._range is None:
+            data = source.read()
+        else:
+            first, last = self._range
+            data = source.read(last - first + 1)
+        outputfile.write(data)
+        self.sent.append((self.path, 206 if self._range else 200, len(data)))
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve(root, port=0):
+    """Start the server in a thread; returns (server, base url)"""
+    handler = partial(RangeRequestHandler, directory=root)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# =========================
+# CHECK (one OD, like app.js)
+# =========================
+def _get(url, first=None, last=None):
+    req = urllib.request.Request(url)
+    if first is not None:
+        req.add_header("Range", f"bytes={first}-{last}")
+    with urllib.request.urlopen(req) as res:
+        return res.status, res.read()
+
+
+def _get_block(url, offset, length, kind):
+    status, data = _get(url, offset, offset + length - 1)
+    if status != 206 or len(data) != length:
+        raise AssertionError(f"{kind}: HTTP {status}, {len(data)} of {length} bytes")
+    return json.loads(gzip.decompress(data))
+
+
+def check_od(base, index_url, od=None, day=None):
+    """
+    Load one OD's blocks by Range; returns a report dict (raises on
+    mismatch). With `day` ("YYYY-MM-DD" or "first") the OD's day index
+    and that day's sample block replace the full sample.
+    """
+    RangeRequestHandler.sent.clear()
+    _, raw = _get(index_url)
+    index = json.loads(raw)
+    col = {f: i for i, f in enumerate(index["fields"])}
+
+    key = f"{od[0]}_to_{od[1]}" if od else next(iter(index["ods"]))
+    entry = index["ods"][key]
+    pack_url = index_url.rsplit("/", 1)[0] + "/" + index["archive"]
+
+    blocks = {}
+    expected = 0
+    trips = entry[col["trips"]]
+    kinds = ("days", "stats") if day else ("sample", "stats")    # what applyODSelection loads
+    for kind in kinds:
+        offset, length = entry[col[f"{kind}_offset"]], entry[col[f"{kind}_length"]]
+        if not length:
+            continue
+        blocks[kind] = _get_block(pack_url, offset, length, kind)
+        expected += length
+
+    if day:
+        days = blocks.get("days", {}).get("days", [])
+        pick = days[0] if day == "first" and days else next((d for d in days if d["day"] == day), None)
+        if pick is None:
+            raise AssertionError(f"{key}: no day {day} in the day index")
+        offset, length = pick["sample"]
+        blocks["sample"] = _get_block(pack_url, offset, length, "day sample")
+        if blocks["sample"].get("count") != pick["count"]:
+            raise AssertionError(
+                f"{key} {pick['day']}: {blocks['sample'].get('count')} trips, index says {pick['count']}"
+            )
+        expected += length
+        key, trips = f"{key} {pick['day']}", pick["count"]
+
+    pack_path = "/" + pack_url[len(base):].lstrip("/")
+    served = sum(n for p, _, n in RangeRequestHandler.sent if p == pack_path)
+    if served != expected:
+        raise AssertionError(f"archive bytes served {served:,} != blocks {expected:,}")
+
+    return {
+        "od": key,
+        "trips": trips,
+        "archive_bytes": index["bytes"],
+        "archive_bytes_read": served,
+        "index_bytes": len(raw),
+        "schemas": {k: v.get("schema") for k, v in blocks.items()},
+    }
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    p = argparse.ArgumentParser(description="Range-capable static server / sample pack check")
+    p.add_argument("--root", default=os.path.abspath(os.path.join(here, "..", "..")),
+                   help="site root (default: repo root)")
+    p.add_argument("--index", default=f"data/samples/{INDEX_NAME}",
+                   help="pack index path relative to the site root")
+    p.add_argument("--od", nargs=2, metavar=("ORIG", "DEST"))
+    p.add_argument("--day", metavar="YYYY-MM-DD", help='load one day of the OD ("first" → its first day)')
+    p.add_argument("--serve", type=int, metavar="PORT", help="only serve the site")
+    args = p.parse_args(argv)
+
+    if args.serve is not None:
+        server, base = serve(args.root, args.serve)
+        print(f"Serving {args.root} at {base} (Range requests supported), Ctrl+C to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    server, base = serve(args.root)
+    try:
+        report = check_od(base, f"{base}/{args.index}", args.od, args.day)
+    finally:
+        server.shutdown()
+
+    pct = 100.0 * report["archive_bytes_read"] / max(report["archive_bytes"], 1)
+    print(
+        f"✓ {report['od']}: {report['trips']} linked trips, read "
+        f"{report['archive_bytes_read']:,} of {report['archive_bytes']:,} archive bytes "
+        f"({pct:.2f}%) + {report['index_bytes']:,} B index"
+    )
+    print(f"  blocks: {report['schemas']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# ============================================================
+# Batched route assembly
+# - All route_taken strings tokenized at once → node array + offsets
+#   (or decoded, when trip_schema already encoded the column)
+# - Every consecutive node pair looked up in one pass per network
+# - Per-leg (lon, lat) coordinate arrays, no shapely objects
+# ============================================================
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from link_store import MISSING, csr_positions
+from route_codec import decode_nodes
+from route_simplify import simplify
+
+# =========================
+# TOKENIZE
+# =========================
+def tokenize_routes(route_taken):
+    """
+    route_taken strings → (nodes int64, offsets) in CSR form.
+
+    Same token rule as the old per-row parser: split on "," and keep
+    tokens that are all digits once stripped.
+    """
+    s = pd.Series(route_taken, dtype=object).fillna("").astype(str)
+    if not len(s):
+        return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    counts = (s.str.count(",") + 1).to_numpy(dtype=np.int64)
+
+    tokens = pd.Series(",".join(s.tolist()).split(",")).str.strip()
+    ok = tokens.str.isdigit().to_numpy(dtype=bool)
+
+    owner = np.repeat(np.arange(len(s), dtype=np.int64), counts)[ok]
+    nodes = tokens[ok].astype(np.int64).to_numpy()
+
+    offsets = np.zeros(len(s) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=len(s)), out=offsets[1:])
+    return nodes, offsets
+
+
+def route_nodes(route_taken):
+    """route_taken column → (nodes, offsets): route_codec-encoded or plain strings"""
+    dtype = getattr(route_taken, "dtype", None)
+    if isinstance(dtype, pd.ArrowDtype) and pa.types.is_binary(dtype.pyarrow_dtype):
+        return decode_nodes(pa.array(route_taken))
+    return tokenize_routes(route_taken)
+
+# =========================
+# ASSEMBLE
+# =========================
+class RouteBatch:
+    """Assembled routes for n legs: coords[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, offsets, coords, missing):
+        self.offsets = offsets
+        self.coords = coords
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def valid(self):
+        """Legs with a usable route (at least two points)"""
+        return self.lengths > 1
+
+    def route(self, i):
+        """(k, 2) lon/lat view of leg i, None without a route"""
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.coords[a:b] if b - a > 1 else None
+
+    def simplified(self, tolerance_m):
+        """Douglas-Peucker simplified copy (tolerance in meters, non-finite points dropped)"""
+        coords, offsets = simplify(self.coords, self.offsets, tolerance_m)
+        return RouteBatch(offsets, coords, self.missing)
+
+    def endpoints(self):
+        """(n, 2) first and last lon/lat of every leg, NaN without a route"""
+        first = np.full((len(self), 2), np.nan)
+        last = np.full((len(self), 2), np.nan)
+        ok = self.valid
+        first[ok] = self.coords[self.offsets[:-1][ok]]
+        last[ok] = self.coords[self.offsets[1:][ok] - 1]
+        return first, last
+
+    def to_list(self):
+        out = np.empty(len(self), dtype=object)
+        for i in range(len(self)):
+            out[i] = self.route(i)
+        return out
+
+
+def assemble_routes(route_taken, travel_mode, stores, mode_network):
+    """
+    Reconstruct every leg's route from its node sequence.
+
+    `stores` maps network name → LinkStore, `mode_network` maps
+    travel_mode → network name. Missing links are skipped (as before)
+    and counted per travel mode in `RouteBatch.missing`.
+    """
+    modes = pd.Series(travel_mode, dtype=object)
+    n = len(modes)
+
+    nodes, offsets = route_nodes(route_taken)
+    owner = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+
+    # consecutive node pairs inside the same leg
+    same = owner[:-1] == owner[1:]
+    a, b, pair_leg = nodes[:-1][same], nodes[1:][same], owner[:-1][same]
+
+    net_names = list(stores)
+    leg_net = modes.map({m: net_names.index(k) for m, k in mode_network.items() if k in stores})
+    leg_net = leg_net.fillna(-1).to_numpy(dtype=np.int64)
+    pair_net = leg_net[pair_leg]
+
+    link = np.full(len(a), MISSING, dtype=np.int64)
+    for k, name in enumerate(net_names):
+        sel = pair_net == k
+        if sel.any():
+            link[sel] = stores[name].lookup(a[sel], b[sel])
+
+    lost = (link == MISSING) & (pair_net >= 0)
+    missing = (
+        modes.iloc[pair_leg[lost]].value_counts().astype(int).to_dict()
+        if lost.any() else {}
+    )
+
+    # per network: gather link coordinates, then scatter legs into place
+    found = link != MISSING
+    chunks = []
+    leg_len = np.zeros(n, dtype=np.int64)
+    for k, name in enumerate(net_names):
+        sel = found & (pair_net == k)
+        if not sel.any():
+            continue
+        pos, lens = csr_positions(stores[name].offsets, link[sel])
+        pt_leg = np.repeat(pair_leg[sel], lens)
+        leg_len += np.bincount(pt_leg, minlength=n)
+        chunks.append((name, pos, pt_leg))
+
+    out_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(leg_len, out=out_offsets[1:])
+    coords = np.empty((out_offsets[-1], 2), dtype=np.float64)
+
+    for name, pos, pt_leg in chunks:
+        # points of one leg are contiguous and legs are in order
+        first = np.r_[True, pt_leg[1:] != pt_leg[:-1]]
+        start = np.flatnonzero(first)
+        rank = np.arange(len(pt_leg)) - np.repeat(start, np.diff(np.r_[start, len(pt_leg)]))
+        coords[out_offsets[pt_leg] + rank] = stores[name].coords[pos]
+
+    return RouteBatch(out_offsets, coords, missing)
@@ -0,0 +1,107 @@
+# ============================================================
+# Compact route_taken column (NumPy + Arrow)
+# - "n1,n2,n3" node strings tokenized with Arrow compute
+# - Per leg: first node id, then node-to-node deltas, zigzag +
+#   LEB128 varints → one Arrow binary value per leg (1-2 B per node
+#   when consecutive node ids are close, instead of ~11 B of text)
+# - Self-contained rows: filter / concat / Parquet round trips need no
+#   shared dictionary
+# - Decoded straight to the CSR (nodes, offsets) form route_assembly uses
+# ============================================================
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# =========================
+# TOKENIZE
+# =========================
+def tokenize_arrow(arr):
+    """
+    Arrow route_taken strings → (nodes int64, offsets) in CSR form.
+
+    Same token rule as route_assembly.tokenize_routes (split on ",",
+    keep stripped tokens made of digits only; ASCII digits here).
+    """
+    arr = arr.combine_chunks() if isinstance(arr, pa.ChunkedArray) else arr
+    n = len(arr)
+    lists = pc.split_pattern(pc.fill_null(arr.cast(pa.string()), ""), ",")
+    tokens = pc.utf8_trim_whitespace(lists.flatten())
+    ok = pc.ascii_is_decimal(tokens)
+
+    owner = np.repeat(np.arange(n, dtype=np.int64), pc.list_value_length(lists).to_numpy())
+    nodes = pc.cast(tokens.filter(ok), pa.int64()).to_numpy()
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner[ok.to_numpy(zero_copy_only=False)], minlength=n), out=offsets[1:])
+    return nodes, offsets
+
+# =========================
+# VARINTS
+# =========================
+def _deltas(nodes, offsets):
+    """First node of each leg as is, the rest as differences to the previous node"""
+    d = np.diff(nodes, prepend=np.int64(0))
+    starts = offsets[:-1][np.diff(offsets) > 0]
+    d[starts] = nodes[starts]
+    return d
+
+
+def encode_nodes(nodes, offsets):
+    """(nodes, offsets) → Arrow binary array, one varint string per leg"""
+    d = _deltas(nodes.astype(np.int64), offsets)
+    z = ((d << 1) ^ (d >> 63)).view(np.uint64)                # zigzag
+
+    size = np.ones(len(z), dtype=np.int64)
+    for k in range(1, 10):
+        size += z >= np.uint64(1 << (7 * k))
+
+    # byte j of value i: 7-bit group j, high bit set on all but the last
+    owner = np.repeat(np.arange(len(z)), size)
+    j = np.arange(len(owner)) - np.repeat(np.cumsum(size) - size, size)
+    data = ((z[owner] >> (7 * j).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    data[j < size[owner] - 1] |= 0x80
+
+    byte_end = np.r_[0, np.cumsum(size)]
+    row_offsets = byte_end[offsets]
+    if row_offsets[-1] > np.iinfo(np.int32).max:
+        raise ValueError("route column over 2 GB: encode it in smaller chunks")
+    return pa.Array.from_buffers(
+        pa.binary(), len(offsets) - 1,
+        [None, pa.py_buffer(row_offsets.astype(np.int32)), pa.py_buffer(data)]
+    )
+
+
+def decode_nodes(arr):
+    """Arrow binary array from encode_nodes → (nodes int64, offsets); nulls → no nodes"""
+    arr = arr.combine_chunks() if isinstance(arr, pa.ChunkedArray) else arr
+    n = len(arr)
+    _, off_buf, data_buf = arr.buffers()
+    row_offsets = np.frombuffer(off_buf, dtype=np.int32)[arr.offset:arr.offset + n + 1].astype(np.int64)
+    data = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.zeros(0, np.uint8)
+    if arr.null_count:
+        valid = arr.is_valid().to_numpy(zero_copy_only=False)
+        keep = np.repeat(valid, np.diff(row_offsets))
+        data = data[row_offsets[0]:row_offsets[-1]][keep]
+        row_offsets = np.r_[0, np.cumsum(np.where(valid, np.diff(row_offsets), 0))]
+    else:
+        data = data[row_offsets[0]:row_offsets[-1]]
+        row_offsets = row_offsets - row_offsets[0]
+
+    last = (data & 0x80) == 0                  # final byte of each varint
+    ends = np.flatnonzero(last)
+    starts = np.r_[0, ends[:-1] + 1]
+    j = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    part = (data & 0x7F).astype(np.uint64) << (7 * j).astype(np.uint64)
+    z = np.bitwise_or.reduceat(part, starts) if len(starts) else np.zeros(0, np.uint64)
+    d = (z >> np.uint64(1)).view(np.int64) ^ -(z & np.uint64(1)).view(np.int64)
+
+    # varints per leg: final bytes inside each leg's byte range
+    ends_before = np.r_[0, np.cumsum(last)]
+    offsets = ends_before[row_offsets]
+
+    # undo the deltas leg by leg: running sum minus the sum before the leg
+    # (int64 wrap-around cancels out)
+    total = np.cumsum(d)
+    before = np.r_[np.int64(0), total][offsets[:-1]]
+    nodes = total - np.repeat(before, np.diff(offsets))
+    return nodes, offsets
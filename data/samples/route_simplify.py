@@ -0,0 +1,121 @@
+# ============================================================
+# Route simplification (Douglas-Peucker, tolerance in meters)
+# - All routes of a batch simplified together (CSR coords + offsets)
+# - One pass gives every point's DP importance; any tolerance
+#   (level of detail) is then a threshold on that importance
+# - Endpoints always kept; smaller tolerance ⊇ larger tolerance
+# - Same points as GEOS simplify (preserve_topology=False) on the
+#   local meter coordinates, ties included (check_route_simplify.py)
+# ============================================================
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+
+# =========================
+# PROJECTION
+# =========================
+def local_meters(lonlat, offsets):
+    """(lon, lat) → local equirectangular meters, one reference latitude per route"""
+    lonlat = np.asarray(lonlat, dtype=np.float64)
+    lens = np.diff(offsets)
+    sums = np.add.reduceat(lonlat[:, 1], offsets[:-1][lens > 0]) if len(lonlat) else np.empty(0)
+    lat0 = np.zeros(len(lens))
+    lat0[lens > 0] = sums / lens[lens > 0]
+    k = np.cos(np.radians(np.repeat(lat0, lens)))
+
+    rad = np.radians(lonlat)
+    return np.column_stack([rad[:, 0] * k, rad[:, 1]]) * EARTH_RADIUS_M
+
+
+def _segment_distance(p, a, b):
+    """
+    Distance of points p to segments a–b (row-wise), evaluated in the
+    same order as GEOS Distance::pointToSegment so that equally far
+    points tie (and break ties) exactly as in GEOS simplify
+    """
+    px, py, ax, ay, bx, by = p[:, 0], p[:, 1], a[:, 0], a[:, 1], b[:, 0], b[:, 1]
+    to_a = np.sqrt((px - ax) * (px - ax) + (py - ay) * (py - ay))
+    to_b = np.sqrt((px - bx) * (px - bx) + (py - by) * (py - by))
+
+    len2 = (bx - ax) * (bx - ax) + (by - ay) * (by - ay)
+    point = len2 == 0
+    den = np.where(point, 1.0, len2)
+    r = ((px - ax) * (bx - ax) + (py - ay) * (by - ay)) / den
+    s = ((ay - py) * (bx - ax) - (ax - px) * (by - ay)) / den
+    d = np.abs(s) * np.sqrt(len2)
+    return np.where(point | (r <= 0.0), to_a, np.where(r >= 1.0, to_b, d))
+
+# =========================
+# DOUGLAS-PEUCKER
+# =========================
+def dp_importance(lonlat, offsets, min_tolerance_m):
+    """
+    Douglas-Peucker importance (meters) of every point.
+
+    A point survives DP at tolerance `tol` iff importance > tol, for
+    every tol ≥ `min_tolerance_m` (splitting stops there). Endpoints
+    are inf, dropped points 0.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    xy = local_meters(lonlat, offsets)
+    imp = np.zeros(len(xy))
+
+    lens = np.diff(offsets)
+    routed = lens > 0
+    imp[offsets[:-1][routed]] = np.inf
+    imp[offsets[1:][routed] - 1] = np.inf
+
+    # active segments (first, last point) and the importance cap of their parent
+    seg_a = offsets[:-1][lens > 2]
+    seg_b = offsets[1:][lens > 2] - 1
+    cap = np.full(len(seg_a), np.inf)
+
+    while len(seg_a):
+        inner = seg_b - seg_a - 1
+        owner = np.repeat(np.arange(len(seg_a)), inner)
+        first = np.cumsum(inner) - inner
+        idx = seg_a[owner] + 1 + (np.arange(len(owner)) - first[owner])
+
+        d = _segment_distance(xy[idx], xy[seg_a[owner]], xy[seg_b[owner]])
+
+        # farthest point of each segment (first one on ties)
+        dmax = np.maximum.reduceat(d, first)
+        hit = np.flatnonzero(d == dmax[owner])
+        hit = hit[np.r_[True, owner[hit][1:] != owner[hit][:-1]]]
+        split_at = idx[hit]
+
+        split = dmax > min_tolerance_m
+        c = np.minimum(dmax, cap)[split]
+        p = split_at[split]
+        a, b = seg_a[split], seg_b[split]
+        imp[p] = c
+
+        seg_a = np.concatenate([a, p])
+        seg_b = np.concatenate([p, b])
+        cap = np.concatenate([c, c])
+        keep = seg_b - seg_a > 1
+        seg_a, seg_b, cap = seg_a[keep], seg_b[keep], cap[keep]
+
+    return imp
+
+
+def select(coords, offsets, mask):
+    """Keep masked points; returns (coords, offsets)"""
+    owner = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    new_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(np.bincount(owner[mask], minlength=len(offsets) - 1), out=new_offsets[1:])
+    return coords[mask], new_offsets
+
+
+def simplify(lonlat, offsets, tolerance_m):
+    """Douglas-Peucker simplified routes (non-finite points dropped first)"""
+    lonlat = np.asarray(lonlat, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    finite = np.isfinite(lonlat).all(axis=1)
+    if not finite.all():
+        lonlat, offsets = select(lonlat, offsets, finite)
+
+    imp = dp_importance(lonlat, offsets, tolerance_m)
+    return select(lonlat, offsets, imp > tolerance_m)
@@ -0,0 +1,238 @@
+# ============================================================
+# Run report for the pipelines (sample builders, OD aggregation)
+# - `with report.stage("load", rows_in=n) as st:` → wall time,
+#   peak RSS, rows in / out and rows dropped per reason
+#   (repeated stages accumulate, e.g. one per chunk in STREAM mode)
+# - optional per-stage profile: cProfile (.prof) or pyinstrument (.html)
+# - written as JSON at the end of the run; bench_suite.py reads it
+# ============================================================
+
+import cProfile
+import importlib.util
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:        # /proc (Linux) or resource (Unix) only
+    psutil = None
+
+try:
+    import resource
+except ImportError:        # Windows
+    resource = None
+
+SCHEMA = "nova.complete_trip.run_report.v1"
+PROFILERS = ("cprofile", "pyinstrument")
+
+# =========================
+# MEMORY
+# =========================
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Restart the peak RSS high-water mark (Linux only); False → peaks are process-wide"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    if psutil is not None:
+        mem = psutil.Process().memory_info()
+        return getattr(mem, "peak_wset", mem.rss) / 2**20      # peak_wset: Windows
+    if resource is not None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb / 2**20 if sys.platform == "darwin" else kb / 1024
+    return None
+
+
+def rss_mb():
+    rss = _proc_status_mb("VmRSS")
+    if rss is None and psutil is not None:
+        rss = psutil.Process().memory_info().rss / 2**20
+    return rss
+
+
+def children_peak_rss_mb():
+    """Largest peak RSS of any finished child process (export workers)"""
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return kb / 2**20 if sys.platform == "darwin" else kb / 1024
+
+# =========================
+# STAGES
+# =========================
+def _mb(x):
+    return round(x, 1) if x is not None else None
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.dropped = {}
+        self.notes = {}
+        self.peak_rss_mb = None
+        self.rss_mb = None
+
+    def rows(self, rows_in=None, rows_out=None):
+        """Row counts, summed over calls"""
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + int(rows_in)
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + int(rows_out)
+
+    def drop(self, reason, n):
+        self.dropped[reason] = self.dropped.get(reason, 0) + int(n)
+
+    def note(self, key, value):
+        """Extra per-stage figure; numbers add up over calls, anything else is replaced"""
+        old = self.notes.get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            value = old + value
+        self.notes[key] = value
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "dropped": self.dropped,
+            "peak_rss_mb": _mb(self.peak_rss_mb),
+            "rss_mb": _mb(self.rss_mb),
+            **({"notes": self.notes} if self.notes else {}),
+        }
+
+
+class RunReport:
+    """
+    Stages of one run, in first-seen order. `profile` = "cprofile" or
+    "pyinstrument" writes one profile per stage into `profile_dir`.
+    """
+
+    def __init__(self, name, profile=None, profile_dir=None):
+        if profile not in (None,) + PROFILERS:
+            raise ValueError(f"unknown profiler: {profile!r} (expected one of {PROFILERS})")
+        if profile == "pyinstrument" and importlib.util.find_spec("pyinstrument") is None:
+            raise ImportError("pyinstrument profile requested but pyinstrument is not installed")
+        self.name = name
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self.meta = {}
+        self._profilers = {}
+        self._peak = None
+        self._peak_scope = "stage"
+        self._t0 = time.perf_counter()
+
+    def _profiler(self, name):
+        if name not in self._profilers:
+            if self.profile == "cprofile":
+                self._profilers[name] = cProfile.Profile()
+            else:
+                from pyinstrument import Profiler
+                self._profilers[name] = Profiler()
+        return self._profilers[name]
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        st = self.stages.setdefault(name, Stage(name))
+        st.rows(rows_in=rows_in)
+        if not reset_peak_rss():
+            self._peak_scope = "process"
+        # stages must not nest while profiling (one active profiler)
+        prof = self._profiler(name) if self.profile else None
+        if prof is not None and self.profile == "cprofile":
+            prof.enable()
+        elif prof is not None:
+            prof.start()
+        t0 = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st.seconds += time.perf_counter() - t0
+            st.calls += 1
+            if prof is not None and self.profile == "cprofile":
+                prof.disable()
+            elif prof is not None:
+                prof.stop()
+            peak = peak_rss_mb()
+            if peak is not None:
+                st.peak_rss_mb = max(st.peak_rss_mb or 0.0, peak)
+                self._peak = max(self._peak or 0.0, peak)
+            st.rss_mb = rss_mb()
+
+    def to_dict(self):
+        peak = peak_rss_mb()
+        if peak is not None and self._peak is not None:
+            peak = max(peak, self._peak)
+        return {
+            "schema": SCHEMA,
+            "run": self.name,
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            "total_s": round(time.perf_counter() - self._t0, 4),
+            "peak_rss_mb": _mb(peak),
+            "peak_rss_scope": self._peak_scope,
+            "children_peak_rss_mb": _mb(children_peak_rss_mb()),
+            "meta": self.meta,
+            "stages": {name: st.to_dict() for name, st in self.stages.items()},
+            "profiles": self._write_profiles(),
+        }
+
+    def _write_profiles(self):
+        if not self._profilers:
+            return {}
+        os.makedirs(self.profile_dir, exist_ok=True)
+        paths = {}
+        for name, prof in self._profilers.items():
+            base = os.path.join(self.profile_dir, f"{self.name}.{name}")
+            if self.profile == "cprofile":
+                paths[name] = base + ".prof"
+                prof.dump_stats(paths[name])
+            else:
+                paths[name] = base + ".html"
+                with open(paths[name], "w", encoding="utf-8") as f:
+                    f.write(prof.output_html())
+        return paths
+
+    def summary(self):
+        """One line per stage (for the end of the console log)"""
+        lines = [f"{'stage':14s} {'seconds':>9s} {'peak MB':>9s} {'rows in':>12s} {'rows out':>12s}  dropped"]
+        for st in self.stages.values():
+            rows = [f"{x:,}" if x is not None else "-" for x in (st.rows_in, st.rows_out)]
+            peak = f"{st.peak_rss_mb:,.0f}" if st.peak_rss_mb is not None else "-"
+            dropped = ", ".join(f"{k} {v:,}" for k, v in st.dropped.items() if v)
+            lines.append(f"{st.name:14s} {st.seconds:9.2f} {peak:>9s} {rows[0]:>12s} {rows[1]:>12s}  {dropped}")
+        return "\n".join(lines)
+
+    def write(self, path):
+        doc = self.to_dict()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        return doc
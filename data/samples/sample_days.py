@@ -0,0 +1,80 @@
+# ============================================================
+# Day partitions of an OD's linked trips
+# - service day = local date of the first leg's start (YYYY-MM-DD)
+# - per-OD day index: linked trips per day and per start hour, plus
+#   the day's sample / detail file (block offsets once packed)
+# - the app fills the day selector from the index and fetches only
+#   the selected day's trips
+# - the OD's tract polygons live in the index (once per OD), not in
+#   the day blocks
+# ============================================================
+
+from collections import defaultdict
+
+SCHEMA = "nova.complete_trip.sample_days.v1"
+
+# =========================
+# DAY / HOUR
+# =========================
+def _start(lt):
+    start = (lt.get("origin") or {}).get("start_time")
+    return start if isinstance(start, str) and len(start) >= 13 else None
+
+
+def trip_day(lt):
+    """YYYY-MM-DD of the linked trip's start (None without a start time)"""
+    start = _start(lt)
+    return start[:10] if start else None
+
+
+def trip_hour(lt):
+    start = _start(lt)
+    return int(start[11:13]) if start and start[11:13].isdigit() else None
+
+
+def partition_by_day(linked_trips):
+    """day → linked trips of that day (input order kept), days ascending"""
+    days = defaultdict(list)
+    for lt in linked_trips:
+        day = trip_day(lt)
+        if day is not None:
+            days[day].append(lt)
+    return dict(sorted(days.items()))
+
+# =========================
+# DAY INDEX
+# =========================
+def day_file(base, day, suffix):
+    """{O}_to_{D}.day-YYYY-MM-DD{suffix}"""
+    return f"{base}.day-{day}{suffix}"
+
+
+def day_index(orig, dest, linked_trips, files, od=None):
+    """
+    Day index document of one OD.
+
+    `files` maps day → {"sample": name, "detail": name} (names relative
+    to the index file); the sample pack swaps them for block offsets.
+    `od` (tract ids + polygons) is stored here once; the day blocks and
+    the OD's v3 sample are written without polygons.
+    """
+    parts = partition_by_day(linked_trips)
+    days = []
+    for day, trips in parts.items():
+        hours = [0] * 24
+        for lt in trips:
+            h = trip_hour(lt)
+            if h is not None and 0 <= h < 24:
+                hours[h] += 1
+        days.append({"day": day, "count": len(trips), "hours": hours, **files.get(day, {})})
+
+    doc = {
+        "schema": SCHEMA,
+        "origin": orig,
+        "destination": dest,
+        "count": len(linked_trips),
+        "days": days
+    }
+    if od is not None:
+        doc["od"] = od
+    return doc
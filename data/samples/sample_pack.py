@@ -0,0 +1,156 @@
+# ============================================================
+# Packed sample archive
+# - One samples.pack of gzip blocks (sample / detail / stats per OD,
+#   plus per-day sample / detail blocks and the OD's day index)
+# - Compact index: "{O}_to_{D}" → offsets, lengths, trip count, bbox
+# - Clients read one OD with HTTP Range requests (no per-OD files)
+# ============================================================
+
+import gzip
+import json
+import os
+
+import numpy as np
+
+from export_pool import write_bytes_atomic, write_stream_atomic
+
+PACK_NAME = "samples.pack"
+INDEX_NAME = "samples.pack.index.json"
+SCHEMA = "nova.complete_trip.sample_pack.v1"
+
+# blocks of one OD, in archive order (file suffix → block kind)
+BLOCKS = {
+    "sample": (".v3.json", ".json"),      # first existing wins
+    "detail": (".v3.detail.json",),
+    "stats": (".stats.json",),
+}
+DAYS_SUFFIX = ".days.json"   # day index; its day files become blocks too
+
+FIELDS = [
+    "sample_offset", "sample_length",
+    "detail_offset", "detail_length",
+    "stats_offset", "stats_length",
+    "days_offset", "days_length",
+    "trips", "min_lon", "min_lat", "max_lon", "max_lat"
+]
+
+# =========================
+# BBOX
+# =========================
+def od_bbox(linked_trips):
+    """[min_lon, min_lat, max_lon, max_lat] of every route / endpoint (None if empty)"""
+    pts = []
+    for lt in linked_trips:
+        for end in (lt["origin"], lt["destination"]):
+            if end.get("lat") is not None and end.get("lon") is not None:
+                pts.append([[end["lat"], end["lon"]]])
+        for leg in lt["legs"]:
+            if leg.get("route"):
+                pts.append(leg["route"])
+    if not pts:
+        return None
+
+    latlon = np.concatenate([np.asarray(p, dtype=np.float64) for p in pts])
+    latlon = latlon[np.isfinite(latlon).all(axis=1)]
+    if not len(latlon):
+        return None
+    lo, hi = latlon.min(axis=0), latlon.max(axis=0)
+    return [round(float(v), 6) for v in (lo[1], lo[0], hi[1], hi[0])]
+
+# =========================
+# BLOCKS
+# =========================
+def _gzip_bytes(path):
+    if os.path.exists(path + ".gz"):
+        with open(path + ".gz", "rb") as f:
+            return f.read()
+    with open(path, "rb") as f:
+        return gzip.compress(f.read(), 9, mtime=0)
+
+
+def _od_file(files, base, suffixes):
+    """first of `files` named {base}{suffix} for one of `suffixes` (None if absent)"""
+    by_name = {os.path.basename(p): p for p in files}
+    return next((by_name[base + s] for s in suffixes if base + s in by_name), None)
+
+
+def _sample_format(files):
+    return "v3" if any(p.endswith(".v3.json") for p in files) else "v2"
+
+# =========================
+# ARCHIVE
+# =========================
+def write_pack(out_dir, ods, generated_at=None):
+    """
+    Pack every OD's output files into out_dir/samples.pack.
+
+    `ods` is a list of (od, files, trips, bbox) with `files` the OD's
+    output paths. Returns manifest entries of the archive and its index.
+    """
+    pack_path = os.path.join(out_dir, PACK_NAME)
+    index_path = os.path.join(out_dir, INDEX_NAME)
+
+    index = {}
+    formats = set()
+
+    def write(f):
+        offset = 0
+
+        def block(data):
+            nonlocal offset
+            f.write(data)
+            offset += len(data)
+            return [offset - len(data), len(data)]
+
+        for od, files, trips, bbox in ods:
+            base = f"{od[0]}_to_{od[1]}"
+            row = []
+            for suffixes in BLOCKS.values():
+                path = _od_file(files, base, suffixes)
+                row += block(_gzip_bytes(path)) if path else [0, 0]
+
+            # day files → blocks; the day index then points at their offsets
+            path = _od_file(files, base, (DAYS_SUFFIX,))
+            if path:
+                with open(path, encoding="utf-8") as fp:
+                    days = json.load(fp)
+                folder = os.path.dirname(path)
+                for day in days["days"]:
+                    for kind in ("sample", "detail"):
+                        if day.get(kind):
+                            day[kind] = block(_gzip_bytes(os.path.join(folder, day[kind])))
+                data = json.dumps(days, separators=(",", ":"), allow_nan=False).encode("utf-8")
+                row += block(gzip.compress(data, 9, mtime=0))
+            else:
+                row += [0, 0]
+
+            index[base] = row + [int(trips)] + list(bbox or [None] * 4)
+            formats.add(_sample_format(files))
+
+    pack_bytes = write_stream_atomic(pack_path, write, binary=True)
+
+    doc = {
+        "schema": SCHEMA,
+        "generated_at": generated_at,
+        "archive": PACK_NAME,
+        "encoding": "gzip",
+        "sample_format": "v3" if formats == {"v3"} else "v2" if formats == {"v2"} else "mixed",
+        "bytes": pack_bytes,
+        "fields": FIELDS,
+        "ods": index
+    }
+    data = json.dumps(doc, separators=(",", ":"), allow_nan=False).encode("utf-8")
+    index_bytes = write_bytes_atomic(index_path, data)
+    trips = sum(int(t) for _, _, t, _ in ods)
+
+    return [
+        {"path": pack_path, "bytes": pack_bytes, "trip_count": trips},
+        {"path": index_path, "bytes": index_bytes, "trip_count": trips},
+    ]
+
+
+def read_block(pack_path, offset, length):
+    """Inflated JSON of one block (what a Range request + gunzip gives)"""
+    with open(pack_path, "rb") as f:
+        f.seek(offset)
+        return json.loads(gzip.decompress(f.read(length)))
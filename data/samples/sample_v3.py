@@ -0,0 +1,333 @@
+# ============================================================
+# Compact sample format (nova.complete_trip.sample.v3)
+# - Routes: quantized + delta-encoded polyline strings (1e-5 deg)
+#   overview level in the sample, detail level in a sibling
+#   .v3.detail.json fetched on demand
+# - Legs stored column-wise for the whole file, repeated strings
+#   (mode, purpose, stop names, tour ids) dictionary-coded
+# - Times as seconds (ms precision) from one time base
+# - Origin / destination / transfers rebuilt from the legs on decode
+#   (endpoint lat/lon = geohash7 cell centre, as in v2)
+# Decoded with decodeSampleV3() in assets/js/app.js → v2 shape
+# ============================================================
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import geohash7
+from route_simplify import simplify
+
+SCHEMA = "nova.complete_trip.sample.v3"
+DETAIL_SCHEMA = "nova.complete_trip.sample_detail.v3"
+PRECISION = 5          # route coordinates: 1e-5 deg (~1 m)
+GEOM_DIGITS = 6        # tract polygons
+DURATION_DIGITS = 3
+
+# =========================
+# POLYLINE (Google encoded polyline algorithm, batched)
+# =========================
+def encode_polylines(coords, offsets, precision=PRECISION):
+    """
+    (n, 2) lat/lon points split by CSR `offsets` → one polyline string
+    per route. Every route starts from (0, 0).
+    """
+    q = np.round(np.asarray(coords, dtype=np.float64) * 10 ** precision).astype(np.int64)
+    q = q.reshape(-1, 2)
+    n_routes = len(offsets) - 1
+
+    delta = q.copy()
+    delta[1:] -= q[:-1]
+    starts = np.asarray(offsets[:-1], dtype=np.int64)
+    starts = starts[starts < len(q)]
+    delta[starts] = q[starts]
+
+    # zigzag, then 5-bit chunks (low first), 0x20 = more chunks follow
+    v = delta.ravel()
+    z = ((v << 1) ^ (v >> 63)).astype(np.uint64)
+    n_chunks = np.ones(len(z), dtype=np.int64)
+    for k in range(1, 13):
+        n_chunks += z >= np.uint64(1 << (5 * k))
+
+    total = int(n_chunks.sum())
+    first = np.cumsum(n_chunks) - n_chunks
+    k = np.arange(total, dtype=np.int64) - np.repeat(first, n_chunks)
+    zz = np.repeat(z, n_chunks)
+    chunk = (zz >> (5 * k).astype(np.uint64)) & np.uint64(31)
+    more = k < np.repeat(n_chunks, n_chunks) - 1
+    chunk |= np.where(more, np.uint64(0x20), np.uint64(0))
+    text = (chunk + np.uint64(63)).astype(np.uint8).tobytes().decode("ascii")
+
+    # characters per route
+    per_value = np.zeros(len(q) * 2 + 1, dtype=np.int64)
+    np.cumsum(n_chunks, out=per_value[1:])
+    bounds = per_value[2 * np.asarray(offsets, dtype=np.int64)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(n_routes)]
+
+
+def decode_polyline(text, precision=PRECISION):
+    """Polyline string → [[lat, lon], ...]"""
+    scale = 10 ** precision
+    out = []
+    lat = lon = 0
+    i = 0
+    while i < len(text):
+        vals = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(text[i]) - 63
+                i += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            vals.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += vals[0]
+        lon += vals[1]
+        out.append([lat / scale, lon / scale])
+    return out
+
+# =========================
+# HELPERS
+# =========================
+def _dict_encode(values):
+    """Values → (distinct values, index per value); None stays None"""
+    lookup = {}
+    codes = []
+    for v in values:
+        if v is None:
+            codes.append(None)
+            continue
+        if v not in lookup:
+            lookup[v] = len(lookup)
+        codes.append(lookup[v])
+    return list(lookup), codes
+
+
+def _round(x, digits):
+    return None if x is None else round(x, digits)
+
+
+def _round_coords(obj, digits=GEOM_DIGITS):
+    if isinstance(obj, (list, tuple)):
+        return [_round_coords(v, digits) for v in obj]
+    if isinstance(obj, float):
+        return round(obj, digits)
+    return obj
+
+
+def _round_geometry(geom):
+    if geom is None:
+        return None
+    return {**geom, "coordinates": _round_coords(geom["coordinates"])}
+
+
+def round_od(od, include_geometry=True):
+    """OD ends with tract polygons rounded to GEOM_DIGITS, or without them"""
+    if not include_geometry:
+        return {end: {k: v for k, v in od[end].items() if k != "geometry"} for end in ("origin", "destination")}
+    return {
+        end: {**od[end], "geometry": _round_geometry(od[end].get("geometry"))}
+        for end in ("origin", "destination")
+    }
+
+
+def _parse_times(times):
+    return pd.to_datetime(pd.Series(times, dtype=object), errors="coerce", format="ISO8601")
+
+
+def _seconds_from(times, base):
+    """ISO strings (or None) → seconds after `base` (int when whole)"""
+    s = (_parse_times(times) - base).dt.total_seconds().round(3)
+    return [None if pd.isna(x) else (int(x) if x == int(x) else float(x)) for x in s]
+
+
+def _iso(base, seconds):
+    if seconds is None:
+        return None
+    t = base + timedelta(seconds=seconds)
+    return t.isoformat(timespec="seconds" if t.microsecond == 0 else "milliseconds")
+
+def _encode_routes(legs, tolerance_m=None):
+    """Leg routes ([[lat, lon], ...]) → polylines, simplified to `tolerance_m`"""
+    routes = [leg["route"] or [] for leg in legs]
+    offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in routes], out=offsets[1:])
+    coords = np.array([p for r in routes for p in r], dtype=np.float64).reshape(-1, 2)
+
+    if tolerance_m is not None:
+        lonlat, offsets = simplify(coords[:, ::-1], offsets, tolerance_m)
+        coords = lonlat[:, ::-1]
+    return encode_polylines(coords, offsets)
+
+
+def _od_ids(od):
+    return {end: od[end]["tract_id"] for end in ("origin", "destination")}
+
+# =========================
+# ENCODE
+# =========================
+def _leg_offsets(linked_trips):
+    offsets = np.zeros(len(linked_trips) + 1, dtype=np.int64)
+    np.cumsum([len(lt["legs"]) for lt in linked_trips], out=offsets[1:])
+    return offsets.tolist()
+
+
+def encode_sample(od, linked_trips, generated_at=None, overview_m=None, include_geometry=True):
+    """
+    v3 document for one OD from v2-shaped `linked_trips`
+    (the exact list the builder puts into the v2 file).
+
+    With `overview_m`, routes are further simplified to that tolerance
+    (the full routes go to `encode_detail`). Without `include_geometry`
+    the tract polygons are left out (stored once in the OD's day index).
+    """
+    legs = [leg for lt in linked_trips for leg in lt["legs"]]
+
+    starts = [leg["start_time"] for leg in legs]
+    parsed = _parse_times(starts).dropna()
+    base = parsed.min().normalize() if len(parsed) else pd.Timestamp("2020-01-01")
+
+    modes, mode_codes = _dict_encode([leg["mode"] for leg in legs])
+    purposes, purpose_codes = _dict_encode([leg["meta"]["purpose"] for leg in legs])
+    tours, tour_codes = _dict_encode([leg["meta"]["tour_id"] for leg in legs])
+    stops, _ = _dict_encode(
+        [leg["access"]["stop_name"] for leg in legs] + [leg["egress"]["stop_name"] for leg in legs]
+    )
+    stop_code = {s: i for i, s in enumerate(stops)}
+
+    return {
+        "schema": SCHEMA,
+        "generated_at": generated_at or datetime.utcnow().isoformat() + "Z",
+        "od": round_od(od, include_geometry),
+        "count": len(linked_trips),
+        "encoding": {
+            "route": "polyline",
+            "precision": PRECISION,
+            "lod": "overview" if overview_m is not None else "detail",
+            "tolerance_m": overview_m,
+            "time_base": base.isoformat(),
+            "time_unit": "s"
+        },
+        "dict": {
+            "mode": modes,
+            "purpose": purposes,
+            "tour_id": tours,
+            "stop_name": stops
+        },
+        "linked_trips": {
+            "linked_trip_id": [lt["linked_trip_id"] for lt in linked_trips],
+            "weight": [lt["weight"] for lt in linked_trips],
+            "leg_offsets": _leg_offsets(linked_trips)
+        },
+        "legs": {
+            "id": [leg["id"] for leg in legs],
+            "mode": mode_codes,
+            "route": _encode_routes(legs, overview_m),
+            "start": _seconds_from(starts, base),
+            "end": _seconds_from([leg.get("end_time") for leg in legs], base),
+            "duration_min": [_round(leg["duration_min"], DURATION_DIGITS) for leg in legs],
+            "network_distance_km": [leg["network_distance_km"] for leg in legs],
+            "route_distance_km": [leg["route_distance_km"] for leg in legs],
+            "o_geohash": [leg["origin"]["geohash"] for leg in legs],
+            "d_geohash": [leg["destination"]["geohash"] for leg in legs],
+            "access_stop_id": [leg["access"]["stop_id"] for leg in legs],
+            "access_stop": [stop_code.get(leg["access"]["stop_name"]) for leg in legs],
+            "egress_stop_id": [leg["egress"]["stop_id"] for leg in legs],
+            "egress_stop": [stop_code.get(leg["egress"]["stop_name"]) for leg in legs],
+            "tour_id": tour_codes,
+            "purpose": purpose_codes,
+            "weight": [leg["meta"]["weight"] for leg in legs]
+        }
+    }
+
+def encode_detail(od, linked_trips, generated_at=None, detail_m=None):
+    """Detail-level routes of every leg, in the order of `encode_sample`"""
+    legs = [leg for lt in linked_trips for leg in lt["legs"]]
+    return {
+        "schema": DETAIL_SCHEMA,
+        "generated_at": generated_at or datetime.utcnow().isoformat() + "Z",
+        "od": _od_ids(od),
+        "encoding": {
+            "route": "polyline",
+            "precision": PRECISION,
+            "lod": "detail",
+            "tolerance_m": detail_m
+        },
+        "linked_trip_id": [lt["linked_trip_id"] for lt in linked_trips],
+        "leg_offsets": _leg_offsets(linked_trips),
+        "route": _encode_routes(legs)
+    }
+
+# =========================
+# DECODE (mirror of decodeSampleV3 in app.js)
+# =========================
+def decode_sample(doc, detail=None):
+    """
+    v3 document → v2-shaped dict (schema, od, count, linked_trips);
+    routes come from the `detail` document when given.
+    """
+    enc, dic, trips, cols = doc["encoding"], doc["dict"], doc["linked_trips"], doc["legs"]
+    routes = detail["route"] if detail is not None else cols["route"]
+    base = datetime.fromisoformat(enc["time_base"])
+
+    def pick(table, i):
+        return None if i is None else table[i]
+
+    def point(gh):
+        lat, lon = geohash7.decode(np.array([gh], dtype=object))
+        lat, lon = float(lat[0]), float(lon[0])
+        if np.isnan(lat):
+            lat = lon = None
+        return {"lon": lon, "lat": lat, "geohash": gh}
+
+    linked_trips = []
+    for t, lid in enumerate(trips["linked_trip_id"]):
+        a, b = trips["leg_offsets"][t], trips["leg_offsets"][t + 1]
+        legs = []
+        for i in range(a, b):
+            legs.append({
+                "id": cols["id"][i],
+                "mode": pick(dic["mode"], cols["mode"][i]),
+                "route": decode_polyline(routes[i], enc["precision"]),
+                "start_time": _iso(base, cols["start"][i]),
+                "end_time": _iso(base, cols["end"][i]),
+                "duration_min": cols["duration_min"][i],
+                "network_distance_km": cols["network_distance_km"][i],
+                "route_distance_km": cols["route_distance_km"][i],
+                "origin": point(cols["o_geohash"][i]),
+                "destination": point(cols["d_geohash"][i]),
+                "access": {
+                    "stop_id": cols["access_stop_id"][i],
+                    "stop_name": pick(dic["stop_name"], cols["access_stop"][i])
+                },
+                "egress": {
+                    "stop_id": cols["egress_stop_id"][i],
+                    "stop_name": pick(dic["stop_name"], cols["egress_stop"][i])
+                },
+                "meta": {
+                    "linked_trip_id": lid,
+                    "tour_id": pick(dic["tour_id"], cols["tour_id"][i]),
+                    "purpose": pick(dic["purpose"], cols["purpose"][i]),
+                    "weight": cols["weight"][i]
+                },
+                "leg_index": i - a
+            })
+
+        linked_trips.append({
+            "linked_trip_id": lid,
+            "origin": {**legs[0]["origin"], "start_time": legs[0]["start_time"]},
+            "destination": {**legs[-1]["destination"], "end_time": legs[-1]["end_time"]},
+            "transfers": [
+                {"lat": l["destination"]["lat"], "lon": l["destination"]["lon"],
+                 "geohash": l["destination"]["geohash"]}
+                for l in legs[:-1]
+                if l["destination"]["lat"] is not None and l["destination"]["lon"] is not None
+            ],
+            "legs": legs,
+            "weight": trips["weight"][t]
+        })
+
+    return {"schema": doc["schema"], "od": doc["od"], "count": doc["count"], "linked_trips": linked_trips}
@@ -4,61 +4,149 @@
 # - Geometry built only for needed trips
 # - JSON-safe
 # - 100% OLD JSON schema compatible
+# - Staged: load → tract_join → geometry → assembly → stats → export,
+#   each stage's output checkpointed under CACHE_DIR/checkpoints; a
+#   rerun resumes from the first stage whose inputs changed
+#
+#   python data/samples/select_Jan_remove_far_connection_test.py
+#       --config site.json        settings (default: select_Jan.config.json)
+#       --stages export           only these stages, inputs from checkpoints
+#       --from geometry           this stage and every later one
+#       --list                    checkpoint status
 # ============================================================
 
 # =========================
-# CONFIG
+# CONFIG (defaults; any key can be set in the JSON config file)
 # =========================
-BASE_DIR = "C:/Users/rli04/Villanova University/Complete-trip-coordinate - Documents/General"
-PARQUET_DIR = f"{BASE_DIR}/Salt_Lake/delivery"
-TRACT_SHP = (
-    f"{BASE_DIR}/Manuscript/Figure/Visualization-RL/"
-    f"2-OD patterns by census track/six_counties_track.shp"
-)
-
-MONTHS = ["Jan"]
-MAX_DIST_MILES = 1.0
-
-OUTPUT_DIR = "./data/samples"
-import os
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-OD_PAIRS = [
-    ("49035114000", "49035980000"),
-    ("49035114000", "49035110106"),
-    ("49035114000", "49035101402"),
-    ("49035980000", "49035114000"),
-    ("49035980000", "49035110106"),
-    ("49035980000", "49035101402"),
-    ("49035110106", "49035114000"),
-    ("49035110106", "49035980000"),
-    ("49035110106", "49035101402"),
-    ("49035101402", "49035114000"),
-    ("49035101402", "49035980000"),
-    ("49035101402", "49035110106"),
-]
+CONFIG_PATH = "./data/samples/select_Jan.config.json"
+
+DEFAULTS = {
+    # delivery root; the three paths below are relative to it
+    "base_dir": "C:/Users/rli04/Villanova University/Complete-trip-coordinate - Documents/General",
+    "parquet_dir": "Salt_Lake/delivery",
+    "tract_shp": "Manuscript/Figure/Visualization-RL/2-OD patterns by census track/six_counties_track.shp",
+    "network_dir": "Salt_Lake/supplementInputs/network",
+
+    "months": ["Jan"],
+    "max_dist_miles": 1.0,
+
+    # route levels of detail (Douglas-Peucker tolerance, meters)
+    "route_detail_m": 3.0,         # sample "route" (v2) / v3 detail file
+    "route_overview_m": 25.0,      # v3 route drawn for every trip
+
+    # out-of-core mode for multi-month builds: peak memory ~ stream_chunk_rows
+    "stream": False,
+    "stream_chunk_rows": 2_000_000,
+
+    "output_dir": "./data/samples",
+    "cache_dir": "./data/cache",   # lookup artifacts, build cache, checkpoints
+    "rebuild": False,              # True → ignore the build cache + checkpoints
+
+    "export_workers": None,        # None → one writer process per CPU
+
+    # sample files per OD: "v3" → compact {O}_to_{D}.v3.json (+ .gz / .br),
+    # "v2" → legacy pretty-printed {O}_to_{D}.json
+    "sample_formats": ["v3"],
+
+    # v2 files are streamed one linked trip at a time; compact → minified.
+    # json_backend: None / "json" → stdlib (same bytes as json.dump, NaN
+    # fails the export), "orjson" → faster, but NaN / inf written as null
+    "v2_compact": False,
+    "json_backend": None,
+
+    # one samples.pack (+ byte-range index) in output_dir instead of per-OD
+    # files; the per-OD files then stay under cache_dir as pack inputs
+    "pack_samples": True,
+
+    # v3 sample / detail per service day + {O}_to_{D}.days.json (day → trip
+    # and per-hour counts); the day selector then loads one day's trips only
+    "day_partition": True,
+
+    # run report: per-stage time, peak RSS, rows in / out, drops per reason
+    # (None → cache_dir/reports/select_Jan.json); profile = "cprofile" /
+    # "pyinstrument" → one profile per stage
+    "run_report": None,
+    "profile": None,
+
+    # OD pairs to export; None → every OD with at least min_od_count linked trips
+    "min_od_count": 1,
+    "od_pairs": [
+        ["49035114000", "49035980000"],
+        ["49035114000", "49035110106"],
+        ["49035114000", "49035101402"],
+        ["49035980000", "49035114000"],
+        ["49035980000", "49035110106"],
+        ["49035980000", "49035101402"],
+        ["49035110106", "49035114000"],
+        ["49035110106", "49035980000"],
+        ["49035110106", "49035101402"],
+        ["49035101402", "49035114000"],
+        ["49035101402", "49035980000"],
+        ["49035101402", "49035110106"],
+    ],
+}
 
 # =========================
 # IMPORTS
 # =========================
+import argparse
+import json
+import os
 import pandas as pd
 import numpy as np
 import geopandas as gpd
-import pygeohash as pgh
-from shapely.geometry import Point, LineString, mapping
-from shapely import wkt
-import glob
-import json
+import pyarrow.dataset as ds
+from shapely.geometry import mapping
 import math
+import shutil
 from datetime import datetime, timedelta
 from collections import defaultdict
+from functools import partial
+from types import SimpleNamespace
+
+import geohash7
+from parquet_scan import candidate_filter, count_rows, month_files, scan_candidates
+from tract_index import NO_TRACT, TractIndex
+from link_store import LinkStore
+from route_assembly import assemble_routes
+from od_partition import ODPartitions, linked_trip_od, od_mask, partition_by_od, partition_summaries
+from export_pool import export_files, write_json_atomic, write_manifest
+from build_cache import BuildCache, file_signature, fingerprint, load_legs, save_legs
+from checkpoints import (
+    CheckpointStore, linked_trip_schema, load_linked_trips, load_table,
+    save_linked_trips, save_table
+)
+from od_stats import leg_summary, od_stats_all
+from sample_days import day_file, day_index, partition_by_day
+from sample_pack import od_bbox, write_pack
+from sample_v3 import encode_detail, encode_sample, round_od
+from streaming import ODAccumulator, iter_chunks, spill_buckets
+from run_report import PROFILERS, RunReport
+from trip_schema import SCHEMA_VERSION, format_memory, lean_trips, memory_report, release_arrow_memory
+
+
+def load_config(path=None):
+    """DEFAULTS overridden by the JSON file at `path` (unknown keys rejected)"""
+    cfg = dict(DEFAULTS)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            user = json.load(f)
+        unknown = sorted(set(user) - set(DEFAULTS))
+        if unknown:
+            raise ValueError(f"{path}: unknown config keys {unknown}")
+        cfg.update(user)
+
+    for key in ("parquet_dir", "tract_shp", "network_dir"):
+        cfg[key] = os.path.join(cfg["base_dir"], cfg[key]).replace("\\", "/")
+    if cfg["od_pairs"] is not None:
+        cfg["od_pairs"] = [tuple(od) for od in cfg["od_pairs"]]
+    cfg["od_file_dir"] = f"{cfg['cache_dir']}/od_files" if cfg["pack_samples"] else cfg["output_dir"]
+    cfg["run_report"] = cfg["run_report"] or f"{cfg['cache_dir']}/reports/select_Jan.json"
+    return SimpleNamespace(**cfg)
 
 # =========================
 # UTILS
 # =========================
-def is_finite(x):
-    return x is not None and isinstance(x, (int, float)) and math.isfinite(x)
-
 def clean_num(x):
     try:
         x = float(x)
@@ -66,14 +154,9 @@ def clean_num(x):
     except:
         return None
 
-def safe_decode_geohash(gh):
-    try:
-        lat, lon = pgh.decode(gh)
-        if is_finite(lat) and is_finite(lon):
-            return lon, lat
-    except:
-        pass
-    return None, None
+def clean_str(x):
+    # missing Parquet strings come back as NaN (pandas string dtype)
+    return x if isinstance(x, str) else None
 
 def to_iso(t):
     return t.isoformat() if t is not None else None
@@ -92,94 +175,233 @@ USE_COLS = [
     "route_taken"
 ]
 
-dfs = []
-for m in MONTHS:
-    files = glob.glob(f"{PARQUET_DIR}/Salt_Lake-{m}-2020/*.snappy.parquet")
-    dfs.extend([pd.read_parquet(f, columns=USE_COLS) for f in files])
-
-df = pd.concat(dfs, ignore_index=True)
-df["local_datetime_start"] = pd.to_datetime(df["local_datetime_start"], errors="coerce")
-df["local_datetime_end"] = pd.to_datetime(df["local_datetime_end"], errors="coerce")
-df = df[df["local_datetime_end"] > df["local_datetime_start"]]
-
-df["duration_min"] = (
-    df["local_datetime_end"] - df["local_datetime_start"]
-).dt.total_seconds() / 60
-
-df = df.sort_values(["linked_trip_id", "local_datetime_start"])
+MODE_NETWORK = {
+    "car": "auto",
+    "walk/bike": "walk",
+    "bus": "transit",
+    "rail": "transit",
+}
 
 # =========================
-# TRACT JOIN
+# RUN INPUTS (tracts, networks, build cache, checkpoints)
 # =========================
-tracts = gpd.read_file(TRACT_SHP).to_crs("EPSG:4326")
-tracts["GEOID"] = tracts["GEOID"].astype(str)
+class Run:
+    """Config + everything opened once per build; the stages read it"""
+
+    def __init__(self, cfg, forced=False):
+        self.cfg = cfg
+        os.makedirs(cfg.output_dir, exist_ok=True)
+        os.makedirs(cfg.od_file_dir, exist_ok=True)
+        self.report = RunReport(
+            "select_Jan", profile=cfg.profile, profile_dir=f"{cfg.cache_dir}/reports/profile"
+        )
+
+        # Tracts are needed up front: the OD filter is pushed down into the scan
+        self.tracts = gpd.read_file(cfg.tract_shp).to_crs("EPSG:4326")
+        self.tracts["GEOID"] = self.tracts["GEOID"].astype(str)
+        self.tract_geom = {
+            r.GEOID: mapping(r.geometry)
+            for r in self.tracts.itertuples()
+        }
 
-TRACT_GEOM = {
-    r.GEOID: mapping(r.geometry)
-    for r in tracts.itertuples()
-}
+        # sorted-array lookup; only geohashes never seen before hit the polygons
+        self.tract_index = TractIndex.open(
+            cfg.tract_shp, cfg.cache_dir, geoid_col="GEOID", tracts=self.tracts
+        )
+
+        # compiled once into cache_dir, recompiled only when a link.csv changes
+        self.link_stores = {
+            "auto": LinkStore.open(
+                f"{cfg.network_dir}/auto-biggest-connected-graph/link.csv", cfg.cache_dir, "auto",
+                "from_osm_node_id", "to_osm_node_id"
+            ),
+            "walk": LinkStore.open(
+                f"{cfg.network_dir}/walk-biggest-connected-graph/link.csv", cfg.cache_dir, "walk",
+                "from_osm_node_id", "to_osm_node_id"
+            ),
+            "transit": LinkStore.open(
+                f"{cfg.network_dir}/UTA/link with flow.csv", cfg.cache_dir, "transit",
+                "from_node_id", "to_node_id"
+            ),
+        }
 
-def gh_to_point(gh):
-    lat, lon = pgh.decode(gh)
-    return Point(lon, lat)
+        self.files = month_files(cfg.parquet_dir, cfg.months)
+        data = {
+            "parquet": [file_signature(f) for f in self.files],
+            "columns": USE_COLS,
+            "tracts": self.tract_index.tract_hash,
+            "networks": {name: store.meta for name, store in self.link_stores.items()},
+            "mode_network": MODE_NETWORK,
+            "route_detail_m": cfg.route_detail_m,
+        }
 
-gdf_o = gpd.GeoDataFrame(df, geometry=df["geohash7_orig"].apply(gh_to_point), crs="EPSG:4326")
-gdf_d = gpd.GeoDataFrame(df, geometry=df["geohash7_dest"].apply(gh_to_point), crs="EPSG:4326")
+        # BUILD CACHE (only ODs whose inputs changed are rebuilt)
+        self.build_cache = BuildCache.open(
+            cfg.cache_dir,
+            data=data,
+            config={
+                "max_dist_miles": cfg.max_dist_miles,
+                "route_overview_m": cfg.route_overview_m,
+                "sample_formats": sorted(cfg.sample_formats),
+                "v2_compact": cfg.v2_compact,
+                "day_partition": cfg.day_partition,
+                "od_geometry": "day_index" if cfg.day_partition else "sample"     # where the tract polygons live
+            },
+            reset=cfg.rebuild
+        )
+        self.checkpoints = CheckpointStore(f"{cfg.cache_dir}/checkpoints")
+        if cfg.rebuild:
+            self.checkpoints.clear()
+
+        # ODs to export (None → not known until every OD is built); stages
+        # run explicitly (--stages / --from) rebuild every requested OD
+        if forced and cfg.od_pairs is None:
+            self.requested = self.todo = None
+        else:
+            self.requested = cfg.od_pairs or self.build_cache.known_ods(cfg.min_od_count)
+            if forced or self.requested is None:
+                self.todo = self.requested
+            else:
+                self.todo = self.build_cache.stale(self.requested)
+        print(
+            "Build cache: all ODs to build" if self.todo is None
+            else f"Build cache: {len(self.todo)} of {len(self.requested)} OD pairs to build"
+        )
+
+        self.stages = STREAM_STAGES if cfg.stream else STAGES
+        self.fingerprints = self._fingerprints(data)
+
+    def needs(self, stage):
+        return () if self.cfg.stream and stage == "assembly" else NEEDS[stage]
+
+    def _fingerprints(self, data):
+        """Per stage: its own inputs + the fingerprints of the stages it reads"""
+        scope = "all" if self.todo is None else sorted(self.todo)
+        inputs = {
+            "load": {
+                "parquet": data["parquet"], "columns": USE_COLS, "dtypes": SCHEMA_VERSION,
+                "tracts": data["tracts"], "scope": scope
+            },
+            "tract_join": {"tracts": data["tracts"], "scope": scope},
+            "geometry": {k: data[k] for k in ("networks", "mode_network", "route_detail_m")},
+            "assembly": {"max_dist_miles": self.cfg.max_dist_miles},
+            "stats": {},
+        }
+        if self.cfg.stream:
+            inputs["assembly"] = {
+                **data, "dtypes": SCHEMA_VERSION, "scope": scope, **inputs["assembly"], "stream": True
+            }
 
-df["GEOID_orig"] = gpd.sjoin(gdf_o, tracts, how="left", predicate="within")["GEOID"].values
-df["GEOID_dest"] = gpd.sjoin(gdf_d, tracts, how="left", predicate="within")["GEOID"].values
+        fps = {}
+        for stage in self.stages:
+            if stage in CHECKPOINTS:
+                fps[stage] = fingerprint({
+                    "stage": stage,
+                    "inputs": inputs[stage],
+                    "upstream": [fps[n] for n in self.needs(stage)],
+                })
+        return fps
+
+    def valid(self, stage):
+        return stage in CHECKPOINTS and self.checkpoints.valid(stage, self.fingerprints[stage])
+
+    def trip_schema(self):
+        # linked_trip_id / tour_id pass through with their delivery types
+        schema = ds.dataset(self.files, format="parquet").schema
+        return linked_trip_schema(schema.field("linked_trip_id").type, schema.field("tour_id").type)
+
+    def trip_ods(self, df):
+        """linked_trip_id → (GEOID_orig, GEOID_dest) strings; legs carry tract slots"""
+        trip_od = linked_trip_od(df)
+        for c in ("GEOID_orig", "GEOID_dest"):
+            trip_od[c] = self.tract_index.geoid_of(trip_od[c].to_numpy())
+        return trip_od
+
+    def load_memory(self, memory):
+        """Per-column bytes before / after lean_trips → run report + console"""
+        if memory:
+            rep = memory_report(memory["before"], memory["after"], memory["rows"])
+            self.report.meta["load_memory"] = rep
+            print(format_memory(rep))
+
+    def export_ods(self, partitions):
+        """Requested ODs present in `partitions` (all-OD runs: every OD ≥ min_od_count)"""
+        if self.requested is None:
+            self.build_cache.record_all({od: partitions.count(od) for od in partitions})
+            self.requested = self.build_cache.known_ods(self.cfg.min_od_count)
+        return [od for od in self.requested if od in partitions]
 
 # =========================
-# OD-FIRST FILTER
+# PREPARE LEGS (times, geohash decode, tract join, OD-first filter)
 # =========================
-OD_SET = set(OD_PAIRS)
-
-first = df.groupby("linked_trip_id").first()
-last = df.groupby("linked_trip_id").last()
-
-keep_ids = first.index[
-    [(o, d) in OD_SET for o, d in zip(first["GEOID_orig"], last["GEOID_dest"])]
-]
-
-df = df[df["linked_trip_id"].isin(keep_ids)]
+def prepare_legs(run, df, od_pairs=None):
+    with run.report.stage("tract_join", rows_in=len(df)) as st:
+        df["local_datetime_start"] = pd.to_datetime(df["local_datetime_start"], errors="coerce")
+        df["local_datetime_end"] = pd.to_datetime(df["local_datetime_end"], errors="coerce")
+        n = len(df)
+        df = df[df["local_datetime_end"] > df["local_datetime_start"]].copy()
+        st.drop("invalid_time", n - len(df))
+
+        df["duration_min"] = (
+            df["local_datetime_end"] - df["local_datetime_start"]
+        ).dt.total_seconds() / 60
+
+        df = df.sort_values(["linked_trip_id", "local_datetime_start"])
+
+        # decode every geohash once (NaN for invalid codes)
+        o_codes = geohash7.as_codes(df["geohash7_orig"].values)
+        d_codes = geohash7.as_codes(df["geohash7_dest"].values)
+        df["o_lat"], df["o_lon"] = geohash7.decode_codes(o_codes)
+        df["d_lat"], df["d_lon"] = geohash7.decode_codes(d_codes)
+
+        # int32 tract slots (GEOID strings: run.tract_index.geoid_of)
+        df["GEOID_orig"] = run.tract_index.lookup_codes(o_codes)
+        df["GEOID_dest"] = run.tract_index.lookup_codes(d_codes)
+        st.note("no_tract_orig", int((df["GEOID_orig"] == NO_TRACT).sum()))
+        st.note("no_tract_dest", int((df["GEOID_dest"] == NO_TRACT).sum()))
+        st.rows(rows_out=len(df))
+
+    with run.report.stage("od_filter", rows_in=len(df)) as st:
+        if od_pairs:
+            trip_od = run.trip_ods(df)
+            keep_ids = trip_od.index[od_mask(trip_od, od_pairs)]
+            n = len(df)
+            df = df[df["linked_trip_id"].isin(keep_ids)]
+            st.drop("other_od", n - len(df))
+        st.rows(rows_out=len(df))
+
+    return df
 
 # =========================
 # BUILD GEOMETRY
 # =========================
-auto_links = pd.read_csv(f"{BASE_DIR}/Salt_Lake/supplementInputs/network/auto-biggest-connected-graph/link.csv")
-walk_links = pd.read_csv(f"{BASE_DIR}/Salt_Lake/supplementInputs/network/walk-biggest-connected-graph/link.csv")
-transit_links = pd.read_csv(f"{BASE_DIR}/Salt_Lake/supplementInputs/network/UTA/link with flow.csv")
-
-auto_dict = {(int(r.from_osm_node_id), int(r.to_osm_node_id)): r.geometry for r in auto_links.itertuples()}
-walk_dict = {(int(r.from_osm_node_id), int(r.to_osm_node_id)): r.geometry for r in walk_links.itertuples()}
-transit_dict = {(int(r.from_node_id), int(r.to_node_id)): r.geometry for r in transit_links.itertuples()}
-
-def build_geometry(row):
-    nodes = [int(x) for x in str(row.route_taken).split(",") if x.strip().isdigit()]
-    if len(nodes) < 2:
-        return None
-
-    link_dict = (
-        auto_dict if row.travel_mode == "car"
-        else walk_dict if row.travel_mode == "walk/bike"
-        else transit_dict if row.travel_mode in ["bus", "rail"]
-        else None
-    )
-    if link_dict is None:
-        return None
-
-    coords = []
-    for a, b in zip(nodes[:-1], nodes[1:]):
-        if (a, b) in link_dict:
-            try:
-                coords.extend(wkt.loads(link_dict[(a, b)]).coords)
-            except:
-                continue
+def attach_routes(run, df):
+    with run.report.stage("geometry", rows_in=len(df)) as st:
+        # one batched pass over every leg: tokenize, join links, slice coords
+        routes = assemble_routes(
+            df["route_taken"].values, df["travel_mode"].values, run.link_stores, MODE_NETWORK
+        )
+        for mode, n in sorted(routes.missing.items()):
+            print(f"Missing links ({mode}): {n}")
+            st.note(f"missing_links_{mode}", n)
+        df = df.drop(columns=["route_taken"])    # the node lists are the bulk of a leg row
+
+        # detail level of every leg (endpoints kept, straight runs thinned)
+        detail = routes.simplified(run.cfg.route_detail_m)
+        df["route_xy"] = detail.to_list()      # (k, 2) lon/lat arrays
+
+        # route endpoints as plain columns for the far-connection filter
+        first, last = detail.endpoints()
+        df["route_o_lon"], df["route_o_lat"] = first[:, 0], first[:, 1]
+        df["route_d_lon"], df["route_d_lat"] = last[:, 0], last[:, 1]
+        df = df[routes.valid]
+        st.drop("no_route", len(routes) - len(df))
+        st.rows(rows_out=len(df))
+    return df
 
-    return LineString(coords) if len(coords) > 1 else None
-
-df["geometry"] = df.apply(build_geometry, axis=1)
-df = df[df["geometry"].notnull()]
+# =========================
+# FAR-CONNECTION FILTER
+# =========================
 def haversine_miles(lon1, lat1, lon2, lat2):
     R = 3958.8  # Earth radius in miles
     lon1, lat1, lon2, lat2 = map(
@@ -193,270 +415,560 @@ def haversine_miles(lon1, lat1, lon2, lat2):
     )
     return 2 * R * np.arcsin(np.sqrt(a))
 
-def leg_route_distance_ok(leg, max_dist_miles):
+def far_connection_mask(df, max_dist_miles, drops=None):
     """
-    Check if origin/destination are close enough to route geometry
+    Legs to keep: routed legs of linked trips whose every routed leg
+    starts and ends within `max_dist_miles` of its origin/destination
+    (one array pass, before any per-leg dict is built). `drops` gets
+    the dropped legs per reason.
     """
-    geom = leg.get("route")
-    if not geom or len(geom) < 2:
-        return False
-
-    # route geometry first/last point (lat, lon)
-    route_start_lat, route_start_lon = geom[0]
-    route_end_lat, route_end_lon = geom[-1]
-
-    # origin
-    o = leg["origin"]
-    d = leg["destination"]
-
-    if o["lat"] is None or o["lon"] is None:
-        return False
-    if d["lat"] is None or d["lon"] is None:
-        return False
+    routed = df["route_o_lon"].notna().to_numpy()
 
     dist_o = haversine_miles(
-        o["lon"], o["lat"],
-        route_start_lon, route_start_lat
+        df["o_lon"].to_numpy(float), df["o_lat"].to_numpy(float),
+        df["route_o_lon"].to_numpy(float), df["route_o_lat"].to_numpy(float)
     )
     dist_d = haversine_miles(
-        d["lon"], d["lat"],
-        route_end_lon, route_end_lat
+        df["d_lon"].to_numpy(float), df["d_lat"].to_numpy(float),
+        df["route_d_lon"].to_numpy(float), df["route_d_lat"].to_numpy(float)
     )
-
-    return dist_o <= max_dist_miles and dist_d <= max_dist_miles
+    # NaN / inf coordinates never pass
+    leg_ok = (dist_o <= max_dist_miles) & (dist_d <= max_dist_miles)
+
+    # one far leg drops its whole linked trip
+    trip, _ = pd.factorize(df["linked_trip_id"], use_na_sentinel=False)
+    far = np.bincount(trip, weights=routed & ~leg_ok, minlength=trip.max(initial=-1) + 1)
+    keep = routed & (far[trip] == 0)
+    if drops is not None:
+        drops["unrouted"] = int((~routed).sum())
+        drops["far_leg"] = int((routed & ~leg_ok).sum())
+        drops["far_trip"] = int((routed & leg_ok & ~keep).sum())    # another leg was far
+    return keep
+
+def filter_far_connections(run, df):
+    with run.report.stage("far_filter", rows_in=len(df)) as st:
+        drops = {}
+        df = df[far_connection_mask(df, run.cfg.max_dist_miles, drops)]
+        for reason, n in drops.items():
+            st.drop(reason, n)
+        st.rows(rows_out=len(df))
+    return df
 
 # =========================
 # BUILD SAMPLES（🔒 对齐 leg 时间语义）
 # =========================
-def build_route(geom):
-    coords = [[lat, lon] for lon, lat in geom.coords if is_finite(lat) and is_finite(lon)]
-    return coords[::3] if len(coords) >= 2 else None
+def build_route(xy):
+    return xy[:, ::-1].tolist() if xy is not None and len(xy) >= 2 else None
+
+def build_linked_trips(df):
+    # geohash7 codes → strings, for the kept legs only
+    df = df.assign(**{
+        c: geohash7.from_codes(geohash7.as_codes(df[c].values))
+        for c in ("geohash7_orig", "geohash7_dest")
+    })
 
-samples = []
+    samples = []
+    for r in df.itertuples():
+        route = build_route(r.route_xy)
+
+        o_lon, o_lat = clean_num(r.o_lon), clean_num(r.o_lat)
+        d_lon, d_lat = clean_num(r.d_lon), clean_num(r.d_lat)
+
+        start_dt = r.local_datetime_start
+        duration = clean_num(r.duration_min)
+
+        end_dt = (
+            start_dt + timedelta(minutes=duration)
+            if start_dt is not None and duration is not None
+            else None
+        )
+
+        samples.append({
+            "id": str(r.trip_id),
+            "mode": str(r.travel_mode).lower().strip(),
+            "route": route,
+            "start_time": to_iso(start_dt),
+            "end_time": to_iso(end_dt),          # 🔒 ALIGN
+            "duration_min": duration,            # 🔒 ALIGN
+            "network_distance_km": clean_num(r.network_distance),
+            "route_distance_km": clean_num(r.route_distance),
+            "origin": {
+                "lon": o_lon,
+                "lat": o_lat,
+                "geohash": clean_str(r.geohash7_orig)
+            },
+            "destination": {
+                "lon": d_lon,
+                "lat": d_lat,
+                "geohash": clean_str(r.geohash7_dest)
+            },
+            "access": {
+                "stop_id": clean_num(r.access_stop_id),
+                "stop_name": clean_str(r.access_stop)
+            },
+            "egress": {
+                "stop_id": clean_num(r.egress_stop_id),
+                "stop_name": clean_str(r.egress_stop)
+            },
+            "meta": {
+                "linked_trip_id": r.linked_trip_id,
+                "tour_id": r.tour_id,
+                "purpose": clean_str(r.trip_purpose),
+                "weight": clean_num(r.trip_weight)
+            }
+        })
 
-for r in df.itertuples():
-    route = build_route(r.geometry)
-    if route is None:
-        continue
+    # GROUP + BUILD LINKED TRIPS（🔒 对齐 destination.end_time）
+    groups = defaultdict(list)
+    for s in samples:
+        groups[s["meta"]["linked_trip_id"]].append(s)
 
-    o_lon, o_lat = safe_decode_geohash(r.geohash7_orig)
-    d_lon, d_lat = safe_decode_geohash(r.geohash7_dest)
+    linked_trips_full = []
 
-    start_dt = r.local_datetime_start
-    duration = clean_num(r.duration_min)
+    for lid, trips in groups.items():
+        trips = sorted(trips, key=lambda x: x["start_time"])
 
-    end_dt = (
-        start_dt + timedelta(minutes=duration)
-        if start_dt is not None and duration is not None
-        else None
-    )
+        for i, t in enumerate(trips):
+            t["leg_index"] = i
 
-    samples.append({
-        "id": str(r.trip_id),
-        "mode": str(r.travel_mode).lower().strip(),
-        "route": route,
-        "start_time": to_iso(start_dt),
-        "end_time": to_iso(end_dt),          # 🔒 ALIGN
-        "duration_min": duration,            # 🔒 ALIGN
-        "network_distance_km": clean_num(r.network_distance),
-        "route_distance_km": clean_num(r.route_distance),
-        "origin": {
-            "lon": o_lon,
-            "lat": o_lat,
-            "geohash": r.geohash7_orig
-        },
-        "destination": {
-            "lon": d_lon,
-            "lat": d_lat,
-            "geohash": r.geohash7_dest
-        },
-        "access": {
-            "stop_id": clean_num(r.access_stop_id),
-            "stop_name": r.access_stop
-        },
-        "egress": {
-            "stop_id": clean_num(r.egress_stop_id),
-            "stop_name": r.egress_stop
-        },
-        "meta": {
-            "linked_trip_id": r.linked_trip_id,
-            "tour_id": r.tour_id,
-            "purpose": r.trip_purpose,
-            "weight": clean_num(r.trip_weight)
+        origin = {
+            **trips[0]["origin"],
+            "start_time": trips[0]["start_time"]
         }
-    })
 
-# =========================
-# GROUP + BUILD LINKED TRIPS（🔒 对齐 destination.end_time）
-# =========================
-groups = defaultdict(list)
-for s in samples:
-    groups[s["meta"]["linked_trip_id"]].append(s)
-
-linked_trips_full = []
-
-for lid, trips in groups.items():
-    trips = sorted(trips, key=lambda x: x["start_time"])
-    if not all(
-        leg_route_distance_ok(t, MAX_DIST_MILES)
-        for t in trips
-    ):
-        continue
-
-    for i, t in enumerate(trips):
-        t["leg_index"] = i
-
-    origin = {
-        **trips[0]["origin"],
-        "start_time": trips[0]["start_time"]
-    }
-
-    destination = {
-        **trips[-1]["destination"],
-        "end_time": trips[-1]["end_time"]    # 🔒 ALIGN（不再 fallback）
-    }
-
-    transfers = [
-        {
-            "lat": t["destination"]["lat"],
-            "lon": t["destination"]["lon"],
-            "geohash": t["destination"]["geohash"]
+        destination = {
+            **trips[-1]["destination"],
+            "end_time": trips[-1]["end_time"]    # 🔒 ALIGN（不再 fallback）
         }
-        for t in trips[:-1]
-        if t["destination"]["lat"] is not None and t["destination"]["lon"] is not None
-    ]
-
-    weight = max(t["meta"]["weight"] or 0 for t in trips)
-
-    linked_trips_full.append({
-        "linked_trip_id": lid,
-        "origin": origin,
-        "destination": destination,
-        "transfers": transfers,
-        "legs": trips,
-        "weight": weight
-    })
 
-linked_trips_full = sorted(linked_trips_full, key=lambda x: -x["weight"])
+        transfers = [
+            {
+                "lat": t["destination"]["lat"],
+                "lon": t["destination"]["lon"],
+                "geohash": t["destination"]["geohash"]
+            }
+            for t in trips[:-1]
+            if t["destination"]["lat"] is not None and t["destination"]["lon"] is not None
+        ]
+
+        # always a float (0.0 when no leg has a weight): same JSON from a checkpoint
+        weight = max(t["meta"]["weight"] or 0.0 for t in trips)
+
+        linked_trips_full.append({
+            "linked_trip_id": lid,
+            "origin": origin,
+            "destination": destination,
+            "transfers": transfers,
+            "legs": trips,
+            "weight": weight
+        })
+
+    linked_trips_full = sorted(linked_trips_full, key=lambda x: -x["weight"])
+    return linked_trips_full
 
 # =========================
-# EXPORT（不变）
+# STAGES
 # =========================
-for ORIG, DEST in OD_PAIRS:
-    subset = [
-        lt for lt in linked_trips_full
-        if df.loc[df["linked_trip_id"] == lt["linked_trip_id"], "GEOID_orig"].iloc[0] == ORIG
-        and df.loc[df["linked_trip_id"] == lt["linked_trip_id"], "GEOID_dest"].iloc[-1] == DEST
-    ]
-
-    out = {
-        "schema": "nova.complete_trip.sample.v2",
-        "generated_at": datetime.utcnow().isoformat() + "Z",
-        "od": {
+STAGES = ("load", "tract_join", "geometry", "assembly", "stats", "export")
+STREAM_STAGES = ("assembly", "stats", "export")      # assembly reads the delivery itself
+NEEDS = {
+    "load": (),
+    "tract_join": ("load",),
+    "geometry": ("tract_join",),
+    "assembly": ("geometry",),
+    "stats": ("assembly",),
+    "export": ("assembly", "stats"),
+}
+CHECKPOINTS = ("load", "tract_join", "geometry", "assembly", "stats")
+
+
+def stage_load(run, inputs):
+    n_rows = count_rows(run.files)
+    memory = {}
+    with run.report.stage("load", rows_in=n_rows) as st:
+        df = lean_trips(
+            scan_candidates(run.files, USE_COLS, od_pairs=run.todo, tracts=run.tracts, table=True), memory
+        )
+        release_arrow_memory()
+        st.drop("od_pushdown", n_rows - len(df))
+        st.rows(rows_out=len(df))
+    run.load_memory(memory)
+    return df
+
+
+def stage_tract_join(run, inputs):
+    return prepare_legs(run, inputs["load"], run.todo)
+
+
+def stage_geometry(run, inputs):
+    return attach_routes(run, inputs["tract_join"])
+
+
+def stage_assembly(run, inputs):
+    df = inputs["geometry"]
+    kept = filter_far_connections(run, df)
+
+    with run.report.stage("assembly", rows_in=len(kept)) as st:
+        trip_od = run.trip_ods(df)
+        # stats summaries from the leg table, before the dicts are built
+        summaries = partition_summaries(*leg_summary(kept), trip_od, run.todo)
+        linked_trips_full = build_linked_trips(kept)
+
+        # one pass: linked trips grouped by first-leg orig / last-leg dest tract
+        partitions = partition_by_od(linked_trips_full, trip_od, run.todo)
+        n_trips = sum(len(subset) for subset in partitions.values())
+        st.note("rows_out_unit", "linked_trip")
+        st.note("linked_trips", len(linked_trips_full))
+        st.drop("linked_trip_other_od", len(linked_trips_full) - n_trips)
+        st.rows(rows_out=n_trips)
+    return ODPartitions(partitions, summaries)
+
+
+def stage_assembly_stream(run, inputs):
+    # one bucket of complete linked trips at a time; per-OD linked trips
+    # merged on disk across chunks and left there: stats, checkpoint and
+    # export read them back one OD at a time (closed once freed)
+    cfg = run.cfg
+    spill_dir = f"{cfg.cache_dir}/stream"
+    shutil.rmtree(spill_dir, ignore_errors=True)      # leftovers of an interrupted run
+    with run.report.stage("load", rows_in=count_rows(run.files)) as load:
+        dataset_filter = candidate_filter(
+            ds.dataset(run.files, format="parquet"), run.todo, run.tracts
+        )
+        buckets = spill_buckets(
+            run.files, USE_COLS, f"{spill_dir}/buckets", cfg.stream_chunk_rows, filter=dataset_filter
+        )
+    acc = ODAccumulator(spill_dir)        # close() removes the buckets folder too
+    memory = {}
+
+    for chunk in iter_chunks(buckets):
+        with run.report.stage("load") as load:
+            chunk = lean_trips(chunk, memory)
+            load.rows(rows_out=len(chunk))
+        df = attach_routes(run, prepare_legs(run, chunk, run.todo))
+        kept = filter_far_connections(run, df)
+        with run.report.stage("assembly", rows_in=len(kept)) as st:
+            trip_od = run.trip_ods(df)
+            summaries = partition_summaries(*leg_summary(kept), trip_od, run.todo)
+            linked_trips_full = build_linked_trips(kept)
+            n_trips = 0
+            for od, subset in partition_by_od(linked_trips_full, trip_od, run.todo).items():
+                acc.add(od, subset, summaries[od])
+                n_trips += len(subset)
+            st.note("rows_out_unit", "linked_trip")
+            st.note("linked_trips", len(linked_trips_full))
+            st.drop("linked_trip_other_od", len(linked_trips_full) - n_trips)
+            st.rows(rows_out=n_trips)
+        del chunk, df, kept, linked_trips_full
+    load.drop("od_pushdown", load.rows_in - (load.rows_out or 0))
+    run.load_memory(memory)
+
+    return acc.finish(run.todo or sorted(od for od in acc.ods() if acc.count(od) > 0))
+
+
+def stage_stats(run, inputs):
+    # OD-LEVEL STATS (STRICTLY OLD DEFINITION + weighted), every OD in one pass
+    partitions = inputs["assembly"]
+    rebuilt = run.export_ods(partitions)
+    with run.report.stage("stats", rows_in=len(rebuilt)) as st:
+        summaries = [partitions.summary(od) for od in rebuilt]
+        stats_docs = dict(zip(rebuilt, od_stats_all(rebuilt, summaries)))
+        st.rows(rows_out=len(stats_docs))
+    return stats_docs
+
+
+def stage_export(run, inputs):
+    cfg = run.cfg
+    built, stats_docs = inputs["assembly"], inputs["stats"]
+    rebuilt = run.export_ods(built)
+    print(f"Exporting {len(rebuilt)} OD pairs")
+
+    # ODs are read one at a time and written in batches of about
+    # stream_chunk_rows linked trips (stream mode; else one batch)
+    batch_trips = cfg.stream_chunk_rows if cfg.stream else None
+    jobs = []      # (path, obj, trip_count[, "compact"]) → written by the export pool
+    od_files = {}  # od → its output paths
+    od_meta = {}   # od → (trip count, bbox) for the build cache
+    n_trips = 0
+
+    for ORIG, DEST in rebuilt:
+        subset = built[(ORIG, DEST)]
+        od_jobs = []
+
+        od = {
             "origin": {
                 "tract_id": ORIG,
-                "geometry": TRACT_GEOM[ORIG]
+                "geometry": run.tract_geom.get(ORIG)
             },
             "destination": {
                 "tract_id": DEST,
-                "geometry": TRACT_GEOM[DEST]
+                "geometry": run.tract_geom.get(DEST)
             }
-        },
-        "count": len(subset),
-        "linked_trips": subset
-    }
-
-    out_path = f"{OUTPUT_DIR}/{ORIG}_to_{DEST}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, indent=2, allow_nan=False)
-
-    print(f"Saved {len(subset)} linked trips → {out_path}")
-
-    # =========================
-    # OD-LEVEL STATS (STRICTLY OLD DEFINITION)
-    # =========================
-
-    if subset:
-        # 1️⃣ per linked trip aggregation
-        trip_durations = []
-        trip_segments = []
-        trip_modes = []
-
-        for lt in subset:
-            legs = lt["legs"]
-
-            # total duration = sum of leg durations
-            total_dur = sum(
-                leg["duration_min"]
-                for leg in legs
-                if leg["duration_min"] is not None
-            )
-
-            trip_durations.append(total_dur)
-            trip_segments.append(len(legs))
-            trip_modes.append(set(leg["mode"] for leg in legs))
-
-        dur = np.array(trip_durations)
-        segments = np.array(trip_segments)
-        modes = trip_modes
-
-        def pct(a, q): return float(np.percentile(a, q))
-
-        BIN_WIDTH = 5
-        MAX_TIME = 180
-
-        bins = np.arange(0, MAX_TIME + BIN_WIDTH, BIN_WIDTH)
-        dur_capped = np.clip(dur, 0, MAX_TIME)
-        hist_counts, bin_edges = np.histogram(dur_capped, bins=bins)
-
-        travel_time_hist = {
-            "bin_width_min": BIN_WIDTH,
-            "max_time_min": MAX_TIME,
-            "bin_edges_min": bin_edges.tolist(),
-            "counts": hist_counts.tolist()
         }
 
-        stats = {
-            "schema": "nova.complete_trip.od_stats.v1",
-            "generated_at": datetime.utcnow().isoformat() + "Z",
-            "od": {"origin": ORIG, "destination": DEST},
-            "coverage": {"temporal": "year-2020", "spatial": "Salt Lake 6-county"},
-            "counts": {"linked_trips": int(len(dur))},
-            "trip_duration_min": {
-                "min": float(dur.min()),
-                "mean": float(dur.mean()),
-                "p25": pct(dur, 25),
-                "median": pct(dur, 50),
-                "p75": pct(dur, 75),
-                "max": float(dur.max())
-            },
-            "segments": {
-                "avg": float(segments.mean()),
-                "p75": int(pct(segments, 75)),
-                "max": int(segments.max())
-            },
-            "mode_involvement": {
-                "car": float(sum("car" in m for m in modes) / len(modes)),
-                "bus": float(sum("bus" in m for m in modes) / len(modes)),
-                "rail": float(sum("rail" in m for m in modes) / len(modes)),
-                "walk": float(sum("walk/bike" in m for m in modes) / len(modes))
-            },
-            "travel_time_distribution": travel_time_hist
-        }
+        if "v2" in cfg.sample_formats:
+            out = {
+                "schema": "nova.complete_trip.sample.v2",
+                "generated_at": datetime.utcnow().isoformat() + "Z",
+                "od": od,
+                "count": len(subset),
+                "linked_trips": subset
+            }
+            od_jobs.append((
+                f"{cfg.od_file_dir}/{ORIG}_to_{DEST}.json", out, len(subset),
+                "stream-compact" if cfg.v2_compact else "stream"
+            ))
+
+        # with a day index, the tract polygons are rounded once and stored there
+        day_blocks = "v3" in cfg.sample_formats and cfg.day_partition
+        if "v3" in cfg.sample_formats:
+            # encoded inside the export workers; overview routes in the
+            # sample, detail routes fetched on highlight
+            od_jobs.append((
+                f"{cfg.od_file_dir}/{ORIG}_to_{DEST}.v3.json",
+                partial(encode_sample, od, subset, overview_m=cfg.route_overview_m, include_geometry=not day_blocks),
+                len(subset), "compact"
+            ))
+            od_jobs.append((
+                f"{cfg.od_file_dir}/{ORIG}_to_{DEST}.v3.detail.json",
+                partial(encode_detail, od, subset, detail_m=cfg.route_detail_m),
+                len(subset), "compact"
+            ))
+
+        if day_blocks:
+            base = f"{ORIG}_to_{DEST}"
+            day_files = {}
+            for day, trips in partition_by_day(subset).items():
+                day_files[day] = {
+                    "sample": day_file(base, day, ".v3.json"),
+                    "detail": day_file(base, day, ".v3.detail.json")
+                }
+                od_jobs.append((
+                    f"{cfg.od_file_dir}/{day_files[day]['sample']}",
+                    partial(encode_sample, od, trips, overview_m=cfg.route_overview_m, include_geometry=False),
+                    len(trips), "compact"
+                ))
+                od_jobs.append((
+                    f"{cfg.od_file_dir}/{day_files[day]['detail']}",
+                    partial(encode_detail, od, trips, detail_m=cfg.route_detail_m),
+                    len(trips), "compact"
+                ))
+            od_jobs.append((
+                f"{cfg.od_file_dir}/{base}.days.json",
+                day_index(ORIG, DEST, subset, day_files, od=round_od(od)), len(subset), "compact"
+            ))
+
+        od_jobs.append((
+            f"{cfg.od_file_dir}/{ORIG}_to_{DEST}.stats.json", stats_docs[(ORIG, DEST)], len(subset)
+        ))
+
+        jobs.extend(od_jobs)
+        od_files[(ORIG, DEST)] = [job[0] for job in od_jobs]
+        od_meta[(ORIG, DEST)] = (len(subset), od_bbox(subset))
+        n_trips += len(subset)
+
+        if batch_trips is not None and n_trips >= batch_trips:
+            write_od_files(run, jobs, od_files, od_meta)
+            jobs, od_files, od_meta, n_trips = [], {}, {}, 0
+    write_od_files(run, jobs, od_files, od_meta)
+
+    # manifest + index cover reused ODs too
+    od_index = []
+    entries = []
+    pack_ods = []
+    for od in run.requested:
+        entry = run.build_cache.cached(od)
+        od_index.append({"origin": od[0], "destination": od[1], "count": entry["count"]})
+        entries.extend(entry["files"])
+        pack_ods.append((od, [e["path"] for e in entry["files"]], entry["count"], entry.get("bbox")))
+
+    if cfg.pack_samples:
+        # every OD's files → one archive; the app reads blocks by byte range
+        with run.report.stage("pack", rows_in=len(pack_ods)) as st:
+            entries = write_pack(cfg.output_dir, pack_ods, generated_at=datetime.utcnow().isoformat() + "Z")
+            st.note("bytes", entries[0]["bytes"])
+        print(f"✓ Sample pack written → {entries[0]['path']} ({entries[0]['bytes']:,} B)")
+
+    write_manifest(f"{cfg.output_dir}/manifest.json", entries)
+    run.build_cache.save()
+    print(f"Build cache: {len(rebuilt)} OD pairs rebuilt, {len(run.requested) - len(rebuilt)} reused")
+
+    # OD INDEX (which sample files exist)
+    index_path = f"{cfg.output_dir}/od_index.json"
+    write_json_atomic(index_path, {
+        "schema": "nova.complete_trip.od_index.v1",
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "count": len(od_index),
+        "ods": od_index
+    })
+    print(f"✓ OD index written → {index_path}")
+    run.report.meta["ods_rebuilt"] = len(rebuilt)
+    return rebuilt
+
+
+def write_od_files(run, jobs, od_files, od_meta):
+    """Write one batch of export jobs (parallel, atomic) and record its ODs in the build cache"""
+    if not jobs:
+        return
+    with run.report.stage("export", rows_in=len(jobs)) as st:
+        written = export_files(jobs, workers=run.cfg.export_workers, json_backend=run.cfg.json_backend)
+        st.note("bytes", sum(e["bytes"] for e in written))
+        st.rows(rows_out=len(written))
+    for e in written:
+        print(f"Saved {e['trip_count']} linked trips → {e['path']} ({e['bytes']:,} B)")
+
+    by_path = {e["path"]: e for e in written}
+    for od, (count, bbox) in od_meta.items():
+        run.build_cache.record(od, count, [by_path[p] for p in od_files[od]], bbox=bbox)
+
+
+STAGE_FNS = {
+    "load": stage_load,
+    "tract_join": stage_tract_join,
+    "geometry": stage_geometry,
+    "assembly": stage_assembly,
+    "stats": stage_stats,
+    "export": stage_export,
+}
+
+# =========================
+# CHECKPOINTS (Parquet / Arrow, one folder per stage)
+# =========================
+def save_checkpoint(run, stage, out):
+    with run.checkpoints.write(stage, run.fingerprints[stage]) as (folder, meta):
+        if stage == "geometry":
+            save_legs(folder, out)
+            meta["rows"] = len(out)
+        elif stage == "assembly":
+            meta["rows"] = save_linked_trips(folder, out, run.trip_schema())
+            meta["ods"] = len(out)
+        elif stage == "stats":
+            meta["rows"] = save_table(folder, pd.DataFrame({
+                "origin": [od[0] for od in out],
+                "destination": [od[1] for od in out],
+                "doc": [json.dumps(doc) for doc in out.values()],
+            }))
+        else:
+            meta["rows"] = save_table(folder, out)
+
+
+def load_checkpoint(run, stage):
+    folder = run.checkpoints.folder(stage)
+    if stage == "geometry":
+        out = load_legs(folder)
+    elif stage == "assembly":
+        out = load_linked_trips(folder)
+    elif stage == "stats":
+        t = load_table(folder)
+        out = {(o, d): json.loads(doc) for o, d, doc in zip(t["origin"], t["destination"], t["doc"])}
+    else:
+        out = load_table(folder)
+    print(f"Checkpoint: {stage} reused ({run.checkpoints.meta(stage)['rows']:,} rows)")
+    return out
 
+# =========================
+# RUNNER
+# =========================
+def plan_stages(run, stages=None, start=None):
+    """
+    Stages to run, in order: `stages` as given, `start` and every later
+    stage, or (resume) export plus every stage whose checkpoint it needs
+    but cannot use
+    """
+    if stages:
+        return [s for s in run.stages if s in stages]
+    if start:
+        return list(run.stages[run.stages.index(start):])
+    plan = {"export"}
+    for stage in reversed(run.stages):
+        if stage in plan:
+            plan.update(n for n in run.needs(stage) if not run.valid(n))
+    return [s for s in run.stages if s in plan]
+
+
+def run_stages(run, plan, outputs=None):
+    outputs = dict(outputs or {})
+    for i, stage in enumerate(plan):
+        inputs = {}
+        for n in run.needs(stage):
+            if n not in outputs:
+                if not run.valid(n):
+                    raise SystemExit(
+                        f"Stage {stage!r} needs the {n!r} checkpoint, which is missing or "
+                        f"stale: run it too (e.g. --from {n})"
+                    )
+                with run.report.stage("checkpoint"):
+                    outputs[n] = load_checkpoint(run, n)
+                run.report.meta.setdefault("checkpoints_reused", []).append(n)
+            inputs[n] = outputs[n]
+
+        print(f"▶ Stage {stage}")
+        fn = stage_assembly_stream if run.cfg.stream and stage == "assembly" else STAGE_FNS[stage]
+        outputs[stage] = fn(run, inputs)
+        if stage in CHECKPOINTS:
+            with run.report.stage("checkpoint"):
+                save_checkpoint(run, stage, outputs[stage])
+        del inputs
+
+        # free what no later stage reads (stream mode: the on-disk ODs too)
+        later = {n for s in plan[i + 1:] for n in run.needs(s)}
+        for n in [n for n in outputs if n not in later]:
+            close = getattr(outputs.pop(n), "close", None)
+            if close:
+                close()
+
+
+def status(run):
+    lines = [f"{'stage':12s} {'checkpoint':12s} {'rows':>12s}  created"]
+    for stage in run.stages:
+        meta = run.checkpoints.meta(stage) if stage in CHECKPOINTS else None
+        state = "-" if stage not in CHECKPOINTS else (
+            "valid" if run.valid(stage) else "stale" if meta else "missing"
+        )
+        rows = f"{meta['rows']:,}" if meta else "-"
+        lines.append(f"{stage:12s} {state:12s} {rows:>12s}  {meta['created_at'] if meta else ''}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Jan complete-trip OD samples (staged, resumable)")
+    parser.add_argument("--config", default=CONFIG_PATH, help="JSON config (keys as in DEFAULTS)")
+    which = parser.add_mutually_exclusive_group()
+    which.add_argument("--stages", nargs="+", choices=STAGES, help="run only these stages; inputs from checkpoints")
+    which.add_argument("--from", dest="start", choices=STAGES, help="rerun this stage and every later one")
+    parser.add_argument("--list", action="store_true", help="print the checkpoint status and exit")
+    parser.add_argument("--profile", choices=PROFILERS, help="profile every stage (overrides the config)")
+    args = parser.parse_args(argv)
+
+    cfg = load_config(args.config)
+    if args.profile:
+        cfg.profile = args.profile
+    # --list: checkpoints as a forced run would see them (every requested OD)
+    run = Run(cfg, forced=bool(args.stages or args.start or args.list))
+
+    wrong = [s for s in args.stages or [args.start] if s and s not in run.stages]
+    if wrong:
+        parser.error(f"stream mode has no stage {wrong[0]!r} (stages: {', '.join(run.stages)})")
+    if args.list:
+        print(status(run))
+        return
+
+    if run.todo is not None and not run.todo and not (args.stages or args.start):
+        # every requested OD is cached: only the manifest / pack / index
+        plan, outputs = ["export"], {"assembly": ODPartitions({}, {}), "stats": {}}
     else:
-        stats = {
-            "schema": "nova.complete_trip.od_stats.v1",
-            "generated_at": datetime.utcnow().isoformat() + "Z",
-            "od": {"origin": ORIG, "destination": DEST},
-            "coverage": {"temporal": "year-2020", "spatial": "Salt Lake 6-county"},
-            "counts": {"linked_trips": 0},
-            "note": "No linked trips after distance + OD filter"
-        }
+        plan, outputs = plan_stages(run, args.stages, args.start), {}
+    print(f"Stages: {' → '.join(plan)}")
+    run_stages(run, plan, outputs)
+
+    run.report.meta.update({
+        "months": cfg.months, "stream": cfg.stream, "stages_run": plan,
+        "ods_requested": len(run.requested or []),
+    })
+    print(run.report.summary())
+    run.report.write(cfg.run_report)
+    print(f"✓ Run report written → {cfg.run_report}")
 
-    # 写 stats
-    stats_path = f"{OUTPUT_DIR}/{ORIG}_to_{DEST}.stats.json"
-    with open(stats_path, "w", encoding="utf-8") as f:
-        json.dump(stats, f, indent=2, allow_nan=False)
 
-    print(f"✓ Stats written → {stats_path}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# ============================================================
+# Out-of-core streaming for multi-month builds
+# - Deliveries read batch by batch, hash-partitioned on linked_trip_id
+#   into on-disk buckets (a linked trip never spans two buckets, even
+#   when it spans Parquet files or months)
+# - Buckets processed one at a time → peak memory ~ chunk size
+# - Per-OD linked trips + stats summaries merged across chunks on disk,
+#   read back one OD at a time by the stats / checkpoint / export stages
+# ============================================================
+
+import json
+import math
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from od_stats import concat_summaries
+
+# =========================
+# BUCKETING
+# =========================
+def bucket_of(linked_trip_ids, n_buckets):
+    """Stable bucket number of each linked_trip_id"""
+    h = pd.util.hash_array(np.asarray(linked_trip_ids, dtype=object))
+    return (h % np.uint64(n_buckets)).astype(np.int64)
+
+
+def spill_buckets(files, columns, spill_dir, chunk_rows, filter=None):
+    """
+    Stream `files` into hash buckets of about `chunk_rows` rows each.
+
+    Returns the bucket file paths. Only one record batch is held in
+    memory at a time.
+    """
+    dataset = ds.dataset(files, format="parquet")
+    total = dataset.count_rows(filter=filter)
+    n_buckets = max(1, math.ceil(total / chunk_rows))
+
+    os.makedirs(spill_dir, exist_ok=True)
+    paths = [os.path.join(spill_dir, f"bucket_{k:05d}.parquet") for k in range(n_buckets)]
+    writers = {}
+
+    try:
+        for batch in dataset.to_batches(columns=columns, filter=filter, batch_size=chunk_rows):
+            if batch.num_rows == 0:
+                continue
+            table = pa.Table.from_batches([batch])
+            buckets = bucket_of(
+                table.column("linked_trip_id").to_numpy(zero_copy_only=False), n_buckets
+            )
+            for k in np.unique(buckets):
+                part = table.filter(pa.array(buckets == k))
+                if k not in writers:
+                    writers[k] = pq.ParquetWriter(paths[k], part.schema)
+                writers[k].write_table(part)
+    finally:
+        for w in writers.values():
+            w.close()
+
+    print(f"Streaming: {total:,} rows → {len(writers)} buckets of ~{chunk_rows:,} rows")
+    return [paths[k] for k in sorted(writers)]
+
+
+def iter_chunks(bucket_paths, keep=False):
+    """Yield each bucket as a DataFrame (complete linked trips only)"""
+    for i, path in enumerate(bucket_paths):
+        df = pd.read_parquet(path)
+        print(f"Chunk {i + 1}/{len(bucket_paths)}: {len(df):,} rows")
+        yield df
+        if not keep:
+            os.remove(path)
+
+# =========================
+# PER-OD ACCUMULATOR
+# =========================
+class ODAccumulator(Mapping):
+    """
+    Merges per-OD results chunk by chunk.
+
+    Linked trips are appended as JSON lines to one spill file per OD
+    (with a small in-memory (weight, id, offset, length) index); stats
+    summaries are kept as per-trip scalar arrays. After `finish(ods)` it
+    reads as od → linked trips, one OD at a time from disk (as
+    od_partition.ODPartitions); `close()` once the export is done.
+    """
+
+    def __init__(self, spill_dir):
+        self.spill_dir = spill_dir
+        os.makedirs(spill_dir, exist_ok=True)
+        self._index = {}       # od → list of (weight, linked_trip_id, offset, length)
+        self._summary = {}     # od → list of summary dicts
+        self._ods = {}         # ODs of the finished result (ordered set)
+
+    def _path(self, od):
+        return os.path.join(self.spill_dir, f"{od[0]}_to_{od[1]}.jsonl")
+
+    def add(self, od, linked_trips, summary):
+        """Append one chunk's trips of `od` and their od_stats summary (same order)"""
+        index = self._index.setdefault(od, [])
+        self._summary.setdefault(od, [])
+        if not linked_trips:
+            return
+
+        with open(self._path(od), "ab") as f:
+            for lt in linked_trips:
+                line = (json.dumps(lt, allow_nan=False) + "\n").encode("utf-8")
+                index.append((lt["weight"], lt["linked_trip_id"], f.tell(), len(line)))
+                f.write(line)
+        self._summary[od].append(summary)
+
+    def ods(self):
+        """Every OD added so far"""
+        return list(self._index)
+
+    def finish(self, ods):
+        """The ODs of the result (requested ODs may have no trips)"""
+        self._ods = dict.fromkeys(ods)
+        return self
+
+    def __getitem__(self, od):
+        if od not in self._ods:
+            raise KeyError(od)
+        return self.trips(od)
+
+    def __iter__(self):
+        return iter(self._ods)
+
+    def __len__(self):
+        return len(self._ods)
+
+    def __contains__(self, od):
+        return od in self._ods
+
+    def count(self, od):
+        return len(self._index.get(od, []))
+
+    def _order(self, od):
+        """Positions of `od`'s trips heaviest first, ties by linked_trip_id (as in memory)"""
+        index = self._index.get(od, [])
+        return sorted(range(len(index)), key=lambda i: (-index[i][0], index[i][1]))
+
+    def trips(self, od):
+        """Linked trips of `od` in output order"""
+        index = self._index.get(od, [])
+        out = []
+        if not index:
+            return out
+        with open(self._path(od), "rb") as f:
+            for i in self._order(od):
+                _, _, offset, length = index[i]
+                f.seek(offset)
+                out.append(json.loads(f.read(length)))
+        return out
+
+    def summary(self, od):
+        """Merged stats summary of `od`, in the same order as `trips` (same float sums)"""
+        merged = concat_summaries(self._summary.get(od, []))
+        order = np.asarray(self._order(od), dtype=np.int64)
+        return {k: v[order] for k, v in merged.items()}
+
+    def close(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
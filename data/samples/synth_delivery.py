@@ -0,0 +1,368 @@
+# ============================================================
+# Synthetic Salt Lake delivery (deterministic, any scale)
+# - Parquet deliveries shaped like the real ones (USE_COLS + more)
+# - OD points sampled inside the real 2020 tract polygons, biased
+#   towards the airport / downtown / ski / U of U hub tracts
+# - multi-leg linked_trip_id chains (transfers between O and D)
+# - route_taken node sequences over a synthetic grid link network,
+#   written as the auto / walk / UTA link.csv files
+# - selected_linked_trips.csv for the v1 build_samples.py
+#
+# usage (from the repo root):
+#   python data/samples/synth_delivery.py --rows 1m --out data/cache/bench/1m
+# ============================================================
+
+import argparse
+import json
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+
+import geohash7
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACT_SOURCE = os.path.join(HERE, "..", "TDI", "TDI.shp")     # real 2020 tracts
+TRACT_SOURCE_COL = "GEOID20"
+COUNTY = "49035"                                              # Salt Lake County
+
+VERSION = 1                   # bump when the generated data changes
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+CHUNK_ROWS = 1_000_000        # legs per Parquet part
+V1_MAX_ROWS = 1_000_000       # legs copied into selected_linked_trips.csv
+
+HUBS = ["49035980000", "49035114000", "49035110106", "49035101402"]
+HUB_SHARE = 0.35
+
+# grid network over the county (~440 m spacing)
+GRID_LON0, GRID_LAT0, GRID_STEP = -112.27, 40.40, 0.004
+GRID_NX, GRID_NY = 182, 133
+
+MODES = np.array(["car", "bus", "rail", "walk/bike"])
+MODE_P = [0.55, 0.2, 0.1, 0.15]
+MODE_KMH = np.array([45.0, 20.0, 35.0, 6.0])
+PURPOSES = np.array(["work", "school", "shop", "social", "other"])
+STOPS = np.array([f"Stop {i:03d}" for i in range(120)])
+
+# paths below `out`, as the builders expect them under BASE_DIR
+DELIVERY_DIR = "Salt_Lake/delivery"
+NETWORK_DIR = "Salt_Lake/supplementInputs/network"
+TRACT_SHP = "Manuscript/Figure/Visualization-RL/2-OD patterns by census track/six_counties_track.shp"
+V1_CSV = "selected_linked_trips.csv"
+MANIFEST = "synth_manifest.json"
+
+# =========================
+# TRACTS / GRID
+# =========================
+def load_tracts():
+    t = gpd.read_file(TRACT_SOURCE).to_crs("EPSG:4326")
+    return t[[TRACT_SOURCE_COL, "geometry"]].rename(columns={TRACT_SOURCE_COL: "GEOID"})
+
+
+def node_id(ix, iy):
+    return 1_000_000_000 + np.asarray(ix, dtype=np.int64) * 1000 + np.asarray(iy, dtype=np.int64)
+
+
+def node_lonlat(ix, iy):
+    return GRID_LON0 + np.asarray(ix) * GRID_STEP, GRID_LAT0 + np.asarray(iy) * GRID_STEP
+
+
+def snap(lon, lat):
+    ix = np.clip(np.rint((lon - GRID_LON0) / GRID_STEP), 0, GRID_NX - 1).astype(np.int64)
+    iy = np.clip(np.rint((lat - GRID_LAT0) / GRID_STEP), 0, GRID_NY - 1).astype(np.int64)
+    return ix, iy
+
+
+def write_network(out):
+    """4-neighbour grid links (both directions), one mid-point bend each"""
+    ix, iy = np.meshgrid(np.arange(GRID_NX), np.arange(GRID_NY), indexing="ij")
+    ix, iy = ix.ravel(), iy.ravel()
+    frames = []
+    for dx, dy in ((1, 0), (0, 1), (-1, 0), (0, -1)):
+        jx, jy = ix + dx, iy + dy
+        ok = (jx >= 0) & (jx < GRID_NX) & (jy >= 0) & (jy < GRID_NY)
+        x0, y0 = node_lonlat(ix[ok], iy[ok])
+        x1, y1 = node_lonlat(jx[ok], jy[ok])
+        xm, ym = (x0 + x1) / 2, (y0 + y1) / 2 + 0.0003
+        wkt = shapely.to_wkt(
+            shapely.linestrings(np.stack([np.c_[x0, y0], np.c_[xm, ym], np.c_[x1, y1]], axis=1)),
+            rounding_precision=6, trim=True
+        )
+        frames.append(pd.DataFrame({"a": node_id(ix[ok], iy[ok]), "b": node_id(jx[ok], jy[ok]), "geometry": wkt}))
+    links = pd.concat(frames, ignore_index=True)
+
+    for sub, fc, tc in (
+        ("auto-biggest-connected-graph/link.csv", "from_osm_node_id", "to_osm_node_id"),
+        ("walk-biggest-connected-graph/link.csv", "from_osm_node_id", "to_osm_node_id"),
+        ("UTA/link with flow.csv", "from_node_id", "to_node_id"),
+    ):
+        path = os.path.join(out, NETWORK_DIR, sub)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        links.rename(columns={"a": fc, "b": tc}).to_csv(path, index=False)
+    return len(links)
+
+# =========================
+# POINTS
+# =========================
+def sample_points(rng, polys, which):
+    """One uniform point inside polys[which[i]] for every i (rejection sampling)"""
+    bounds = shapely.bounds(polys)[which]
+    lon = np.empty(len(which))
+    lat = np.empty(len(which))
+    todo = np.arange(len(which))
+    while len(todo):
+        b = bounds[todo]
+        x = rng.uniform(b[:, 0], b[:, 2])
+        y = rng.uniform(b[:, 1], b[:, 3])
+        inside = shapely.contains_xy(polys[which[todo]], x, y)
+        lon[todo[inside]], lat[todo[inside]] = x[inside], y[inside]
+        todo = todo[~inside]
+    return lon, lat
+
+
+def pick_tracts(rng, n, county_idx, hub_idx):
+    out = county_idx[rng.integers(0, len(county_idx), n)]
+    hub = rng.random(n) < HUB_SHARE
+    out[hub] = hub_idx[rng.integers(0, len(hub_idx), int(hub.sum()))]
+    return out
+
+
+def to_geohash(lon, lat):
+    ix = np.floor((lon + 180.0) / geohash7.GH_DLON).astype(np.int64)
+    iy = np.floor((lat + 90.0) / geohash7.GH_DLAT).astype(np.int64)
+    return geohash7.cells_to_geohash(ix, iy).astype(object)
+
+# =========================
+# LEGS
+# =========================
+def staircase(ix0, iy0, ix1, iy1):
+    """Node paths (x first, then y) → (flat ix, flat iy, per-leg offsets)"""
+    dx, dy = ix1 - ix0, iy1 - iy0
+    nx, ny = np.abs(dx), np.abs(dy)
+    n = nx + ny + 1
+    offsets = np.zeros(len(n) + 1, dtype=np.int64)
+    np.cumsum(n, out=offsets[1:])
+
+    leg = np.repeat(np.arange(len(n)), n)
+    step = np.arange(offsets[-1]) - offsets[leg]            # 0 .. n-1 within the leg
+    in_x = step <= nx[leg]
+    px = np.where(in_x, ix0[leg] + np.sign(dx)[leg] * step, ix1[leg])
+    py = np.where(in_x, iy0[leg], iy0[leg] + np.sign(dy)[leg] * (step - nx[leg]))
+    return px, py, offsets
+
+
+def _join(values, offsets, sep):
+    """Per-leg `sep`-joined strings of a flat string array (Arrow, no Python loop)"""
+    lists = pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), pa.array(values, pa.string()))
+    return pc.binary_join(lists, sep)
+
+
+def generate_chunk(rng, n_rows, first_trip, first_leg, month, polys, county_idx, hub_idx):
+    """
+    Legs of whole linked trips, about n_rows of them (the chain of
+    the last trip is cut at n_rows). Returns (delivery table, v1 frame).
+    """
+    n_trips = n_rows // 2 + 1
+    n_legs = rng.choice([1, 2, 3, 4], size=n_trips, p=[0.3, 0.4, 0.2, 0.1])
+    n_trips = int(np.searchsorted(np.cumsum(n_legs), n_rows)) + 1
+    n_legs = n_legs[:n_trips]
+    n_legs[-1] -= int(n_legs.sum()) - n_rows
+    trip = np.repeat(np.arange(n_trips), n_legs)
+    pos = np.arange(n_rows) - np.repeat(np.cumsum(n_legs) - n_legs, n_legs)
+
+    # trip O / D inside tracts; transfers spread along the way
+    o_lon, o_lat = sample_points(rng, polys, pick_tracts(rng, n_trips, county_idx, hub_idx))
+    d_lon, d_lat = sample_points(rng, polys, pick_tracts(rng, n_trips, county_idx, hub_idx))
+    frac0 = pos / n_legs[trip]
+    frac1 = (pos + 1) / n_legs[trip]
+    jitter = rng.normal(0, 0.006, (n_rows, 2))
+    first, last = pos == 0, pos + 1 == n_legs[trip]
+    a_lon = np.where(first, o_lon[trip], o_lon[trip] + frac0 * (d_lon - o_lon)[trip])
+    a_lat = np.where(first, o_lat[trip], o_lat[trip] + frac0 * (d_lat - o_lat)[trip])
+    b_lon = np.where(last, d_lon[trip], o_lon[trip] + frac1 * (d_lon - o_lon)[trip] + jitter[:, 0])
+    b_lat = np.where(last, d_lat[trip], o_lat[trip] + frac1 * (d_lat - o_lat)[trip] + jitter[:, 1])
+    # a transfer is where the previous leg ended
+    a_lon[~first] = b_lon[np.flatnonzero(~first) - 1]
+    a_lat[~first] = b_lat[np.flatnonzero(~first) - 1]
+
+    ix0, iy0 = snap(a_lon, a_lat)
+    ix1, iy1 = snap(b_lon, b_lat)
+    same = (ix0 == ix1) & (iy0 == iy1)
+    ix1[same] = np.where(ix0[same] + 1 < GRID_NX, ix0[same] + 1, ix0[same] - 1)
+    px, py, offsets = staircase(ix0, iy0, ix1, iy1)
+    route_taken = _join(pc.cast(pa.array(node_id(px, py)), pa.string()), offsets, ",")
+
+    # times: trip start anywhere in the month, legs back to back
+    mode = rng.choice(len(MODES), size=n_rows, p=MODE_P)
+    path_km = (np.diff(offsets) - 1) * GRID_STEP * 111.0 * 0.9
+    dur_min = np.maximum(path_km / MODE_KMH[mode] * 60.0 * rng.uniform(0.8, 1.6, n_rows), 1.0)
+    gap_min = np.where(first, 0.0, rng.uniform(2.0, 15.0, n_rows))
+    month_start = pd.Timestamp(f"2020-{month:02d}-01")
+    days = month_start.days_in_month
+    trip_start = rng.uniform(0, days * 86400 - 6 * 3600, n_trips)
+    elapsed = np.cumsum(dur_min + gap_min) - dur_min                 # within the chunk
+    elapsed -= np.repeat(elapsed[np.cumsum(n_legs) - n_legs], n_legs)
+    start_s = np.rint(trip_start[trip] + elapsed * 60.0).astype(np.int64)
+    end_s = start_s + np.rint(dur_min * 60.0).astype(np.int64)
+    base = np.datetime64(month_start.to_datetime64(), "s")
+
+    transit = (MODES[mode] == "bus") | (MODES[mode] == "rail")
+    access = rng.integers(0, len(STOPS), n_rows)
+    egress = rng.integers(0, len(STOPS), n_rows)
+    geohash_o, geohash_d = to_geohash(a_lon, a_lat), to_geohash(b_lon, b_lat)
+    geohash_o[rng.random(n_rows) < 0.002] = None                    # a few broken codes
+
+    trip_ids = first_trip + trip
+    linked_ids = np.char.add("L", np.char.zfill(trip_ids.astype(str), 9)).astype(object)
+    weight = rng.gamma(2.0, 6.0, n_trips)[trip]
+    table = pa.table({
+        "linked_trip_id": pa.array(linked_ids, pa.string()),
+        "trip_id": pa.array(first_leg + np.arange(n_rows), pa.int64()),
+        "tour_id": pa.array(trip_ids // 2, pa.int64()),
+        "travel_mode": pa.array(MODES[mode], pa.string()),
+        "local_datetime_start": pa.array(base + start_s.astype("timedelta64[s]"), pa.timestamp("us")),
+        "local_datetime_end": pa.array(base + end_s.astype("timedelta64[s]"), pa.timestamp("us")),
+        "network_distance": pa.array(path_km * rng.uniform(1.0, 1.2, n_rows)),
+        "route_distance": pa.array(path_km),
+        "geohash7_orig": pa.array(geohash_o, pa.string()),
+        "geohash7_dest": pa.array(geohash_d, pa.string()),
+        "access_stop": pa.array(np.where(transit, STOPS[access], None), pa.string()),
+        "access_stop_id": pa.array(np.where(transit, access + 1000.0, np.nan)),
+        "egress_stop": pa.array(np.where(transit, STOPS[egress], None), pa.string()),
+        "egress_stop_id": pa.array(np.where(transit, egress + 1000.0, np.nan)),
+        "trip_purpose": pa.array(PURPOSES[rng.integers(0, len(PURPOSES), n_trips)][trip], pa.string()),
+        "trip_weight": pa.array(weight),
+        "route_taken": route_taken,
+    })
+
+    lon, lat = node_lonlat(px, py)
+    coords = pc.binary_join_element_wise(
+        pc.cast(pa.array(np.round(lon, 6)), pa.string()), pc.cast(pa.array(np.round(lat, 6)), pa.string()), " "
+    )
+    wkt = pc.binary_join_element_wise("LINESTRING (", _join(coords, offsets, ", "), ")", "")
+    v1 = pd.DataFrame({
+        "trip_id": table["trip_id"].to_numpy(),
+        "linked_trip_id": linked_ids,
+        "tour_id": trip_ids // 2,
+        "travel_mode": MODES[mode],
+        "local_datetime_start": table["local_datetime_start"].to_pandas(),
+        "local_datetime_end": table["local_datetime_end"].to_pandas(),
+        "full_geometry_wkt": wkt.to_numpy(zero_copy_only=False),
+        "network_distance": table["network_distance"].to_numpy(),
+        "route_distance": path_km,
+        "orig_lon": a_lon.round(6), "orig_lat": a_lat.round(6), "geohash7_orig": geohash_o,
+        "dest_lon": b_lon.round(6), "dest_lat": b_lat.round(6), "geohash7_dest": geohash_d,
+        "access_stop_id": table["access_stop_id"].to_numpy(zero_copy_only=False),
+        "access_stop": table["access_stop"].to_numpy(zero_copy_only=False),
+        "egress_stop_id": table["egress_stop_id"].to_numpy(zero_copy_only=False),
+        "egress_stop": table["egress_stop"].to_numpy(zero_copy_only=False),
+        "trip_purpose": table["trip_purpose"].to_numpy(zero_copy_only=False),
+        "trip_weight": weight,
+        "trip_count": n_legs[trip],
+    })
+    return table, v1, n_trips
+
+# =========================
+# DELIVERY
+# =========================
+def parse_rows(value):
+    value = str(value).lower()
+    return SCALES[value] if value in SCALES else int(float(value))
+
+
+def generate(out, rows, seed=7, months=("Jan",)):
+    """
+    Write a synthetic delivery under `out` (BASE_DIR layout); returns
+    its manifest. Same (rows, seed, months) → same files.
+    """
+    tracts = load_tracts()
+    shp = os.path.join(out, TRACT_SHP)
+    os.makedirs(os.path.dirname(shp), exist_ok=True)
+    tracts.to_file(shp)
+
+    polys = tracts.geometry.to_numpy()
+    county_idx = np.flatnonzero(tracts["GEOID"].str.startswith(COUNTY).to_numpy())
+    hub_idx = np.flatnonzero(tracts["GEOID"].isin(HUBS).to_numpy())
+    n_links = write_network(out)
+
+    month_nums = [pd.Timestamp(f"2020-{m}-01").month for m in months]
+    per_month = np.diff(np.linspace(0, rows, len(months) + 1).astype(np.int64))
+    seeds = np.random.SeedSequence(seed)
+
+    n_trips = 0
+    n_legs = 0
+    v1_rows = 0
+    v1_path = os.path.join(out, V1_CSV)
+    if os.path.exists(v1_path):
+        os.remove(v1_path)
+
+    for name, num, month_rows in zip(months, month_nums, per_month.tolist()):
+        folder = os.path.join(out, DELIVERY_DIR, f"Salt_Lake-{name}-2020")
+        os.makedirs(folder, exist_ok=True)
+        for f in os.listdir(folder):
+            os.remove(os.path.join(folder, f))
+        for part, start in enumerate(range(0, month_rows, CHUNK_ROWS)):
+            chunk = min(CHUNK_ROWS, month_rows - start)
+            rng = np.random.default_rng(seeds.spawn(1)[0])
+            table, v1, trips = generate_chunk(
+                rng, chunk, n_trips, n_legs, num, polys, county_idx, hub_idx
+            )
+            pq.write_table(table, os.path.join(folder, f"part-{part:04d}.snappy.parquet"), compression="snappy")
+
+            if v1_rows < V1_MAX_ROWS:
+                v1 = v1.iloc[:V1_MAX_ROWS - v1_rows]
+                v1.to_csv(v1_path, mode="a", header=v1_rows == 0, index=False)
+                v1_rows += len(v1)
+            n_trips += trips
+            n_legs += chunk
+            print(f"  {name} part {part}: {chunk:,} legs")
+
+    manifest = {
+        "schema": "nova.synthetic_delivery.v1",
+        "version": VERSION,
+        "seed": seed,
+        "months": list(months),
+        "rows": n_legs,
+        "linked_trips": n_trips,
+        "v1_rows": v1_rows,
+        "links": n_links,
+        "tracts": len(tracts),
+    }
+    with open(os.path.join(out, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def ensure(out, rows, seed=7, months=("Jan",)):
+    """Reuse `out` when its manifest matches, generate otherwise"""
+    try:
+        with open(os.path.join(out, MANIFEST), encoding="utf-8") as f:
+            m = json.load(f)
+        if (m.get("version"), m.get("rows"), m.get("seed"), m.get("months")) == (VERSION, rows, seed, list(months)):
+            return m
+    except (OSError, ValueError):
+        pass
+    return generate(out, rows, seed, months)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Deterministic synthetic Salt Lake delivery")
+    p.add_argument("--rows", default="10k", help="legs: 10k / 1m / 10m or a number")
+    p.add_argument("--out", required=True, help="BASE_DIR-style output folder")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--months", nargs="+", default=["Jan"])
+    args = p.parse_args(argv)
+
+    m = generate(args.out, parse_rows(args.rows), args.seed, args.months)
+    print(f"✓ {m['rows']:,} legs / {m['linked_trips']:,} linked trips → {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# ============================================================
+# Persistent geohash7 → tract lookup index
+# - Sorted uint64 geohash7 codes + int32 tract slots (.npy, mmap)
+# - Keyed on the tract file hash (new tracts → new index)
+# - Grows incrementally: only unseen geohashes are point-in-polygon tested
+# ============================================================
+
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import shapely
+
+import geohash7
+
+INDEX_VERSION = 1
+NO_TRACT = -1
+
+# =========================
+# TRACT FILE HASH
+# =========================
+def tract_file_hash(path):
+    """sha256 of a tract file (plus its shapefile sidecars)"""
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        parts = sorted(
+            p for p in glob.glob(stem + ".*")
+            if os.path.splitext(p)[1].lower() in (".shp", ".shx", ".dbf", ".prj", ".cpg")
+        )
+    else:
+        parts = [path]
+
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(os.path.basename(p).lower().encode())
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+# =========================
+# INDEX
+# =========================
+class TractIndex:
+    """
+    geohash7 → tract GEOID lookup backed by sorted arrays on disk.
+
+    Lookups are a binary search (np.searchsorted) over memory-mapped
+    codes; codes not in the index yet are joined against the tracts
+    once and merged in, so later runs never repeat that work.
+    """
+
+    def __init__(self, root, tract_path, geoid_col, tract_hash, tracts=None):
+        self.root = root
+        self.tract_path = tract_path
+        self.geoid_col = geoid_col
+        self.tract_hash = tract_hash
+        self._tracts = tracts
+        self._tree = None
+
+        self.generation = 0
+        self.geoids = []
+        self.codes = np.empty(0, dtype=np.uint64)
+        self.slots = np.empty(0, dtype=np.int32)
+        self._load()
+
+    @classmethod
+    def open(cls, tract_path, cache_dir, geoid_col="GEOID", tracts=None):
+        """Open (or create) the index for `tract_path` under `cache_dir`"""
+        tract_hash = tract_file_hash(tract_path)
+        root = os.path.join(
+            cache_dir, f"geohash7_tract_v{INDEX_VERSION}_{geoid_col}_{tract_hash[:16]}"
+        )
+        os.makedirs(root, exist_ok=True)
+        return cls(root, tract_path, geoid_col, tract_hash, tracts=tracts)
+
+    # -------------------------
+    # storage
+    # -------------------------
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def _load(self):
+        if not os.path.exists(self._meta_path()):
+            return
+        with open(self._meta_path(), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION or meta.get("tract_hash") != self.tract_hash:
+            return
+
+        self.generation = meta["generation"]
+        self.geoids = meta["geoids"]
+        self.codes = np.load(os.path.join(self.root, meta["codes"]), mmap_mode="r")
+        self.slots = np.load(os.path.join(self.root, meta["slots"]), mmap_mode="r")
+
+    def _save(self, codes, slots):
+        gen = self.generation + 1
+        codes_name = f"codes_{gen}.npy"
+        slots_name = f"slots_{gen}.npy"
+        np.save(os.path.join(self.root, codes_name), codes)
+        np.save(os.path.join(self.root, slots_name), slots)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "tract_file": os.path.basename(self.tract_path),
+            "tract_hash": self.tract_hash,
+            "geoid_col": self.geoid_col,
+            "generation": gen,
+            "count": int(len(codes)),
+            "codes": codes_name,
+            "slots": slots_name,
+            "geoids": self.geoids
+        }
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self._meta_path())
+
+        old = self.generation
+        self.generation = gen
+        self.codes = np.load(os.path.join(self.root, codes_name), mmap_mode="r")
+        self.slots = np.load(os.path.join(self.root, slots_name), mmap_mode="r")
+
+        # previous generation may still be mapped elsewhere (Windows)
+        for name in (f"codes_{old}.npy", f"slots_{old}.npy"):
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+
+    # -------------------------
+    # tract geometry (only for unseen codes)
+    # -------------------------
+    def _tract_tree(self):
+        if self._tree is None:
+            if self._tracts is None:
+                import geopandas as gpd
+                self._tracts = gpd.read_file(self.tract_path).to_crs("EPSG:4326")
+
+            tract_ids = self._tracts[self.geoid_col].astype(str).tolist()
+            if not self.geoids:
+                self.geoids = sorted(set(tract_ids))
+            slot_of = {g: i for i, g in enumerate(self.geoids)}
+            self._tree_slots = np.array(
+                [slot_of.get(g, NO_TRACT) for g in tract_ids], dtype=np.int32
+            )
+            self._tree = shapely.STRtree(np.asarray(self._tracts.geometry.values))
+        return self._tree
+
+    def _join(self, codes):
+        """Point-in-tract for new codes (same rule as sjoin 'within')"""
+        tree = self._tract_tree()
+        lat, lon = geohash7.decode_codes(codes)
+        points = shapely.points(lon, lat)
+
+        pt_idx, tract_idx = tree.query(points, predicate="within")
+        slots = np.full(len(codes), NO_TRACT, dtype=np.int32)
+        # first match wins where tracts overlap
+        slots[pt_idx[::-1]] = self._tree_slots[tract_idx[::-1]]
+        return slots
+
+    def _extend(self, new_codes):
+        new_slots = self._join(new_codes)
+        codes = np.concatenate([np.asarray(self.codes), new_codes])
+        slots = np.concatenate([np.asarray(self.slots), new_slots])
+        order = np.argsort(codes, kind="stable")
+        self._save(codes[order], slots[order])
+        print(f"Tract index: +{len(new_codes)} geohash7 codes → {len(codes)} total")
+
+    # -------------------------
+    # lookup
+    # -------------------------
+    def _find(self, codes):
+        pos = np.searchsorted(self.codes, codes)
+        pos = np.minimum(pos, max(len(self.codes) - 1, 0))
+        found = (
+            (self.codes[pos] == codes) if len(self.codes)
+            else np.zeros(len(codes), dtype=bool)
+        )
+        return pos, found
+
+    def lookup_codes(self, codes):
+        """uint64 geohash7 codes → int32 tract slots (NO_TRACT if none)"""
+        codes = np.asarray(codes, dtype=np.uint64)
+        valid = codes != geohash7.INVALID
+
+        _, found = self._find(codes)
+        missing = np.unique(codes[valid & ~found])
+        if len(missing):
+            self._extend(missing)
+
+        pos, found = self._find(codes)
+        slots = np.full(len(codes), NO_TRACT, dtype=np.int32)
+        hit = valid & found
+        slots[hit] = self.slots[pos[hit]]
+        return slots
+
+    def geoid_of(self, slots):
+        """int32 tract slots → GEOID strings (None for NO_TRACT)"""
+        table = np.array(self.geoids + [None], dtype=object)
+        return table[np.asarray(slots)]    # NO_TRACT (-1) → trailing None
+
+    def lookup(self, geohashes):
+        """geohash7 strings (or uint64 codes) → GEOID strings (None outside all tracts)"""
+        return self.geoid_of(self.lookup_codes(geohash7.as_codes(geohashes)))
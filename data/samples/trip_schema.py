@@ -0,0 +1,183 @@
+# ============================================================
+# Memory-lean dtypes for trip (leg) tables, applied at load
+# - Low-cardinality strings (mode, purpose, stop names, linked trip
+#   ids) → categoricals (integer codes + one copy of each value)
+# - geohash7 → uint64 codes (geohash7.to_codes; INVALID for missing)
+# - Timestamps parsed once; integers downcast to the smallest type
+#   that holds them, floats to float32 only where that is lossless
+# - route_taken node lists → varint-coded node deltas (route_codec),
+#   one Arrow binary value per leg
+# - Remaining object strings → Arrow strings
+# - Per-column bytes before / after (memory_report)
+# ============================================================
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import geohash7
+from route_codec import encode_nodes, tokenize_arrow
+
+SCHEMA_VERSION = 2
+
+CATEGORICAL = ("travel_mode", "trip_purpose", "access_stop", "egress_stop", "linked_trip_id")
+GEOHASH = ("geohash7_orig", "geohash7_dest")
+DATETIME = ("local_datetime_start", "local_datetime_end")
+ROUTE = ("route_taken",)
+ROUTE_CHUNK = 1 << 16          # legs encoded at a time
+
+# =========================
+# MEMORY
+# =========================
+def memory_report(before, after, rows):
+    """Per-column bytes per row before / after (summed byte dicts over `rows` rows)"""
+    rows = max(int(rows), 1)
+    cols = {
+        c: {"before": round(before[c] / rows, 1), "after": round(after.get(c, 0) / rows, 1)}
+        for c in before
+    }
+    b, a = sum(before.values()) / rows, sum(after.values()) / rows
+    return {
+        "rows": rows,
+        "bytes_per_row": {"before": round(b, 1), "after": round(a, 1)},
+        "ratio": round(b / a, 2) if a else None,
+        "columns": cols,
+    }
+
+
+def format_memory(rep):
+    lines = [f"{'column':22s} {'B/row before':>13s} {'after':>9s}"]
+    for c, v in rep["columns"].items():
+        lines.append(f"{c:22s} {v['before']:13.1f} {v['after']:9.1f}")
+    t = rep["bytes_per_row"]
+    lines.append(f"{'total':22s} {t['before']:13.1f} {t['after']:9.1f}   ({rep['ratio']}x)")
+    return "\n".join(lines)
+
+
+def release_arrow_memory():
+    """Hand freed Arrow buffers (the table just converted) back to the OS"""
+    pool = pa.default_memory_pool()
+    if hasattr(pool, "release_unused"):     # pyarrow >= 9
+        pool.release_unused()
+
+# =========================
+# DTYPES
+# =========================
+def _is_string(s):
+    return s.dtype == object or pd.api.types.is_string_dtype(s.dtype)
+
+
+def _downcast_float(s):
+    x = s.to_numpy(dtype=np.float64)
+    y = x.astype(np.float32)
+    same = (y.astype(np.float64) == x) | (np.isnan(x) & np.isnan(y))
+    return pd.Series(y, index=s.index) if same.all() else s
+
+
+def _arrow_s8(arr):
+    """
+    Arrow strings → fixed-width S8, straight from the offsets / data
+    buffers (no Python str per value); same bytes as geohash7's S8 cast
+    (8th byte set ⇔ longer than 7, nulls → b"")
+    """
+    arr = arr.combine_chunks() if isinstance(arr, pa.ChunkedArray) else arr
+    n = len(arr)
+    width = np.int32
+    _, off_buf, data_buf = arr.buffers()
+    offsets = np.frombuffer(off_buf, dtype=width)[arr.offset:arr.offset + n + 1].astype(np.int64)
+    data = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.zeros(1, np.uint8)
+
+    lens = np.diff(offsets)
+    if arr.null_count:
+        lens[arr.is_null().to_numpy(zero_copy_only=False)] = 0
+    out = np.zeros((n, 8), dtype=np.uint8)
+    for j in range(8):
+        sel = lens > j
+        out[sel, j] = data[offsets[:-1][sel] + j]
+    return out.view("S8").ravel()
+
+
+def _arrow_category(arr, index):
+    """Arrow strings → pandas categorical via Arrow's dictionary encoding (sorted categories, as astype)"""
+    enc = (arr.combine_chunks() if isinstance(arr, pa.ChunkedArray) else arr).dictionary_encode()
+    order = pc.array_sort_indices(enc.dictionary).to_numpy()
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    codes = pc.fill_null(enc.indices, -1).to_numpy().astype(np.int32)
+    codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1)
+    cats = pd.Index(enc.dictionary.take(pa.array(order)).to_pandas())
+    return pd.Series(pd.Categorical.from_codes(codes, categories=cats), index=index)
+
+
+def _routes(s, arrow=None):
+    """route_taken strings → encoded node column (route_codec.decode_nodes reads it)"""
+    if arrow is None:
+        arrow = pa.array(s.to_numpy(dtype=object, na_value=None), type=pa.string())
+    # slice by slice: the token / varint temporaries stay small
+    enc = pa.chunked_array([
+        encode_nodes(*tokenize_arrow(arrow.slice(i, ROUTE_CHUNK)))
+        for i in range(0, len(arrow), ROUTE_CHUNK)
+    ], type=pa.binary())
+    return pd.Series(pd.arrays.ArrowExtensionArray(enc), index=s.index)
+
+
+def lean_column(name, s, arrow=None):
+    if name in ROUTE and _is_string(s):
+        return _routes(s, arrow)
+    if arrow is not None and pa.types.is_string(arrow.type):
+        if name in GEOHASH:
+            return pd.Series(geohash7.to_codes(_arrow_s8(arrow)), index=s.index)
+        if name in CATEGORICAL:
+            return _arrow_category(arrow, s.index)
+    if name in GEOHASH and _is_string(s):
+        return pd.Series(geohash7.to_codes(s.to_numpy(dtype=object)), index=s.index)
+    if name in DATETIME and not pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return pd.to_datetime(s, errors="coerce")
+    if name in CATEGORICAL and _is_string(s):
+        return s.astype("category")
+    if pd.api.types.is_integer_dtype(s.dtype):
+        return pd.to_numeric(s, downcast="integer")
+    if pd.api.types.is_float_dtype(s.dtype):
+        return _downcast_float(s)
+    if s.dtype == object:
+        return s.astype("string[pyarrow]")
+    return s
+
+
+def lean_trips(data, memory=None):
+    """
+    Trip table (DataFrame, or Arrow table converted one column at a time
+    so the default-dtype frame never exists) → DataFrame with lean
+    dtypes; values unchanged, except invalid geohash7 strings → INVALID
+    and route_taken → encoded node lists (route_assembly reads both).
+    `memory` (dict) gets the summed before / after column bytes and
+    rows, for memory_report.
+    """
+    arrow = isinstance(data, pa.Table)
+    if arrow:
+        columns = ((c, data.column(c).to_pandas()) for c in data.column_names)
+        index = None
+    else:
+        columns = ((c, data[c]) for c in data.columns)
+        index = data.index
+
+    out = {}
+    before, after = {}, {}
+    for c, s in columns:
+        if memory is not None:
+            before[c] = int(s.memory_usage(index=False, deep=True))
+        out[c] = lean_column(c, s, data.column(c) if arrow else None)
+        if memory is not None:
+            after[c] = int(out[c].memory_usage(index=False, deep=True))
+        del s
+    df = pd.DataFrame(out, index=index, copy=False)
+
+    if memory is not None:
+        for key, part in (("before", before), ("after", after)):
+            acc = memory.setdefault(key, {})
+            for c, b in part.items():
+                acc[c] = acc.get(c, 0) + b
+        memory["rows"] = memory.get("rows", 0) + len(df)
+    return df
+